@@ -2,6 +2,8 @@ let lastPickedColor = null;
 let connected = false;
 let player = 1;
 let selectedColor = null;
+// Last state received from the server: { seq, pegs, thaler, phase }
+let boardState = null;
 
 // Generate a unique player ID (e.g., using localStorage to persist across sessions)
 let playerId = localStorage.getItem("playerId");
@@ -10,7 +12,101 @@ if (!playerId) {
     localStorage.setItem("playerId", playerId);
 }
 
-const ws = new WebSocket(`ws://${window.location.hostname}:8765`);
+// Room we were placed in; the server may redirect us to the worker that owns it
+let roomId = sessionStorage.getItem("roomId");
+let ws = null;
+// Resume token from hello_okay: reconnecting with it gets our seat back
+let token = sessionStorage.getItem("token");
+let resuming = false;
+
+// Wire format asked for in hello/reconnect, and whether the server agreed.
+// Binary game frames are laid out in server/wire.py.
+const WIRE_FORMAT = "binary";
+let binary = false;
+
+const WIRE_STATE = 0x01;
+const WIRE_MOVES = 0x02;
+const WIRE_ACTIONS = {
+    make_player_choice: 0x10,
+    make_player_move: 0x11,
+    make_player_guess: 0x12,
+    request_moves: 0x13,
+    request_snapshot: 0x14,
+    place_thaler: 0x15,
+};
+// Color.value order, and WhichPhase order
+const COLOR_KEYS = ["R", "O", "Y", "G", "B", "P", "U"];
+const PHASES = ["Waiting for start", "Selecting", "Placing thaler", "P1 Turn", "P2 Turn", "Game ended"];
+
+function openSocket(port, firstMessage) {
+    const socket = ws = new WebSocket(`ws://${window.location.hostname}:${port}`);
+    ws.binaryType = "arraybuffer";
+    ws.onopen = (event) => {
+        connected = true;
+        resuming = firstMessage[0] == "reconnect";
+        socket.send(JSON.stringify(firstMessage));
+    };
+    ws.onmessage = handleMessage;
+    ws.onclose = (event) => {
+        // Dropped mid-game: take our seat back, asking only for what we missed
+        if (connected && socket === ws && token) {
+            connected = false;
+            setTimeout(() => openSocket(port, reconnectMessage()), 1000);
+        }
+    };
+}
+
+function reconnectMessage() {
+    return ["reconnect", { token, room: roomId, seq: boardState ? boardState.seq : null, format: WIRE_FORMAT }];
+}
+
+// Send a game action in whichever format the server agreed to
+function sendAction(action, args) {
+    if (!binary) {
+        ws.send(JSON.stringify([action, { ...args, playerId }]));
+        return;
+    }
+    const frame = [WIRE_ACTIONS[action]];
+    if (args.color !== undefined) {
+        frame.push(COLOR_KEYS.indexOf(args.color));
+    }
+    if (args.dst !== undefined) {
+        frame.push(args.dst);
+    }
+    ws.send(new Uint8Array(frame));
+}
+
+function handleFrame(buffer) {
+    const view = new DataView(buffer);
+    switch (view.getUint8(0)) {
+        case WIRE_STATE: {
+            // The whole board, so it is applied whatever seq we had
+            const pegs = {};
+            COLOR_KEYS.forEach((color, i) => { pegs[color] = view.getUint8(6 + i); });
+            boardState = {
+                seq: view.getUint32(1, true),
+                pegs,
+                thaler: view.getUint8(5),
+                phase: PHASES[view.getUint8(13)],
+            };
+            populateBoard(boardState.pegs, boardState.thaler);
+            break;
+        }
+        case WIRE_MOVES: {
+            // 49-bit bitboard as two little-endian 32-bit halves
+            const low = view.getUint32(1, true);
+            const high = view.getUint32(5, true);
+            const moves = [];
+            for (let i = 0; i < 49; i++) {
+                if ((i < 32 ? low >>> i : high >>> (i - 32)) & 1) {
+                    moves.push(i);
+                }
+            }
+            highlightSuggestedBoard(moves);
+            break;
+        }
+    }
+}
 
 function generateBoard() {
     const board = document.getElementById('board');
@@ -21,8 +117,15 @@ function generateBoard() {
         cell.dataset.index = i;
         cell.dataset.piece = "";
         cell.addEventListener("click", (evt) => {
+            // Player 2 puts the thaler on any free cell before the first turn
+            if (boardState && boardState.phase == "Placing thaler") {
+                if (connected && !cell.dataset.piece) {
+                    sendAction("place_thaler", { dst: i });
+                }
+                return;
+            }
             if (lastPickedColor && connected && !cell.dataset.piece) {
-                ws.send(JSON.stringify(["make_player_move", { color: lastPickedColor, dst: i, playerId }]));
+                sendAction("make_player_move", { color: lastPickedColor, dst: i });
                 removeBoardHighlights();
                 return;
             }
@@ -30,7 +133,7 @@ function generateBoard() {
                 return;
             }
             lastPickedColor = cell.dataset.piece;
-            ws.send(JSON.stringify(["request_moves", { color: lastPickedColor, playerId }]));
+            sendAction("request_moves", { color: lastPickedColor });
         });
         board.appendChild(cell);
     }
@@ -71,6 +174,35 @@ function populateBoard(pegs, thaler) {
     }
 }
 
+function applySnapshot(data) {
+    boardState = {
+        seq: data.seq,
+        pegs: { ...data.pegs },
+        thaler: data.thaler_pos.int_repr,
+        phase: data.current_phase,
+    };
+    populateBoard(boardState.pegs, boardState.thaler);
+}
+
+function applyPatch(patch) {
+    if (!boardState || patch.seq !== boardState.seq + 1) {
+        // Missed a frame (or never had a snapshot): ask for the full state
+        sendAction("request_snapshot", {});
+        return;
+    }
+    boardState.seq = patch.seq;
+    if (patch.pegs) {
+        Object.assign(boardState.pegs, patch.pegs);
+    }
+    if (patch.thaler_pos !== undefined) {
+        boardState.thaler = patch.thaler_pos;
+    }
+    if (patch.current_phase !== undefined) {
+        boardState.phase = patch.current_phase;
+    }
+    populateBoard(boardState.pegs, boardState.thaler);
+}
+
 function removeBoardHighlights() {
     for (const cell of document.getElementById('board').children) {
         cell.classList.remove("highlighted");
@@ -87,34 +219,61 @@ function highlightSuggestedBoard(highlighted) {
     });
 }
 
-ws.onopen = (event) => {
-    connected = true;
-    // Send a reconnect message with the player ID
-    ws.send(JSON.stringify(["reconnect", { playerId }]));
-};
-
-ws.onmessage = (event) => {
+function handleMessage(event) {
+    if (event.data instanceof ArrayBuffer) {
+        handleFrame(event.data);
+        return;
+    }
     const data = JSON.parse(event.data);
     console.log(data);
 
+    if (data[0] == "redirect") {
+        roomId = data[1].room;
+        connected = false;
+        ws.close();
+        openSocket(
+            data[1].port,
+            resuming ? reconnectMessage() : ["hello", { room: roomId, player, playerId, format: WIRE_FORMAT }]
+        );
+        return;
+    }
+
     if (data[0] == "error") {
         console.log("error", data[1]);
     }
 
+    if (data[0] == "try_again" && resuming) {
+        // The seat is gone: start over
+        resuming = false;
+        token = null;
+        sessionStorage.removeItem("token");
+        ws.send(JSON.stringify(["hello", { room: roomId, player, playerId, format: WIRE_FORMAT }]));
+        return;
+    }
+
     if (data[0] == "try_again") {
         player += 1;
         if (player > 2) {
             console.log("room full :(");
             return;
         }
-        ws.send(JSON.stringify(["hello", { player, playerId }]));
+        ws.send(JSON.stringify(["hello", { room: roomId, player, playerId, format: WIRE_FORMAT }]));
     }
 
     if (data.__magic__ == "game_state") {
-        populateBoard(data.pegs, data.thaler_pos.int_repr);
+        applySnapshot(data);
+    }
+
+    if (data[0] == "game_state_patch") {
+        applyPatch(data[1]);
     }
 
     if (data[0] == "hello_okay") {
+        roomId = data[1].room;
+        token = data[1].token;
+        sessionStorage.setItem("roomId", roomId);
+        sessionStorage.setItem("token", token);
+        binary = data[1].format === "binary";
         if (data[1].you_are === 1) {
             document.getElementById("player-label").innerText = "Player 1";
         } else {
@@ -131,17 +290,56 @@ ws.onmessage = (event) => {
         highlightSuggestedBoard(data[1].moves);
     }
 
+    if (data[0] == "hint") {
+        const best = data[1].best;
+        // Stale once the board has moved on; it can arrive just before the
+        // state frame it is for
+        if (best && boardState && data[1].seq >= boardState.seq) {
+            lastPickedColor = best.color;
+            highlightSuggestedBoard([best.dst]);
+            document.getElementById("subtitle").innerText =
+                `Try moving ${colors[best.color]} (score ${formatScore(best.score)})`;
+        }
+    }
+
+    if (data[0] == "move_rating") {
+        const rating = data[1];
+        const best = rating.best;
+        // No best when the position had no moves to search
+        document.getElementById("subtitle").innerText =
+            `Your move scored ${formatScore(rating.score)}` +
+            (best ? `; the best was ${colors[best.color]} to ${best.dst} (${formatScore(best.score)})` : "");
+    }
+
+    if (data[0] == "hint_failed") {
+        document.getElementById("subtitle").innerText = `No hint: ${data[1]}`;
+    }
+
     if (data[0] == "reconnect_success") {
-        // Restore game state after reconnecting
-        populateBoard(data[1].pegs, data[1].thaler);
-        document.getElementById("subtitle").innerText = data[1].subtitle || "Reconnected!";
-        selectedColor = data[1].selectedColor || null;
+        resuming = false;
+        binary = data[1].format === "binary";
+        player = data[1].you_are;
+        // The frames we missed, or a snapshot, follow
+        document.getElementById("subtitle").innerText = "Reconnected!";
     }
-};
+}
+
+// Resume the seat this tab had, if any
+openSocket(8765, token ? reconnectMessage() : ["hello", { player, playerId, format: WIRE_FORMAT }]);
+
+// A hint's score, which is null for a move the search didn't reach
+function formatScore(score) {
+    return typeof score === "number" ? score.toFixed(2) : "?";
+}
+
+// Hints are always JSON: there is no binary opcode for them
+function requestHint(rate) {
+    ws.send(JSON.stringify(["request_hint", { rate, playerId }]));
+}
 
 function chooseColor(color) {
     if (selectedColor) return alert("You've already picked a color!");
     selectedColor = color;
     document.getElementById("subtitle").innerText = "Waiting for other player...";
-    ws.send(JSON.stringify(["make_player_choice", { player, color, playerId }]));
+    sendAction("make_player_choice", { player, color });
 }
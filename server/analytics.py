@@ -0,0 +1,204 @@
+"""Statistics over archived games, streamed from `records` files.
+
+    python analytics.py PATH... [--workers N] [--state analytics.json] [--verify]
+
+PATH is an archive or a data directory, searched for `games*.bin`. Reports
+how often player 1 wins, how often a guess at the opponent's colour is
+right, and each player's win rate by how far their own peg started from the
+thaler.
+
+Each file is read a block at a time and its games tallied into fixed-size
+counters as they stream past, so memory doesn't grow with the archive. Files
+are tallied in a process pool, one file per task. The server writes one
+archive per worker. A game's result is read off its last action, since that
+action ended it, and its starting cells are found by dealing its seed again
+(with the thaler where player 2 put it, in games that start by placing it).
+That is much faster than replaying every move. `--verify` also replays each
+game through `GameState` and checks that the two agree.
+
+With `--state`, each file's tallies and how far it was read are kept between
+runs. Archives are only appended to, so a re-run reads only the games added
+since. A file that has shrunk was replaced, so it is read again from the start.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from multiprocessing import Pool
+from pathlib import Path
+
+import game
+from records import (
+    FIXED,
+    FORFEIT,
+    GUESS,
+    HEADER,
+    N_DIRECTIONS,
+    NO_COLOR,
+    PLACE,
+    GameRecord,
+    read_bodies,
+    record_size,
+)
+
+MAX_DISTANCE = game.BOARD_SIZE - 1
+
+
+@dataclass
+class Stats:
+    games: int = 0
+    actions: int = 0
+    p1_wins: int = 0
+    guesses: int = 0
+    right_guesses: int = 0
+    forfeits: int = 0
+    # Indexed by how far a player's own peg started from the thaler: how many
+    # players started there, and how many of them won.
+    players_at: list[int] = field(default_factory=lambda: [0] * (MAX_DISTANCE + 1))
+    wins_at: list[int] = field(default_factory=lambda: [0] * (MAX_DISTANCE + 1))
+
+    def merge(self, other: "Stats") -> "Stats":
+        for name, value in asdict(other).items():
+            if isinstance(value, list):
+                mine = getattr(self, name)
+                mine[:] = [a + b for a, b in zip(mine, value)]
+            else:
+                setattr(self, name, getattr(self, name) + value)
+        return self
+
+    def report(self) -> str:
+        def percent(n: int, of: int) -> str:
+            return f"{n / of:.1%}" if of else "-"
+
+        lines = [
+            f"{self.games:,} games, {self.actions:,} actions",
+            f"player 1 wins {percent(self.p1_wins, self.games)}",
+            f"{self.guesses:,} games ended by a guess, {percent(self.right_guesses, self.guesses)} right",
+            f"{self.forfeits:,} games ended by a forfeit",
+            "win rate by distance of a player's own peg from the thaler at the start:",
+        ]
+        lines += [
+            f"  {distance}: {percent(wins, players):>6} of {players:,}"
+            for distance, (players, wins) in enumerate(zip(self.players_at, self.wins_at))
+            if players
+        ]
+        return "\n".join(lines)
+
+
+def tally(path: str, offset: int = 0, verify: bool = False) -> tuple[str, int, Stats]:
+    """Tally the games in `path` from byte `offset`; returns where it stopped."""
+    stats = Stats()
+    offset = max(offset, len(HEADER))
+    players_at, wins_at, distance = stats.players_at, stats.wins_at, game.DISTANCE
+    for body in read_bodies(path, offset=offset):
+        offset += record_size(body)
+        seed, p1, p2 = FIXED.unpack_from(body)
+        actions = body[FIXED.size :]
+        if not actions or p1 == NO_COLOR or p2 == NO_COLOR:
+            continue
+        cells = game.deal(random.Random(seed))
+        if actions[0] & PLACE:
+            # Player 2 moved the thaler before the first turn.
+            cells[-1] = actions[0] & ~PLACE
+            actions = actions[1:]
+        # Player 1 plays the even-numbered actions, so the one who ended the
+        # game is player 1 when there is an odd number of them.
+        p1_last = len(actions) % 2 == 1
+        mover, other = (p1, p2) if p1_last else (p2, p1)
+        last = actions[-1]
+        if last == FORFEIT:
+            mover_won = False
+            stats.forfeits += 1
+        elif last & GUESS:
+            mover_won = last & ~GUESS == other
+            stats.guesses += 1
+            stats.right_guesses += mover_won
+        else:
+            # The peg reached the thaler: as in `make_player_move`, that wins
+            # only for a player moving their own colour, and one the
+            # opponent didn't pick too.
+            color = last // N_DIRECTIONS
+            mover_won = color == mover and color != other
+        p1_won = mover_won == p1_last
+        if verify:
+            ended = GameRecord.decode(body).replay().game_ended_state
+            if ended != ("P1_won" if p1_won else "P2_won"):
+                raise ValueError(f"{path}: game of seed {seed} ended {ended} on replay")
+        stats.games += 1
+        stats.actions += len(actions)
+        stats.p1_wins += p1_won
+        near = distance[cells[-1]]
+        players_at[near[cells[p1]]] += 1
+        players_at[near[cells[p2]]] += 1
+        wins_at[near[cells[p1]]] += p1_won
+        wins_at[near[cells[p2]]] += not p1_won
+    return path, offset, stats
+
+
+def archives(paths: list[Path]) -> list[Path]:
+    found = []
+    for path in paths:
+        found += sorted(path.rglob("games*.bin")) if path.is_dir() else [path]
+    return found
+
+
+def run(
+    paths: list[Path],
+    workers: int | None = None,
+    state_path: Path | None = None,
+    verify: bool = False,
+) -> Stats:
+    """Tally every archive under `paths`, reading only what `state_path`
+    hasn't seen, and return the totals."""
+    files: dict[str, dict] = {}
+    if state_path and state_path.exists():
+        files = json.loads(state_path.read_text())["files"]
+    found = [str(path) for path in archives(paths)]
+    jobs = []
+    for path in found:
+        size = os.path.getsize(path)
+        seen = files.get(path)
+        if seen and seen["offset"] > size:
+            del files[path]
+            seen = None
+        if not seen or seen["offset"] < size:
+            jobs.append((path, seen["offset"] if seen else 0, verify))
+
+    if workers == 1 or len(jobs) <= 1:
+        results = [tally(*job) for job in jobs]
+    else:
+        with Pool(workers) as pool:
+            results = pool.starmap(tally, jobs)
+    for path, offset, stats in results:
+        if seen := files.get(path):
+            stats.merge(Stats(**seen["stats"]))
+        files[path] = {"offset": offset, "stats": asdict(stats)}
+
+    if state_path:
+        partial = state_path.with_suffix(".tmp")
+        partial.write_text(json.dumps({"files": files}))
+        partial.replace(state_path)
+    total = Stats()
+    for path in found:
+        total.merge(Stats(**files[path]["stats"]))
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", type=Path, nargs="+", help="archives or data directories")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--state", type=Path, help="file remembering what has been read")
+    parser.add_argument("--verify", action="store_true", help="replay every game too")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    stats = run(args.paths, args.workers, args.state, args.verify)
+    print(stats.report())
+    print(f"in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""NumPy batch simulator: many games advanced in lock-step.
+
+`BatchGames` holds N games as arrays and applies the same rules as
+`GameState.valid_moves`, `make_player_move` and `make_player_guess` to all of
+them at once. Moves are addressed as (color, direction), where direction
+indexes `game.DIRECTIONS`; each direction has at most one legal target (the
+neighbouring cell, or the cell beyond it when jumping a peg).
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+import game
+
+N_COLORS = len(game.Color)
+N_DIRECTIONS = len(game.DIRECTIONS)
+
+P1_TURN, P2_TURN, GAME_ENDED = 0, 1, 2
+NOT_YET, P1_WON, P2_WON = 0, 1, 2
+
+
+def _cell_table(scale: int) -> np.ndarray:
+    return np.array(
+        [
+            [
+                -1 if (cell := game.offset_cell(pos, dx * scale, dy * scale)) is None
+                else cell
+                for dx, dy in game.DIRECTIONS
+            ]
+            for pos in range(game.BOARD_CELLS)
+        ],
+        dtype=np.int8,
+    )
+
+
+# STEP[cell, direction] / JUMP[cell, direction]: the cell one and two away, or -1.
+STEP = _cell_table(1)
+JUMP = _cell_table(2)
+DISTANCE = np.array(game.DISTANCE, dtype=np.int8)
+
+# STEP_CLOSER[thaler, cell, direction]: STEP is on the board and no farther
+# from the thaler than `cell`; likewise JUMP_CLOSER.
+_limit = DISTANCE[:, :, None]
+_thalers = np.arange(game.BOARD_CELLS)[:, None, None]
+STEP_CLOSER = (STEP >= 0) & (DISTANCE[_thalers, STEP.clip(0)] <= _limit)
+JUMP_CLOSER = (JUMP >= 0) & (DISTANCE[_thalers, JUMP.clip(0)] <= _limit)
+STEP_SHIFT = STEP.clip(0).astype(np.uint64)
+JUMP_SHIFT = JUMP.clip(0).astype(np.uint64)
+
+
+@dataclass
+class BatchGames:
+    pegs: np.ndarray  # (N, 7) cell of each color
+    thaler: np.ndarray  # (N,)
+    phase: np.ndarray  # (N,) P1_TURN, P2_TURN or GAME_ENDED
+    p1_color: np.ndarray  # (N,) Color.value
+    p2_color: np.ndarray  # (N,)
+    result: np.ndarray  # (N,) NOT_YET, P1_WON or P2_WON
+
+    def __len__(self) -> int:
+        return len(self.thaler)
+
+    @classmethod
+    def create(cls, n: int, rng: np.random.Generator) -> "BatchGames":
+        """Random starts like `generate_peg_positions`, with random color picks."""
+        cells = rng.random((n, game.BOARD_CELLS)).argsort(axis=1)[:, : N_COLORS + 1]
+        return cls(
+            pegs=cells[:, :N_COLORS].astype(np.int8),
+            thaler=cells[:, N_COLORS].astype(np.int8),
+            phase=np.full(n, P1_TURN, dtype=np.int8),
+            p1_color=rng.integers(0, N_COLORS, n, dtype=np.int8),
+            p2_color=rng.integers(0, N_COLORS, n, dtype=np.int8),
+            result=np.full(n, NOT_YET, dtype=np.int8),
+        )
+
+    @classmethod
+    def of_game_states(cls, states: list[game.GameState]) -> "BatchGames":
+        phases = {game.WhichPhase.P1_TURN: P1_TURN, game.WhichPhase.P2_TURN: P2_TURN}
+        return cls(
+            pegs=np.array(
+                [[s.pegs[color].int_repr for color in game.Color] for s in states],
+                dtype=np.int8,
+            ),
+            thaler=np.array([s.thaler_pos.int_repr for s in states], dtype=np.int8),
+            phase=np.array(
+                [phases.get(s.current_phase, GAME_ENDED) for s in states], dtype=np.int8
+            ),
+            p1_color=np.array([s.p1_color.value for s in states], dtype=np.int8),
+            p2_color=np.array([s.p2_color.value for s in states], dtype=np.int8),
+            result=np.full(len(states), NOT_YET, dtype=np.int8),
+        )
+
+    def occupancy(self) -> np.ndarray:
+        """(N,) 49-bit boards, bit `n` set when a peg sits on cell `n`."""
+        bits = np.left_shift(np.uint64(1), self.pegs.astype(np.uint64))
+        return np.bitwise_or.reduce(bits, axis=1)
+
+    def targets(self) -> np.ndarray:
+        """(N, 7, 8) destination cell of each (color, direction), or -1 if illegal."""
+        src = self.pegs.astype(np.intp)
+        thaler = self.thaler.astype(np.intp)[:, None]
+        occupied = self.occupancy()[:, None, None]
+        step_taken = (occupied >> STEP_SHIFT[src]) & np.uint64(1) == 1
+        jump_taken = (occupied >> JUMP_SHIFT[src]) & np.uint64(1) == 1
+        step_legal = STEP_CLOSER[thaler, src] & ~step_taken
+        jump_legal = JUMP_CLOSER[thaler, src] & step_taken & ~jump_taken
+        targets = np.where(step_legal, STEP[src], np.where(jump_legal, JUMP[src], -1))
+        targets[self.phase == GAME_ENDED] = -1
+        return targets
+
+    def legal_mask(self) -> np.ndarray:
+        return self.targets() >= 0
+
+    def apply_moves(
+        self,
+        color: np.ndarray,
+        direction: np.ndarray,
+        active: np.ndarray,
+        targets: np.ndarray | None = None,
+    ) -> None:
+        """Play (color, direction) in every game where `active`; the moves must be legal.
+
+        Pass `targets` when it has already been computed for this position.
+        """
+        games = np.flatnonzero(active)
+        if targets is None:
+            targets = self.targets()
+        dst = targets[games, color[games], direction[games]]
+        if (dst < 0).any():
+            raise ValueError("illegal move in batch")
+        self.pegs[games, color[games]] = dst
+
+        moved = color[games]
+        p1_moving = self.phase[games] == P1_TURN
+        mover_color = np.where(p1_moving, self.p1_color[games], self.p2_color[games])
+        other_color = np.where(p1_moving, self.p2_color[games], self.p1_color[games])
+        landed = dst == self.thaler[games]
+        mover_wins = (moved == mover_color) & (moved != other_color)
+        p1_wins = np.where(p1_moving, mover_wins, ~mover_wins)
+        self.result[games] = np.where(landed, np.where(p1_wins, P1_WON, P2_WON), NOT_YET)
+        self.phase[games] = np.where(landed, GAME_ENDED, 1 - self.phase[games])
+
+    def apply_guesses(self, guess: np.ndarray, active: np.ndarray) -> None:
+        """`make_player_guess` for every game where `active`; ends those games."""
+        games = np.flatnonzero(active)
+        p1_guessing = self.phase[games] == P1_TURN
+        other_color = np.where(p1_guessing, self.p2_color[games], self.p1_color[games])
+        right = guess[games] == other_color
+        self.result[games] = np.where(p1_guessing == right, P1_WON, P2_WON)
+        self.phase[games] = GAME_ENDED
+
+    def random_step(self, rng: np.random.Generator) -> None:
+        """Every running game plays a uniformly random legal move, or guesses if it has none."""
+        running = self.phase != GAME_ENDED
+        targets = self.targets()
+        legal = (targets >= 0).reshape(len(self), -1)
+        scores = np.where(legal, rng.random(legal.shape), -1.0)
+        choice = scores.argmax(axis=1)
+        has_move = legal.any(axis=1)
+        self.apply_moves(
+            choice // N_DIRECTIONS, choice % N_DIRECTIONS, running & has_move, targets
+        )
+        self.apply_guesses(
+            rng.integers(0, N_COLORS, len(self)), running & ~has_move
+        )
+
+    def subset(self, games: np.ndarray) -> "BatchGames":
+        return BatchGames(
+            pegs=self.pegs[games],
+            thaler=self.thaler[games],
+            phase=self.phase[games],
+            p1_color=self.p1_color[games],
+            p2_color=self.p2_color[games],
+            result=self.result[games],
+        )
+
+    def assign(self, games: np.ndarray, other: "BatchGames") -> None:
+        self.pegs[games] = other.pegs
+        self.phase[games] = other.phase
+        self.result[games] = other.result
+
+    def play_random(self, rng: np.random.Generator, max_plies: int = 200) -> None:
+        """Random playouts; each ply only touches the games still running."""
+        live = np.flatnonzero(self.phase != GAME_ENDED)
+        for _ in range(max_plies):
+            if not len(live):
+                return
+            running = self.subset(live)
+            running.random_step(rng)
+            self.assign(live, running)
+            live = live[running.phase != GAME_ENDED]
@@ -0,0 +1,281 @@
+"""Stress check and throughput benchmark for the per-room actor.
+
+The stress check opens `--rooms` rooms, each with two in-memory players
+whose connections take a random moment to accept each frame, and has both
+players of every room post a random mix of messages at once: moves (legal
+or not), move requests, choices, guesses, snapshot requests and garbage,
+some of it JSON nested past the recursion limit. When everything has been
+applied and sent it checks that:
+
+- replaying the write-ahead log from the initial states gives each room's
+  final state, so every action was applied whole and in one order;
+- each player, rebuilding the board from its frames the way `game.js`
+  does, saw an unbroken run of sequence numbers and ends on that state
+  (unless it fell too far behind and was cut off);
+- every room's actor is still running.
+
+It also checks that an actor that dies anyway is restarted, and applies
+the messages that come after.
+
+The benchmark then replays scripted matches, posting `--burst` plies at a
+time to each room (a `request_moves` and a `make_player_move` per ply),
+through the actor and through one broadcast per message for comparison,
+with a few spectators per room. Reports messages/s and broadcasts per
+message.
+
+    python bench_actor.py [--rooms 200] [--messages 400] [--bursts 1 2 4 8]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import game
+import metrics
+import store
+from bench_connection import Connection
+from room import Room, RoomManager
+from store import FileStore
+
+SPECTATORS = 4
+
+
+def random_message(rng: random.Random, state: game.GameState) -> str:
+    color = rng.choice(list(game.Color))
+    roll = rng.random()
+    if roll < 0.45:
+        moves = state.generate_moves(color)
+        dst = rng.choice(moves).int_repr if moves and rng.random() < 0.9 else rng.randrange(49)
+        return json.dumps(["make_player_move", {"color": color.to_string(), "dst": dst}])
+    if roll < 0.75:
+        return json.dumps(["request_moves", {"color": color.to_string()}])
+    if roll < 0.85:
+        return json.dumps(["make_player_choice", {"color": color.to_string()}])
+    if roll < 0.88:
+        return json.dumps(["make_player_guess", {"color": color.to_string()}])
+    if roll < 0.95:
+        return json.dumps(["request_snapshot", {}])
+    if roll < 0.99:
+        return rng.choice(["not json", "[1, 2, 3]", '["make_player_move", 7]', "{}"])
+    # Nested past the recursion limit, which used to kill the actor.
+    return "[" * 100_000 + "]" * 100_000
+
+
+def rebuild(frames: list[str | bytes]) -> tuple[dict[str, int], int, str]:
+    """The board a client ends up showing, asserting no patch was missed."""
+    board: dict | None = None
+    for frame in frames:
+        data = json.loads(frame)
+        if isinstance(data, dict) and data.get("__magic__") == "game_state":
+            board = {
+                "seq": data["seq"],
+                "pegs": dict(data["pegs"]),
+                "thaler": data["thaler_pos"]["int_repr"],
+                "phase": data["current_phase"],
+            }
+        elif data[0] == "game_state_patch":
+            patch = data[1]
+            assert board is not None, "patch before any snapshot"
+            assert patch["seq"] == board["seq"] + 1, f"seq {board['seq']} -> {patch['seq']}"
+            board["seq"] = patch["seq"]
+            board["pegs"].update(patch.get("pegs", {}))
+            board["thaler"] = patch.get("thaler_pos", board["thaler"])
+            board["phase"] = patch.get("current_phase", board["phase"])
+    assert board is not None, "no snapshot received"
+    return board["pegs"], board["thaler"], board["phase"]
+
+
+async def settle(rooms: list[Room]) -> None:
+    """Wait until every mailbox is applied and every outbox written."""
+    while any(
+        room.mailbox
+        or any(o.messages or o.stale or o.state is not None for o in room.outboxes.values())
+        for room in rooms
+    ):
+        await asyncio.sleep(0.001)
+
+
+async def stress(n_rooms: int, n_messages: int) -> None:
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        wal = FileStore.open(directory)
+        manager = RoomManager(store=wal)
+        rooms, players = [], []
+        for _ in range(n_rooms):
+            room = manager.create_room(public=False)
+            seats = [Connection(record=True, rng=rng, jitter=0.002) for _ in range(2)]
+            for conn in seats:
+                manager.join(conn, room.room_id)  # type: ignore[arg-type]
+            # What the handler does once both players are in.
+            room.update_clients()
+            rooms.append(room)
+            players.append(seats)
+
+        async def player(room: Room, which_player: int, conn: Connection) -> None:
+            for _ in range(n_messages):
+                room.post(which_player, random_message(rng, room.game_state))  # type: ignore[arg-type]
+                # Messages arrive over the same kind of link as replies leave,
+                # at no more than half the rate: nearly every message is
+                # answered, and a client that reads slower than it writes
+                # is cut off.
+                await conn.pause()
+                await conn.pause()
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                player(room, which_player, seats[which_player - 1])
+                for room, seats in zip(rooms, players)
+                for which_player in (1, 2)
+            ]
+        )
+        # A dead actor would leave its mailbox full for good.
+        await asyncio.wait_for(settle(rooms), 60)
+        elapsed = time.perf_counter() - start
+        wal.close()
+
+        replayed: dict[str, game.GameState] = {}
+        for _, path in store.numbered(Path(directory), "wal"):
+            for record in store.read_records(path):
+                store.replay(replayed, record)
+
+    assert all(room.actor and not room.actor.done() for room in rooms), "an actor died"
+    for room, seats in zip(rooms, players):
+        state = room.game_state
+        assert replayed[room.room_id].to_json_fast() == state.to_json_fast(), room.room_id
+        final = (
+            {color.to_string(): peg.int_repr for color, peg in state.pegs.items()},
+            state.thaler_pos.int_repr,
+            state.current_phase.value,
+        )
+        for conn in seats:
+            # A client cut off for falling behind would reconnect and resync.
+            if conn.closed is None:
+                assert rebuild(conn.frames) == final, room.room_id
+    for room in rooms:
+        room.stop()
+
+    posted = n_rooms * 2 * n_messages
+    ended = sum(room.game_state.current_phase == game.WhichPhase.GAME_ENDED for room in rooms)
+    print(
+        f"stress: {posted} messages to {n_rooms} rooms in {elapsed:.2f} s, "
+        f"{metrics.METRICS.broadcasts} broadcasts, {ended} games ended, "
+        f"{metrics.METRICS.slow_disconnects} clients cut off; "
+        f"WAL replay and every client's board match"
+    )
+
+
+async def restart() -> None:
+    """An actor killed by an error outside any one message comes back."""
+    manager = RoomManager()
+    room = manager.create_room(public=False)
+    for _ in range(2):
+        manager.join(Connection(), room.room_id)  # type: ignore[arg-type]
+    update_clients = room.update_clients
+
+    def fail_once() -> None:
+        room.update_clients = update_clients  # type: ignore[method-assign]
+        raise OSError("disk full")
+
+    room.update_clients = fail_once  # type: ignore[method-assign]
+    room.post(1, json.dumps(["make_player_choice", {"color": "R"}]))
+    await asyncio.wait_for(settle([room]), 5)
+    room.post(2, json.dumps(["make_player_choice", {"color": "B"}]))
+    await asyncio.wait_for(settle([room]), 5)
+    assert room.game_state.p2_color == game.Color.BLUE, "the restarted actor lost a message"
+    room.stop()
+    print("an actor that dies is restarted and carries on")
+
+
+def script(rng: random.Random, state: game.GameState, plies: int) -> list[tuple[int, str]]:
+    """Messages for up to `plies` random moves from `state`, played on a copy."""
+    state = game.GameState.from_dict_fast(json.loads(state.to_json_fast()))
+    messages = []
+    for _ in range(plies):
+        player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+        options = [
+            (color, dst)
+            for color in game.Color
+            for dst in state.generate_moves(color)
+            if dst is not state.thaler_pos
+        ]
+        if state.game_ended_state != "Not_yet" or not options:
+            break
+        color, dst = rng.choice(options)
+        state.make_player_move(player, color, dst)
+        messages.append((player, json.dumps(["request_moves", {"color": color.to_string()}])))
+        messages.append(
+            (
+                player,
+                json.dumps(["make_player_move", {"color": color.to_string(), "dst": dst.int_repr}]),
+            )
+        )
+    return messages
+
+
+async def throughput(n_rooms: int, burst: int, actor: bool) -> tuple[float, float]:
+    metrics.METRICS = metrics.Metrics()
+    rng = random.Random(1)
+    manager = RoomManager()
+    rooms, scripts = [], []
+    for _ in range(n_rooms):
+        room = manager.create_room(public=False)
+        for _ in range(2):
+            manager.join(Connection(), room.room_id)  # type: ignore[arg-type]
+        for _ in range(SPECTATORS):
+            room.watch(Connection()).start()  # type: ignore[arg-type]
+        room.game_state.make_player_choice(1, game.Color.RED)
+        room.game_state.make_player_choice(2, game.Color.BLUE)
+        room.update_clients()
+        rooms.append(room)
+        scripts.append(script(rng, room.game_state, 40))
+    await asyncio.sleep(0)
+
+    sent = 0
+    start = time.perf_counter()
+    for offset in range(0, max(map(len, scripts)), burst * 2):
+        for room, messages in zip(rooms, scripts):
+            for which_player, message in messages[offset : offset + burst * 2]:
+                if actor:
+                    room.post(which_player, message)  # type: ignore[arg-type]
+                else:
+                    room.process_message(which_player, message)  # type: ignore[arg-type]
+                    room.update_clients()
+                sent += 1
+        # The loop turns over once a round, running actors and writers.
+        await asyncio.sleep(0)
+    await settle(rooms)
+    elapsed = time.perf_counter() - start
+    for room in rooms:
+        room.stop()
+        for conn in list(room.spectators):
+            room.unwatch(conn)
+    return sent / elapsed, metrics.METRICS.broadcasts / sent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=400, help="per player, in the stress check")
+    parser.add_argument("--bursts", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    # The messages that fail on purpose are logged with their tracebacks.
+    logging.disable(logging.ERROR)
+    asyncio.run(stress(args.rooms, args.messages))
+    asyncio.run(restart())
+    for burst in args.bursts:
+        for actor in (False, True):
+            rate, per_message = asyncio.run(throughput(args.rooms * 5, burst, actor))
+            print(
+                f"{burst:>2} plies per burst, {'actor' if actor else 'per-message':>11}: "
+                f"{rate:>8.0f} msgs/s, {per_message:.2f} broadcasts/msg"
+            )
+
+
+if __name__ == "__main__":
+    main()
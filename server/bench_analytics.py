@@ -0,0 +1,101 @@
+"""Throughput, memory and incremental re-runs of `analytics` on synthetic archives.
+
+Plays `--distinct` random games (as `bench_records` does) and checks the
+fast tally against a full `GameState` replay of each. It then repeats them
+into `--games` records over `--shards` archive files and times:
+
+- a first run over every shard in a pool of `--workers` processes;
+- a re-run with nothing new, which reads no records;
+- a re-run after games were appended to one shard, which reads only those.
+
+The re-run's totals must equal the first run's plus a separate tally of the
+appended games. Reports games/s and the peak RSS of the process and of its
+workers.
+
+    python bench_analytics.py [--games 10000000] [--shards 8] [--workers 8] [--distinct 20000]
+"""
+
+import argparse
+import itertools
+import random
+import resource
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+import analytics
+from bench_records import random_game
+from records import RecordWriter, write_records
+
+
+def timed(label: str, games: int, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    rate = f", {games / elapsed:,.0f} games/s" if games else ""
+    print(f"{label}: {elapsed:.2f} s{rate}")
+    return result
+
+
+def peak_rss_mb(who: int) -> float:
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=10_000_000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--distinct", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    records = [random_game(rng)[0] for _ in range(args.distinct)]
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        write_records(root / "distinct.bin", records)
+        checked = timed("verify", len(records), analytics.run, [root / "distinct.bin"], 1, None, True)
+        assert checked == analytics.run([root / "distinct.bin"], 1)
+        print(f"fast tally of {checked.games:,} games agrees with replaying them")
+        (root / "distinct.bin").unlink()
+
+        data = root / "data"
+        data.mkdir()
+        per_shard = args.games // args.shards
+        games = itertools.cycle(records)
+        start = time.perf_counter()
+        for shard in range(args.shards):
+            write_records(data / f"games-{shard}.bin", itertools.islice(games, per_shard))
+        size = sum(path.stat().st_size for path in data.iterdir())
+        print(
+            f"wrote {per_shard * args.shards:,} games to {args.shards} shards "
+            f"({size / 1e6:.0f} MB) in {time.perf_counter() - start:.1f} s"
+        )
+
+        state = root / "analytics.json"
+        first = timed("first run", per_shard * args.shards, analytics.run, [data], args.workers, state)
+        again = timed("re-run, nothing new", 0, analytics.run, [data], args.workers, state)
+        assert again == first
+
+        appended = args.distinct
+        writer = RecordWriter.open(data / "games-0.bin")
+        for record in records:
+            writer.write(record)
+        writer.close()
+        grown = timed("re-run, one shard grown", appended, analytics.run, [data], args.workers, state)
+        write_records(root / "appended.bin", records)
+        expected = first.merge(analytics.run([root / "appended.bin"], 1))
+        assert asdict(grown) == asdict(expected)
+        print(f"re-run added exactly the {appended:,} appended games")
+
+    print(
+        f"peak RSS: {peak_rss_mb(resource.RUSAGE_SELF):.0f} MB here, "
+        f"{peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB in the largest worker"
+    )
+    print()
+    print(grown.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Action latency with a slow opponent: per-connection outboxes against inline sends.
+
+Plays matches between two in-memory players whose actions go through
+`Room.process_message`. Player 1's connection is fast; player 2's takes
+`--delay` seconds to accept each frame, or never does when stalled. Reports
+how long player 1's actions take to process, which with outboxes should not
+depend on player 2 at all, and what player 2 ends up receiving: how many of
+its frames were state, how many were coalesced away, whether the board they
+add up to is the room's final one, and how often it was cut off for falling
+behind when it also keeps asking for moves it never reads. Player 2 stays
+connected until its writer has sent everything queued, so the total time
+includes the slow peer catching up after each match.
+
+The `inline` rows await every send in the action path, as broadcasts used
+to (`asyncio.gather` over both players' `send`), for comparison.
+
+    python bench_backpressure.py [--matches 200] [--delay 0.005]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import game
+import metrics
+from bench_actor import rebuild
+from bench_connection import Connection
+from room import Room, RoomManager
+
+
+def pick_move(state: game.GameState, rng: random.Random) -> tuple[game.Color, game.Coords] | None:
+    moves = [
+        (color, dst)
+        for color in game.Color
+        for dst in state.valid_moves(color)
+        if dst is not state.thaler_pos
+    ]
+    return rng.choice(moves) if moves else None
+
+
+async def inline(room: Room, which_player: int, message: str) -> None:
+    """Apply a message and wait for its replies to be sent, as the action
+    path used to: the asker for `request_moves`, both players after a move."""
+    action, data = json.loads(message)
+    color = game.Color.of_string(data["color"])
+    if action == "request_moves":
+        moves = [cell.int_repr for cell in room.game_state.valid_moves(color)]  # type: ignore[arg-type]
+        conn = room.p1 if which_player == 1 else room.p2
+        await conn.send(json.dumps(["valid_moves", {"moves": moves}]))  # type: ignore[union-attr]
+        return
+    room.game_state.make_player_move(which_player, color, game.Coords(data["dst"]))  # type: ignore[arg-type]
+    if state := room.encode_update():
+        await asyncio.gather(room.p1.send(state[0]), room.p2.send(state[1]))  # type: ignore[union-attr]
+
+
+async def play(room: Room, rng: random.Random, inline_sends: bool, chatty: bool) -> list[float]:
+    """One match; the time each of player 1's actions took to process.
+
+    A chatty player 2 asks for every colour's moves on each of its turns.
+    """
+    latencies = []
+    for ply in range(60):
+        which_player = 1 if room.game_state.current_phase == game.WhichPhase.P1_TURN else 2
+        if not (move := pick_move(room.game_state, rng)):
+            break
+        color, dst = move
+        asked = list(game.Color) if chatty and which_player == 2 else [color]
+        messages = [
+            *[json.dumps(["request_moves", {"color": c.to_string()}]) for c in asked],
+            json.dumps(["make_player_move", {"color": color.to_string(), "dst": dst.int_repr}]),
+        ]
+        for message in messages:
+            start = time.perf_counter()
+            if inline_sends:
+                await inline(room, which_player, message)
+            else:
+                room.process_message(which_player, message)
+                room.update_clients()
+            if which_player == 1:
+                latencies.append(time.perf_counter() - start)
+        # Each player's next message arrives after the event loop has run.
+        await asyncio.sleep(0)
+        if room.game_state.current_phase == game.WhichPhase.GAME_ENDED:
+            break
+    return latencies
+
+
+def is_state_frame(frame: str | bytes) -> bool:
+    data = json.loads(frame)
+    if isinstance(data, dict):
+        return data.get("__magic__") == "game_state"
+    return data[0] == "game_state_patch"
+
+
+async def run(
+    name: str,
+    n_matches: int,
+    p2: Connection,
+    inline_sends: bool = False,
+    chatty: bool = False,
+) -> None:
+    metrics.METRICS = metrics.Metrics()
+    rng = random.Random(0)
+    manager = RoomManager()
+    p1 = Connection()
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for _ in range(n_matches):
+        # Only the last match's frames are checked against its final board.
+        first_frame = len(p2.frames)
+        room = manager.create_room(public=False)
+        manager.join(p1, room.room_id)  # type: ignore[arg-type]
+        manager.join(p2, room.room_id)  # type: ignore[arg-type]
+        room.process_message(1, json.dumps(["make_player_choice", {"color": "R"}]))
+        room.update_clients()
+        room.process_message(2, json.dumps(["make_player_choice", {"color": "B"}]))
+        room.update_clients()
+        latencies += await play(room, rng, inline_sends, chatty)
+        # Leaving cancels a player's writer, dropping whatever it still had
+        # queued, so let player 2 catch up first unless it never can.
+        outbox = room.outboxes.get(p2)  # type: ignore[call-overload]
+        if outbox and outbox.task and p2.gate is None:
+            outbox.finish()
+            await outbox.task
+        manager.leave(p1)  # type: ignore[arg-type]
+        manager.leave(p2)  # type: ignore[arg-type]
+    elapsed = time.perf_counter() - started
+    state = room.game_state
+    final = (
+        {color.to_string(): peg.int_repr for color, peg in state.pegs.items()},
+        state.thaler_pos.int_repr,
+        state.current_phase.value,
+    )
+
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(
+        f"{name:>16}: p1 action p50 {p50 * 1e6:>9.1f} us, p99 {p99 * 1e6:>9.1f} us, "
+        f"{elapsed:>6.2f} s total; p2 got {len(p2.frames)} frames, "
+        f"{sum(map(is_state_frame, p2.frames))} of them state, "
+        f"{metrics.METRICS.coalesced_frames} coalesced, "
+        f"{metrics.METRICS.slow_disconnects} times cut off"
+        # Inline sends race the outbox that sent the opening snapshot, so
+        # only frames that all came through an outbox add up to a board.
+        + (
+            f", final board {'matches' if rebuild(p2.frames[first_frame:]) == final else 'DIFFERS'}"
+            if p2.record and not inline_sends
+            else ""
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--matches", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.005, help="slow client's seconds per frame")
+    args = parser.parse_args()
+    asyncio.run(run("fast peer", args.matches, Connection(record=True)))
+    asyncio.run(run("slow peer", args.matches, Connection(args.delay, record=True)))
+    asyncio.run(run("stalled peer", args.matches, Connection(stalled=True)))
+    asyncio.run(run("stalled, chatty", args.matches, Connection(stalled=True), chatty=True))
+    # Inline sends would never finish against a stalled peer; a slow one is enough.
+    inline = max(1, args.matches // 10)
+    asyncio.run(run("inline, fast", inline, Connection(record=True), inline_sends=True))
+    asyncio.run(
+        run("inline, slow", inline, Connection(args.delay, record=True), inline_sends=True)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark and parity check for the NumPy batch simulator.
+
+First replays random games through both `BatchGames` and scalar `GameState`
+objects, checking legal moves, peg positions and results agree every ply.
+Then plays N random games in one batch and reports games/s.
+
+    python bench_batch.py [--games 100000] [--parity 500]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import game
+from batch import GAME_ENDED, N_DIRECTIONS, NOT_YET, P1_WON, P2_WON, BatchGames
+
+RESULTS = {NOT_YET: "Not_yet", P1_WON: "P1_won", P2_WON: "P2_won"}
+
+
+def scalar_states(batch: BatchGames) -> list[game.GameState]:
+    states = []
+    for i in range(len(batch)):
+        state = game.GameState(
+            pegs={color: game.Coords(int(batch.pegs[i, color.value])) for color in game.Color},
+            thaler_pos=game.Coords(int(batch.thaler[i])),
+            current_phase=game.WhichPhase.P1_TURN,
+            p1_color=game.Color(int(batch.p1_color[i])),
+            p2_color=game.Color(int(batch.p2_color[i])),
+        )
+        states.append(state)
+    return states
+
+
+def check_parity(n_games: int, rng: np.random.Generator, max_plies: int = 100) -> None:
+    batch = BatchGames.create(n_games, rng)
+    states = scalar_states(batch)
+    for _ in range(max_plies):
+        targets = batch.targets()
+        for i, state in enumerate(states):
+            running = state.game_ended_state == "Not_yet"
+            assert running == (batch.phase[i] != GAME_ENDED)
+            if not running:
+                continue
+            for color in game.Color:
+                expected = [c.int_repr for c in state.valid_moves(color)]
+                got = [int(t) for t in targets[i, color.value] if t >= 0]
+                assert got == expected, (i, color, got, expected)
+
+        running = batch.phase != GAME_ENDED
+        if not running.any():
+            break
+        legal = (targets >= 0).reshape(len(batch), -1)
+        choice = np.where(legal, rng.random(legal.shape), -1.0).argmax(axis=1)
+        has_move = legal.any(axis=1)
+        guesses = rng.integers(0, len(game.Color), len(batch))
+        for i, state in enumerate(states):
+            if not running[i]:
+                continue
+            which_player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+            if has_move[i]:
+                color = game.Color(int(choice[i] // N_DIRECTIONS))
+                dst = game.Coords(int(targets[i, color.value, choice[i] % N_DIRECTIONS]))
+                assert state.make_player_move(which_player, color, dst) is None
+            else:
+                assert state.make_player_guess(which_player, game.Color(int(guesses[i]))) is None
+        batch.apply_moves(choice // N_DIRECTIONS, choice % N_DIRECTIONS, running & has_move)
+        batch.apply_guesses(guesses, running & ~has_move)
+
+        for i, state in enumerate(states):
+            assert [state.pegs[c].int_repr for c in game.Color] == batch.pegs[i].tolist()
+            assert state.game_ended_state == RESULTS[int(batch.result[i])]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--parity", type=int, default=500)
+    parser.add_argument("--max-plies", type=int, default=200)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    check_parity(args.parity, rng)
+    print(f"parity: {args.parity} games agree with GameState")
+
+    batch = BatchGames.create(args.games, rng)
+    start = time.perf_counter()
+    batch.play_random(rng, args.max_plies)
+    elapsed = time.perf_counter() - start
+    finished = int((batch.phase == GAME_ENDED).sum())
+    p1_wins = int((batch.result == P1_WON).sum())
+    print(
+        f"{args.games / elapsed:.0f} games/s ({finished} finished, "
+        f"P1 won {p1_wins / max(finished, 1):.1%})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark for the search bot.
+
+Plays the bot against a player that picks uniformly among all legal moves,
+alternating seats, through the real `GameState` rules. Reports search
+nodes/s and the bot's win/loss/draw record.
+
+    python bench_bot.py [--games 50] [--budget 0.05]
+"""
+
+import argparse
+import random
+import time
+from typing import Literal
+
+import game
+from bot import Bot, Guess, Move
+
+MAX_PLIES = 200
+
+
+def random_action(state: game.GameState, rng: random.Random) -> Move | Guess:
+    moves = [Move(color, dst) for color in game.Color for dst in state.valid_moves(color)]
+    if not moves:
+        return Guess(rng.choice(list(game.Color)))
+    return rng.choice(moves)
+
+
+def play(bot_seat: Literal[1, 2], budget: float, rng: random.Random) -> tuple[str, Bot, float]:
+    state = game.GameState.create()
+    state.current_phase = game.WhichPhase.SELECTING
+    bot = Bot(rng.choice(list(game.Color)), time_budget=budget)
+    state.make_player_choice(bot_seat, bot.color)
+    state.make_player_choice(3 - bot_seat, rng.choice(list(game.Color)))  # type: ignore[arg-type]
+
+    thinking = 0.0
+    for _ in range(MAX_PLIES):
+        if state.game_ended_state != "Not_yet":
+            break
+        which_player: Literal[1, 2] = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+        if which_player == bot_seat:
+            start = time.perf_counter()
+            action = bot.choose(state)
+            thinking += time.perf_counter() - start
+        else:
+            action = random_action(state, rng)
+            if isinstance(action, Move):
+                bot.observe(
+                    game.GameState(pegs=dict(state.pegs), thaler_pos=state.thaler_pos),
+                    action,
+                )
+        match action:
+            case Move(color, dst):
+                result = state.make_player_move(which_player, color, dst)
+            case Guess(color):
+                result = state.make_player_guess(which_player, color)
+        assert result is None, result
+
+    won = "P1_won" if bot_seat == 1 else "P2_won"
+    match state.game_ended_state:
+        case "Not_yet":
+            outcome = "draw"
+        case ended:
+            outcome = "win" if ended == won else "loss"
+    return outcome, bot, thinking
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--budget", type=float, default=0.05, help="seconds per move")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    record = {"win": 0, "loss": 0, "draw": 0}
+    nodes, thinking = 0, 0.0
+    for index in range(args.games):
+        outcome, bot, seconds = play(1 if index % 2 == 0 else 2, args.budget, rng)
+        record[outcome] += 1
+        nodes += bot.nodes
+        thinking += seconds
+
+    print(f"{nodes / thinking:.0f} nodes/s over {thinking:.1f}s of search")
+    print(
+        f"bot vs random: {record['win']} won, {record['loss']} lost, "
+        f"{record['draw']} drawn ({record['win'] / args.games:.0%} win rate)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Serialization benchmark for game state broadcasts.
+
+Checks `GameState.to_json_fast` and `GameStateForClient.encode_for_players`
+produce the same bytes as dataclasses_json, then times encoding N states
+both ways.
+
+    python bench_codec.py [states]
+"""
+
+import random
+import sys
+import time
+from typing import Literal
+
+import game
+from room import GameStateForClient
+
+
+def sample_states(n: int) -> list[game.GameState]:
+    random.seed(0)
+    states = []
+    for _ in range(n):
+        state = game.GameState.create()
+        state.current_phase = random.choice(list(game.WhichPhase))
+        state.p1_color = random.choice([None, *game.Color])
+        state.p2_color = random.choice([None, *game.Color])
+        state.game_ended_state = random.choice(["P1_won", "P2_won", "Not_yet"])
+        states.append(state)
+    return states
+
+
+def client_json(state: game.GameState, you_are: Literal[1, 2]) -> str:
+    return GameStateForClient.of_game_state(state, you_are=you_are).to_json()
+
+
+def timed(name: str, n: int, pool: list[game.GameState], encode) -> None:
+    start = time.perf_counter()
+    for i in range(n):
+        encode(pool[i % len(pool)])
+    elapsed = time.perf_counter() - start
+    print(f"{name:>38}: {n / elapsed:>10.0f} states/s")
+
+
+def main(n: int) -> None:
+    pool = sample_states(1000)
+    for state in pool:
+        assert state.to_json_fast() == state.to_json()
+        assert GameStateForClient.encode_for_players(state) == (
+            client_json(state, 1),
+            client_json(state, 2),
+        )
+
+    timed("GameState.to_json", n, pool, lambda s: s.to_json())
+    timed("GameState.to_json_fast", n, pool, lambda s: s.to_json_fast())
+    timed(
+        "GameStateForClient.to_json x2",
+        n,
+        pool,
+        lambda s: (client_json(s, 1), client_json(s, 2)),
+    )
+    timed(
+        "GameStateForClient.encode_for_players",
+        n,
+        pool,
+        GameStateForClient.encode_for_players,
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,61 @@
+"""The in-memory connection the benchmarks seat players and spectators on.
+
+Not a benchmark itself: `Connection` stands in for a
+`websockets.ServerConnection` wherever a bench drives rooms without sockets.
+By default it drops every frame at once; the options make it slow, stalled
+or recording.
+"""
+
+import asyncio
+import random
+
+
+class Connection:
+    """Stands in for a `websockets.ServerConnection`.
+
+    Each send waits `delay` seconds, and with an `rng` up to `jitter` more
+    three times in ten. A `stalled` connection never accepts a frame; one
+    with a `gate` accepts none until it is set. Accepted frames go to
+    `receive`, which keeps them in `frames` if `record` is set.
+    """
+
+    remote_address = ("bench", 0)
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        stalled: bool = False,
+        record: bool = False,
+        rng: random.Random | None = None,
+        jitter: float = 0.0,
+        gate: asyncio.Event | None = None,
+    ) -> None:
+        self.delay = delay
+        self.gate = asyncio.Event() if stalled else gate
+        self.record = record
+        self.rng = rng
+        self.jitter = jitter
+        self.frames: list[str | bytes] = []
+        # The code and reason the server closed it with, if it did.
+        self.closed: tuple[int, str] | None = None
+
+    async def send(self, message: str | bytes, text: bool | None = None) -> None:
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        await self.pause()
+        self.receive(message)
+
+    async def pause(self) -> None:
+        """Up to `jitter` seconds three times in ten, if there is an `rng`."""
+        if self.rng and self.rng.random() < 0.3:
+            await asyncio.sleep(self.rng.random() * self.jitter)
+
+    def receive(self, message: str | bytes) -> None:
+        """A frame the client side has accepted."""
+        if self.record:
+            self.frames.append(message)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.closed = code, reason
@@ -0,0 +1,173 @@
+"""Frames/s and bytes/frame of the room dashboard against full redraws.
+
+Simulates `--rooms` live matches. Before each frame, a share of them make a
+random move, and a match that ends is replaced by a new room. Three ways of
+drawing every room on one big screen are timed:
+
+- full redraw with `to_board` as it was, building 49 cells through
+  `color_cell` on every call;
+- full redraw with the current `to_board`, which uses pre-rendered cells;
+- `console.Dashboard`, which writes only cursor-addressed cell diffs.
+
+A small terminal emulator checks that the dashboard's stream of diffs leaves
+the screen exactly as a full redraw of the same rooms would. It also checks
+that `BoardRenderer.render` matches `to_board` after every move.
+
+    python bench_console.py [--rooms 500] [--frames 200]
+"""
+
+import argparse
+import math
+import random
+import re
+import time
+
+import console
+import game
+from console import TILE_HEIGHT, TILE_WIDTH, Dashboard, move_to
+
+TOKEN = re.compile(r"\033\[([0-9;?]*)([A-Za-z])|([^\033])")
+
+
+class Screen:
+    """What a terminal shows: each position's character and its SGR codes."""
+
+    def __init__(self) -> None:
+        self.cells: dict[tuple[int, int], tuple[tuple[str, ...], str]] = {}
+        self.line = self.column = 0
+        self.sgr: tuple[str, ...] = ()
+
+    def feed(self, text: str) -> None:
+        for args, command, char in TOKEN.findall(text):
+            if char == "\n":
+                self.line, self.column = self.line + 1, 0
+            elif char:
+                if char == " " and not self.sgr:
+                    self.cells.pop((self.line, self.column), None)
+                else:
+                    self.cells[self.line, self.column] = (self.sgr, char)
+                self.column += 1
+            elif command == "H":
+                line, column = args.split(";")
+                self.line, self.column = int(line) - 1, int(column) - 1
+            elif command == "m":
+                self.sgr = () if args in ("", "0") else (*self.sgr, args)
+            elif command == "J":
+                self.cells.clear()
+            elif command == "K":
+                for key in [k for k in self.cells if k[0] == self.line and k[1] >= self.column]:
+                    del self.cells[key]
+
+
+def to_board_reference(state: game.GameState) -> str:
+    board = [
+        game.color_cell("  ", [game.RESET_CODE, "\033[100m"][idx % 2]) for idx in range(0, 49)
+    ]
+    for color, peg in state.pegs.items():
+        board[peg.int_repr] = game.color_cell(f"{color.to_string()} ", game.COLOR_CODES[color])
+    board[state.thaler_pos.int_repr] = game.color_cell("T ", game.THALER_CODE)
+    rows = [game.row(board[r : r + 7]) for r in range(0, 49, 7)]
+    return "\n".join(rows)
+
+
+def full_redraw(rooms: dict[str, game.GameState], per_line: int, to_board) -> str:
+    out = [console.CLEAR]
+    for index, (room_id, state) in enumerate(rooms.items()):
+        line, column = index // per_line * TILE_HEIGHT, index % per_line * TILE_WIDTH
+        out.append(move_to(line, column) + f"{room_id} {state.current_phase.value}")
+        for r, text in enumerate(to_board(state).split("\n")):
+            out.append(move_to(line + 1 + r, column) + text)
+    return "".join(out)
+
+
+def new_game(rng: random.Random) -> game.GameState:
+    state = game.GameState.create(rng.getrandbits(64))
+    state.current_phase = game.WhichPhase.SELECTING
+    state.make_player_choice(1, rng.choice(list(game.Color)))
+    state.make_player_choice(2, rng.choice(list(game.Color)))
+    return state
+
+
+def step(rooms: dict[str, game.GameState], rng: random.Random, active: float, ids) -> None:
+    """A random move in about `active` of the rooms; ended rooms are replaced."""
+    for room_id, state in list(rooms.items()):
+        if rng.random() >= active:
+            continue
+        if state.current_phase == game.WhichPhase.GAME_ENDED:
+            del rooms[room_id]
+            rooms[next(ids)] = new_game(rng)
+            continue
+        which_player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+        moves = [(c, dst) for c in game.Color for dst in state.valid_moves(c)]
+        if moves:
+            state.make_player_move(which_player, *rng.choice(moves))
+        else:
+            state.forfeit(which_player)
+
+
+def room_ids():
+    n = 0
+    while True:
+        yield f"room{n:05d}"
+        n += 1
+
+
+def check(n_rooms: int, frames: int) -> None:
+    rng = random.Random(1)
+    ids = room_ids()
+    rooms = {next(ids): new_game(rng) for _ in range(n_rooms)}
+    # Smaller than needed, so rooms also queue for tiles.
+    dashboard = Dashboard(width=10 * TILE_WIDTH, height=8 * TILE_HEIGHT + 1)
+    screen = Screen()
+    renderers = {room_id: console.BoardRenderer() for room_id in rooms}
+    for _ in range(frames):
+        step(rooms, rng, 0.3, ids)
+        screen.feed(dashboard.frame(rooms))
+        for room_id, state in rooms.items():
+            renderer = renderers.setdefault(room_id, console.BoardRenderer())
+            assert renderer.render(state) == state.to_board() == to_board_reference(state)
+    dashboard.full = True
+    redrawn = Screen()
+    redrawn.feed(dashboard.frame(rooms))
+    assert screen.cells == redrawn.cells
+    print(f"{frames} frames of diffs leave the same screen as a full redraw")
+
+
+def bench(n_rooms: int, frames: int, active: float) -> None:
+    per_line = math.ceil(math.sqrt(n_rooms))
+    width = per_line * TILE_WIDTH
+    height = math.ceil(n_rooms / per_line) * TILE_HEIGHT + 1
+    ways = {
+        "reference": lambda rooms: full_redraw(rooms, per_line, to_board_reference),
+        "to_board": lambda rooms: full_redraw(rooms, per_line, game.GameState.to_board),
+        "dashboard": Dashboard(width, height).frame,
+    }
+    results = []
+    for name, draw in ways.items():
+        rng = random.Random(0)
+        ids = room_ids()
+        rooms = {next(ids): new_game(rng) for _ in range(n_rooms)}
+        draw(rooms)
+        elapsed = written = 0
+        for _ in range(frames):
+            step(rooms, rng, active, ids)
+            start = time.perf_counter()
+            frame = draw(rooms)
+            elapsed += time.perf_counter() - start
+            written += len(frame.encode())
+        results.append(f"{name} {frames / elapsed:7.0f} frames/s {written / frames / 1e3:7.1f} KB")
+    print(f"{active:4.0%} of rooms moving: " + " | ".join(results))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+    check(120, 300)
+    for active in (0.01, 0.1, 1.0):
+        bench(args.rooms, args.frames, active)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Memory and allocation benchmark for interned Coords.
+
+Keeps 100k game states alive and measures what their cells cost with the
+shared `COORDS` table versus a per-instance frozen dataclass (the layout
+Coords used to have).
+
+    python bench_coords.py [states]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+import game
+
+
+@dataclass(frozen=True)
+class LegacyCoords:
+    int_repr: int
+
+
+def build(n_states: int, make_cell) -> list[game.GameState]:
+    rng = random.Random(0)
+    states = []
+    for _ in range(n_states):
+        *pegs, thaler = rng.sample(range(game.BOARD_CELLS), k=8)
+        states.append(
+            game.GameState(
+                pegs={game.Color(idx): make_cell(pos) for idx, pos in enumerate(pegs)},
+                thaler_pos=make_cell(thaler),
+            )
+        )
+    return states
+
+
+def measure(name: str, n_states: int, make_cell) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    states = build(n_states, make_cell)
+    elapsed = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    print(
+        f"{name:>8}: {current / n_states:>6.0f} B/state, "
+        f"{blocks / n_states:>5.1f} live blocks/state, "
+        f"{n_states / elapsed:>8.0f} states/s built"
+    )
+    del states
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    measure("legacy", n, LegacyCoords)
+    measure("interned", n, game.Coords)
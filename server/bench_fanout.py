@@ -0,0 +1,96 @@
+"""Spectator fan-out benchmark.
+
+Attaches N in-memory spectators to one room (a share of them stalled until
+the match is over), plays a match and reports broadcast cost, time for every
+fast spectator to receive each update, and how many stalled spectators
+overflowed their queue and were resynced from a snapshot.
+Also checks that all spectators were handed the very same frame objects and
+that every one of them ends on the final state.
+
+    python bench_fanout.py [spectators] [slow fraction]
+"""
+
+import asyncio
+import json
+import random
+import sys
+import time
+
+import game
+from bench_connection import Connection
+from room import Room
+
+PLIES = 40
+QUEUE_LIMIT = 16
+
+
+def final_seq(frames: list[str | bytes]) -> int:
+    last = json.loads(frames[-1])
+    return last["seq"] if isinstance(last, dict) else last[1]["seq"]
+
+
+async def run(n_spectators: int, slow_fraction: float) -> None:
+    rng = random.Random(0)
+    room = Room(game.GameState.create(), Connection(), Connection(), "bench")  # type: ignore[arg-type]
+    room.game_state.current_phase = game.WhichPhase.SELECTING
+    room.game_state.make_player_choice(1, game.Color.RED)
+    room.game_state.make_player_choice(2, game.Color.BLUE)
+
+    n_slow = int(n_spectators * slow_fraction)
+    gate = asyncio.Event()
+    # The slow ones accept nothing until the match is over.
+    conns = [
+        Connection(record=True, gate=gate if i < n_slow else None) for i in range(n_spectators)
+    ]
+    for conn in conns:
+        room.watch(conn, QUEUE_LIMIT).start()  # type: ignore[arg-type]
+    await asyncio.sleep(0)
+    room.update_clients()
+
+    broadcast = delivered = 0.0
+    fast = conns[n_slow:]
+    for _ in range(PLIES):
+        moves = [
+            (color, dst)
+            for color in game.Color
+            for dst in room.game_state.valid_moves(color)
+            if dst is not room.game_state.thaler_pos
+        ]
+        if not moves:
+            break
+        color, dst = rng.choice(moves)
+        player = 1 if room.game_state.current_phase == game.WhichPhase.P1_TURN else 2
+        room.game_state.make_player_move(player, color, dst)
+
+        start = time.perf_counter()
+        room.update_clients()
+        broadcast += time.perf_counter() - start
+        while any(len(conn.frames) < room.seq for conn in fast):
+            await asyncio.sleep(0)
+        delivered += time.perf_counter() - start
+
+    gate.set()
+    while any(s.frames or s.stale for s in room.spectators.values()):
+        await asyncio.sleep(0)
+    for _ in range(400):
+        await asyncio.sleep(0)
+
+    shared = {id(conn.frames[-1]) for conn in fast}
+    assert len(shared) == 1, "fast spectators were sent different frame objects"
+    assert all(final_seq(conn.frames) == room.seq for conn in conns), "spectator missed the end"
+    resyncs = sum(len(conn.frames) < room.seq for conn in conns[:n_slow])
+    for conn in conns:
+        room.unwatch(conn)  # type: ignore[arg-type]
+
+    print(
+        f"{n_spectators:>6} spectators ({n_slow} slow), {room.seq - 1} updates: "
+        f"broadcast {broadcast / (room.seq - 1) * 1e3:.2f} ms, "
+        f"all fast delivered {delivered / (room.seq - 1) * 1e3:.1f} ms, "
+        f"{resyncs} slow spectators resynced"
+    )
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    slow = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    asyncio.run(run(n, slow))
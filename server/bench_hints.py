@@ -0,0 +1,198 @@
+"""Event-loop latency under heavy hint load: process pool against inline search.
+
+Runs `--rooms` matches between in-memory players for `--seconds` each time.
+Every player thinks for a random time up to `--think`
+seconds before each move. When hinting, it asks for
+a suggestion at the start of each turn and for a rating of a third of its
+moves. The rate limit is raised so that every request is searched, which
+is more than one pool process keeps up with. A probe
+task meanwhile measures how late the loop wakes from 5 ms sleeps. The loop
+is run three ways:
+
+- without hints;
+- with hints searched in a `hints.pool` of `--workers` processes;
+- with hints searched inline on the event loop, for comparison.
+
+Reports loop lag p50/p99/max, moves applied per second and hint counts. It
+also checks that no suggestion reached a player after the position it was
+for had been broadcast as changed. Finally it shows the per-player rate
+limit turning away a burst of requests.
+
+    python bench_hints.py [--rooms 50] [--seconds 5] [--think 0.4] [--workers 1] [--budget 0.05]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import game
+import metrics
+from bench_connection import Connection
+from hints import Hints, pool
+from room import Room, RoomManager
+
+
+class Player(Connection):
+    """Counts the hints a player is sent and whether one arrived stale."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.room: Room | None = None
+        self.hints = self.ratings = self.stale = 0
+
+    def receive(self, message: str | bytes) -> None:
+        if isinstance(message, str) and message.startswith('["hint"'):
+            self.hints += 1
+            self.stale += json.loads(message)[1]["seq"] < self.room.seq  # type: ignore[union-attr]
+        elif isinstance(message, str) and message.startswith('["move_rating"'):
+            self.ratings += 1
+
+
+async def probe(lags: list[float], interval: float = 0.005) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(loop.time() - start - interval, 0.0))
+
+
+def random_move(state: game.GameState, rng: random.Random) -> str | None:
+    moves = [
+        (color, dst)
+        for color in game.Color
+        for dst in state.valid_moves(color)
+        if dst is not state.thaler_pos
+    ]
+    if not moves:
+        return None
+    color, dst = rng.choice(moves)
+    return json.dumps(["make_player_move", {"color": color.to_string(), "dst": dst.int_repr}])
+
+
+async def play(
+    manager: RoomManager,
+    rng: random.Random,
+    hinting: bool,
+    think: float,
+    until: float,
+    players: list,
+) -> int:
+    """Matches back to back in one room slot until `until`; the moves made."""
+    moves = 0
+    while time.perf_counter() < until:
+        room = manager.create_room(public=False)
+        seats = [Player(), Player()]
+        for conn in seats:
+            conn.room = room
+            manager.join(conn, room.room_id)  # type: ignore[arg-type]
+        players += seats
+        room.post(1, json.dumps(["make_player_choice", {"color": "R"}]))
+        room.post(2, json.dumps(["make_player_choice", {"color": "B"}]))
+        while time.perf_counter() < until:
+            await asyncio.sleep(0)
+            state = room.game_state
+            if state.current_phase == game.WhichPhase.GAME_ENDED:
+                break
+            which_player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+            if hinting:
+                room.post(which_player, json.dumps(["request_hint", {}]))
+            await asyncio.sleep(rng.uniform(0, think))
+            if not (move := random_move(room.game_state, rng)):
+                break
+            room.post(which_player, move)
+            moves += 1
+            if hinting and rng.random() < 0.3:
+                room.post(which_player, json.dumps(["request_hint", {"rate": True}]))
+        for conn in seats:
+            manager.leave(conn)  # type: ignore[arg-type]
+    return moves
+
+
+async def run(
+    name: str, n_rooms: int, seconds: float, think: float, hints: Hints | None
+) -> None:
+    metrics.METRICS = metrics.Metrics()
+    manager = RoomManager(hints=hints)
+    lags: list[float] = []
+    players: list[Player] = []
+    prober = asyncio.create_task(probe(lags))
+    rng = random.Random(0)
+    until = time.perf_counter() + seconds
+    moves = sum(
+        await asyncio.gather(
+            *[
+                play(manager, rng, hints is not None, think, until, players)
+                for _ in range(n_rooms)
+            ]
+        )
+    )
+    prober.cancel()
+    # Let searches that were still running finish and reach their players.
+    while hints and hints.running:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+
+    lags.sort()
+    m = metrics.METRICS
+    print(
+        f"{name:>8}: loop lag p50 {statistics.median(lags) * 1e3:6.2f} ms, "
+        f"p99 {lags[int(len(lags) * 0.99)] * 1e3:7.2f} ms, max {lags[-1] * 1e3:7.2f} ms; "
+        f"{moves / seconds:5.0f} moves/s"
+    )
+    if hints:
+        print(
+            f"{'':>8}  {m.hints} hints asked, "
+            f"{sum(p.hints for p in players)} suggestions and "
+            f"{sum(p.ratings for p in players)} ratings sent, "
+            f"{sum(m.hint_search.counts)} searched in the pool, "
+            f"{m.hints_cached} from cache, {m.hints_cancelled} dropped unstarted, "
+            f"{sum(p.stale for p in players)} stale"
+        )
+
+
+async def rate_limit(hints: Hints) -> None:
+    metrics.METRICS = metrics.Metrics()
+    manager = RoomManager(hints=hints)
+    room = manager.create_room(public=False)
+    for _ in range(2):
+        manager.join(Connection(), room.room_id)  # type: ignore[arg-type]
+    room.game_state.make_player_choice(1, game.Color.RED)
+    room.game_state.make_player_choice(2, game.Color.BLUE)
+    for _ in range(20):
+        room.post(1, json.dumps(["request_hint", {}]))
+    await asyncio.sleep(0)
+    print(
+        f"rate limit: 20 requests at once, {metrics.METRICS.hints} searched, "
+        f"{metrics.METRICS.hints_limited} refused"
+    )
+    manager.close_room(room)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--think", type=float, default=0.4, help="most seconds before a move")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--budget", type=float, default=0.05, help="seconds of search per hint")
+    args = parser.parse_args()
+
+    unlimited = dict(budget=args.budget, rate=1e6, burst=1e6)
+    asyncio.run(run("no hints", args.rooms, args.seconds, args.think, None))
+    executor = pool(args.workers)
+    # Start the pool's processes before anything is timed.
+    executor.submit(int).result()
+    for name, hints in [
+        ("pool", Hints(executor, args.workers, **unlimited)),
+        ("inline", Hints(None, **unlimited)),
+    ]:
+        asyncio.run(run(name, args.rooms, args.seconds, args.think, hints))
+    asyncio.run(rate_limit(Hints(executor, args.workers, budget=args.budget)))
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Overhead check for the metrics instrumentation and structured logging.
+
+Applies the same mix of messages through `Room.drain`, the actor's path,
+which times them, counts and logs the invalid ones and broadcasts, two ways:
+
+- instrumented: the real `Metrics`, and logging set up by `setup_logging`,
+  its queue drained by the writer thread into /dev/null;
+- bare: `NullMetrics`, which times nothing, with logging disabled.
+
+One message in `INVALID_EVERY` is an invalid action, so its counter and
+logging call are on the path too. The two are timed in alternating rounds, so drift in
+machine load hits both alike, and each round gives one ratio between them.
+Rounds are timed in process CPU time: the differences are a few hundred
+nanoseconds a message, less than what being preempted adds to wall time.
+Reports the median of those ratios as the overhead, and exits 1 if it is
+over `--threshold` (2% by default).
+
+    python bench_metrics.py [--messages 1000] [--rounds 401] [--threshold 0.02]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+import metrics
+from bench_connection import Connection
+from room import Room, RoomManager
+
+VALID = [
+    json.dumps(["request_moves", {"color": "R"}]),
+    json.dumps(["request_moves", {"color": "B"}]),
+    json.dumps(["request_snapshot", {}]),
+    json.dumps(["request_moves", {"color": "G"}]),
+]
+INVALID = json.dumps(["nonsense", {}])
+INVALID_EVERY = 100
+
+
+def seats() -> list[tuple[Room, int]]:
+    manager = RoomManager()
+    conns = [Connection() for _ in range(200)]
+    for conn in conns:
+        manager.join(conn)  # type: ignore[arg-type]
+    return [manager.route(conn) for conn in conns]  # type: ignore[arg-type, misc]
+
+
+async def apply(seated: list[tuple[Room, int]], n_messages: int) -> float:
+    """CPU seconds per message through `drain`, one message per batch."""
+    gc.disable()
+    start = time.process_time()
+    for i in range(n_messages):
+        room, which_player = seated[i % len(seated)]
+        message = INVALID if not (i + 1) % INVALID_EVERY else VALID[i % len(VALID)]
+        room.mailbox.append((which_player, message))  # type: ignore[arg-type]
+        room.drain()
+        if not (i + 1) % len(seated):
+            # Let the outboxes write, as awaiting each connection's next
+            # message would.
+            await asyncio.sleep(0)
+    elapsed = time.process_time() - start
+    gc.enable()
+    return elapsed / n_messages
+
+
+async def measure(n_messages: int, rounds: int) -> dict[str, list[float]]:
+    devnull = open(os.devnull, "w")
+    writer = metrics.setup_logging(stream=devnull)
+    modes = {"bare": metrics.NullMetrics(), "instrumented": metrics.Metrics()}
+    # One set of rooms for both: none of the messages change a game, so
+    # each mode does the same work, and on the same objects in memory.
+    seated = seats()
+    timings: dict[str, list[float]] = {name: [] for name in modes}
+    for n in range(rounds):
+        # Either order every other round, so neither always goes second.
+        for name in sorted(modes, reverse=bool(n % 2)):
+            metrics.METRICS = modes[name]
+            logging.disable(logging.CRITICAL if name == "bare" else logging.NOTSET)
+            timings[name].append(await apply(seated, n_messages))
+    logging.disable(logging.NOTSET)
+    writer.stop()
+    devnull.close()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000, help="per round")
+    parser.add_argument("--rounds", type=int, default=401)
+    parser.add_argument("--threshold", type=float, default=0.02)
+    args = parser.parse_args()
+
+    timings = asyncio.run(measure(args.messages, args.rounds))
+    ratios = [i / b for i, b in zip(timings["instrumented"], timings["bare"])]
+    overhead = statistics.median(ratios) - 1
+    for name, seconds in timings.items():
+        print(
+            f"{name:>12}: median {statistics.median(seconds) * 1e6:6.2f} us/msg, "
+            f"best {min(seconds) * 1e6:6.2f} us/msg"
+        )
+    print(
+        f"overhead: {overhead:+.2%} (median of {len(ratios)} rounds; "
+        f"quartiles {statistics.quantiles(ratios, n=4)[0] - 1:+.2%} "
+        f"to {statistics.quantiles(ratios, n=4)[2] - 1:+.2%})"
+    )
+    if overhead > args.threshold:
+        print(f"over the {args.threshold:.0%} budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Micro-benchmark for GameState.valid_moves.
+
+Compares the bitboard move generator, and `valid_moves` served from
+`MOVE_CACHE`, with `valid_moves_reference` over randomly generated
+positions, after checking they all return the same moves.
+
+    python bench_moves.py [positions]
+"""
+
+import random
+import sys
+import timeit
+
+import game
+
+
+def main(n_positions: int) -> None:
+    random.seed(0)
+    states = [game.GameState.create() for _ in range(n_positions)]
+    calls = [(state, color) for state in states for color in game.Color]
+
+    for state, color in calls:
+        assert state.valid_moves(color) == state.valid_moves_reference(color)
+        assert state.generate_moves(color) == state.valid_moves_reference(color)
+
+    def bitboard() -> None:
+        for state, color in calls:
+            state.generate_moves(color)
+
+    def cached() -> None:
+        for state, color in calls:
+            state.valid_moves(color)
+
+    def reference() -> None:
+        for state, color in calls:
+            state.valid_moves_reference(color)
+
+    for name, fn in [("reference", reference), ("bitboard", bitboard), ("cached", cached)]:
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print(f"{name:>10}: {len(calls) / best:>10.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
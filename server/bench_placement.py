@@ -0,0 +1,165 @@
+"""Thaler placement: move generation as the thaler moves, and placement games end to end.
+
+First takes `--positions` dealt boards and puts the thaler on every free cell
+of each in turn, through `place_thaler`, generating every colour's moves
+after each placement. That is the work of a player 2 weighing where to put
+it. Three ways are timed, after checking they agree:
+
+- `valid_moves_reference`, which works out each candidate's distance from
+  the thaler with `to_xy`;
+- `generate_moves`, which reads the row of `DISTANCE` for the thaler's cell;
+- `valid_moves` through `MOVE_CACHE`, which is keyed by the thaler's cell,
+  so no moves from before a placement are ever served after it.
+
+Then plays `--games` random placement games and checks that their records
+replay exactly and that `analytics` tallies them the same as a full replay.
+Finally plays placement games through `RoomManager` rooms, checking that:
+
+- only player 2 places, and never on a peg;
+- player 2 running out of time leaves the thaler where it was dealt;
+- the archive replays the games, and the store recovers a placed thaler.
+
+    python bench_placement.py [--positions 500] [--games 20000]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import analytics
+import game
+import metrics
+from bench_connection import Connection
+from bench_records import random_game
+from records import RecordWriter, read_records, write_records
+from room import RoomManager
+from store import FileStore
+
+Placing = game.WhichPhase.PLACING_THALER
+
+
+def sweep(states: list[game.GameState], moves) -> list[list[list[game.Coords]]]:
+    """Every colour's moves with the thaler on each free cell of each state."""
+    found = []
+    for state in states:
+        occupied = state.occupancy()
+        for cell in game.COORDS:
+            if occupied >> cell.int_repr & 1:
+                continue
+            state.current_phase = Placing
+            state.place_thaler(2, cell)
+            found.append([moves(state, color) for color in game.Color])
+    return found
+
+
+def placements(n_positions: int) -> None:
+    rng = random.Random(0)
+    states = [game.GameState.create(rng.getrandbits(64), placement=True) for _ in range(n_positions)]
+    ways = {
+        "reference": game.GameState.valid_moves_reference,
+        "table": game.GameState.generate_moves,
+        "cached": game.GameState.valid_moves,
+    }
+    results = {name: sweep(states, moves) for name, moves in ways.items()}
+    assert results["reference"] == results["table"] == results["cached"]
+    count = len(results["reference"])
+    print(f"{count:,} placements: every way gives the same moves")
+    for name, moves in ways.items():
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            sweep(states, moves)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:>10}: {count / best:>9,.0f} placements/s (7 colours' moves each)")
+
+
+def games(n_games: int) -> None:
+    rng = random.Random(1)
+    start = time.perf_counter()
+    played = [random_game(rng, placement=True) for _ in range(n_games)]
+    elapsed = time.perf_counter() - start
+    print(f"played {n_games:,} placement games: {n_games / elapsed:,.0f} games/s")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "games.bin"
+        write_records(path, (record for record, _ in played))
+        for (_, final), record in zip(played, read_records(path), strict=True):
+            assert record.replay().to_json_fast() == final.to_json_fast(), record
+        verified = analytics.run([path], 1, None, True)
+        assert verified == analytics.run([path], 1) and verified.games == n_games
+    print("their records replay exactly, and analytics agrees with replaying them")
+
+
+async def rooms(n_games: int) -> None:
+    rng = random.Random(2)
+    metrics.METRICS = metrics.Metrics()
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = Path(tmp) / "rooms.bin"
+        store = FileStore.open(Path(tmp) / "store")
+        manager = RoomManager(archive=RecordWriter.open(archive), store=store)
+        finals, timed_out = [], 0
+        for n in range(n_games):
+            seats = [Connection(), Connection()]
+            room, _ = manager.join(seats[0], create=True, placement=True)  # type: ignore[arg-type, misc]
+            manager.join(seats[1], room.room_id)  # type: ignore[arg-type]
+            room.process_message(1, json.dumps(["make_player_choice", {"color": "R"}]))
+            room.process_message(2, json.dumps(["make_player_choice", {"color": "B"}]))
+            state = room.game_state
+            assert state.current_phase == Placing
+            peg = state.pegs[game.Color.RED].int_repr
+            assert room.process_message(2, json.dumps(["place_thaler", {"dst": peg}]))
+            free = [c for c in range(game.BOARD_CELLS) if not state.occupancy() >> c & 1]
+            assert room.process_message(1, json.dumps(["place_thaler", {"dst": free[0]}]))
+            if n % 10 == 0:
+                dealt = state.thaler_pos
+                room.turn_expired()
+                assert state.thaler_pos is dealt and state.current_phase == game.WhichPhase.P1_TURN
+                timed_out += 1
+            else:
+                cell = rng.choice(free)
+                assert room.process_message(2, json.dumps(["place_thaler", {"dst": cell}])) is None
+                assert state.thaler_pos.int_repr == cell
+            if n == 0:
+                # Left open, for the store to recover below.
+                kept = room.room_id, state.to_json_fast()
+                continue
+            while state.current_phase in (game.WhichPhase.P1_TURN, game.WhichPhase.P2_TURN):
+                which_player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+                if not (colors := [c for c in game.Color if state.valid_moves(c)]):
+                    room.turn_expired()
+                    continue
+                color = rng.choice(colors)
+                dst = rng.choice(state.valid_moves(color))
+                message = ["make_player_move", {"color": color.to_string(), "dst": dst.int_repr}]
+                room.process_message(which_player, json.dumps(message))
+            finals.append(state)
+            for conn in seats:
+                manager.leave(conn)  # type: ignore[arg-type]
+            await asyncio.sleep(0)
+        manager.archive.close()  # type: ignore[union-attr]
+        store.close()
+        for final, record in zip(finals, read_records(archive), strict=True):
+            assert record.replay().to_json_fast() == final.to_json_fast(), record
+        recovered = FileStore.open(Path(tmp) / "store").recover()
+        assert recovered[kept[0]].to_json_fast() == kept[1]
+    print(
+        f"{len(finals)} placement games through rooms replay from the archive "
+        f"({timed_out} left the thaler where it was dealt); the store recovers placements"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--positions", type=int, default=500)
+    parser.add_argument("--games", type=int, default=20_000)
+    args = parser.parse_args()
+    placements(args.positions)
+    games(args.games)
+    asyncio.run(rooms(1_000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Seeded deals, replay fidelity and bulk throughput of the game-record format.
+
+Plays `--games` random matches from seeded boards, recording each as a
+`GameRecord`, and checks that:
+
+- the same seed always deals the same board;
+- replaying every record, after a round trip through a file, ends in exactly
+  the state the match ended in;
+- matches played through `RoomManager` rooms are archived and replay too.
+
+Then repeats the played records up to `--records`, writes them with
+`write_records` and streams them back with `read_records`, reporting
+records/s, MB/s and bytes per action, and times full replays.
+
+    python bench_records.py [--games 20000] [--records 1000000]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import game
+import metrics
+from bench_connection import Connection
+from records import (
+    GameRecord,
+    RecordWriter,
+    guess_code,
+    move_code,
+    place_code,
+    read_records,
+    write_records,
+)
+from room import RoomManager
+
+
+def random_game(
+    rng: random.Random, placement: bool = False
+) -> tuple[GameRecord, game.GameState]:
+    """A match of random moves, with a guess now and then, and its record.
+    With `placement`, player 2 first puts the thaler on a random free cell."""
+    seed = rng.getrandbits(64)
+    state = game.GameState.create(seed, placement)
+    state.current_phase = game.WhichPhase.SELECTING
+    p1, p2 = rng.choice(list(game.Color)), rng.choice(list(game.Color))
+    state.make_player_choice(1, p1)
+    state.make_player_choice(2, p2)
+    actions = bytearray()
+    if placement:
+        occupied = state.occupancy()
+        dst = rng.choice([c for c in game.COORDS if not occupied >> c.int_repr & 1])
+        actions.append(place_code(dst))
+        state.place_thaler(2, dst)
+    while state.current_phase != game.WhichPhase.GAME_ENDED:
+        which_player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+        moves = [(color, dst) for color in game.Color for dst in state.valid_moves(color)]
+        if not moves or rng.random() < 0.02:
+            color = rng.choice(list(game.Color))
+            actions.append(guess_code(color))
+            state.make_player_guess(which_player, color)
+            continue
+        color, dst = rng.choice(moves)
+        actions.append(move_code(color, state.pegs[color], dst))
+        state.make_player_move(which_player, color, dst)
+    return GameRecord(seed, p1, p2, bytes(actions)), state
+
+
+async def room_games(path: Path, n: int, rng: random.Random) -> list[game.GameState]:
+    """Play `n` matches through rooms archiving to `path`; their final states."""
+    metrics.METRICS = metrics.Metrics()
+    manager = RoomManager(archive=RecordWriter.open(path))
+    finals = []
+    for _ in range(n):
+        room = manager.create_room(public=False)
+        seats = [Connection(), Connection()]
+        for conn in seats:
+            manager.join(conn, room.room_id)  # type: ignore[arg-type]
+        room.process_message(1, json.dumps(["make_player_choice", {"color": "R"}]))
+        room.process_message(2, json.dumps(["make_player_choice", {"color": "B"}]))
+        state = room.game_state
+        while state.current_phase in (game.WhichPhase.P1_TURN, game.WhichPhase.P2_TURN):
+            which_player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+            if rng.random() < 0.05:
+                room.turn_expired()
+                continue
+            color = rng.choice([c for c in game.Color if state.valid_moves(c)])
+            dst = rng.choice(state.valid_moves(color))
+            message = ["make_player_move", {"color": color.to_string(), "dst": dst.int_repr}]
+            room.process_message(which_player, json.dumps(message))
+        finals.append(state)
+        for conn in seats:
+            manager.leave(conn)  # type: ignore[arg-type]
+        await asyncio.sleep(0)
+    manager.archive.close()  # type: ignore[union-attr]
+    return finals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=20_000)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    for seed in (0, 1, 2**64 - 1):
+        assert game.GameState.create(seed) == game.GameState.create(seed)
+    assert game.GameState.create(0) != game.GameState.create(1)
+
+    start = time.perf_counter()
+    played = [random_game(rng) for _ in range(args.games)]
+    print(f"played {len(played)} games in {time.perf_counter() - start:.1f} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "games.bin"
+        write_records(path, (record for record, _ in played))
+        start = time.perf_counter()
+        for (_, final), record in zip(played, read_records(path), strict=True):
+            assert record.replay().to_json_fast() == final.to_json_fast(), record
+        elapsed = time.perf_counter() - start
+        print(f"replayed {len(played)} games exactly: {len(played) / elapsed:,.0f} games/s")
+
+        archive = Path(tmp) / "rooms.bin"
+        finals = asyncio.run(room_games(archive, 2000, rng))
+        for final, record in zip(finals, read_records(archive), strict=True):
+            assert record.replay().to_json_fast() == final.to_json_fast(), record
+        print(f"{len(finals)} games archived by rooms replay exactly")
+
+        records = [record for record, _ in played]
+        bulk = list(itertools.islice(itertools.cycle(records), args.records))
+        start = time.perf_counter()
+        write_records(path, bulk)
+        written = time.perf_counter() - start
+        size = path.stat().st_size
+        actions = sum(len(record.actions) for record in bulk)
+        start = time.perf_counter()
+        count = sum(1 for _ in read_records(path))
+        read = time.perf_counter() - start
+        assert count == len(bulk)
+    print(
+        f"{len(bulk):,} records, {actions:,} actions: {size / 1e6:.1f} MB, "
+        f"{size / len(bulk):.1f} bytes/record: 1 byte/action and "
+        f"{(size - 5 - actions) / len(bulk):.0f} bytes of length, seed and colours"
+    )
+    print(f"write: {len(bulk) / written:,.0f} records/s, {size / written / 1e6:.0f} MB/s")
+    print(f"read:  {len(bulk) / read:,.0f} records/s, {size / read / 1e6:.0f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Load benchmark for RoomManager.
+
+Reports rooms/s created (two players matched into each room) and messages/s
+routed through `RoomManager.route` into `Room.process_message`, using
+in-memory connections instead of real sockets. Then churns the rooms, each
+with a spectator, and checks that closing them leaves nothing running.
+
+    python bench_rooms.py [room counts...]
+"""
+
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from bench_connection import Connection
+from room import RoomManager
+
+
+async def run(n_rooms: int) -> None:
+    # No grace window, so leaving frees a seat at once, as the churn below expects.
+    manager = RoomManager(grace_timeout=0)
+    conns = [Connection() for _ in range(n_rooms * 2)]
+
+    start = time.perf_counter()
+    for conn in conns:
+        manager.join(conn)  # type: ignore[arg-type]
+    created = time.perf_counter() - start
+    assert len(manager.rooms) == n_rooms and not manager.open_rooms
+
+    message = json.dumps(["request_moves", {"color": "R"}])
+    start = time.perf_counter()
+    for conn in conns:
+        seat = manager.route(conn)  # type: ignore[arg-type]
+        assert seat is not None
+        room, which_player = seat
+        room.process_message(which_player, message)
+        room.update_clients()
+    routed = time.perf_counter() - start
+
+    # A spectator in every room, still watching when its players leave.
+    spectators = []
+    for room in list(manager.rooms.values()):
+        spectator = manager.watch(conn := Connection(), room.room_id)
+        spectator.start()  # type: ignore[union-attr]
+        spectators.append((conn, spectator))
+    await asyncio.sleep(0)
+
+    tracemalloc.start()
+    for conn in conns:
+        manager.leave(conn)  # type: ignore[arg-type]
+    for conn in conns:
+        manager.join(conn)  # type: ignore[arg-type]
+    for conn in conns:
+        manager.leave(conn)  # type: ignore[arg-type]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert not manager.rooms and not manager.seats and not manager.open_rooms
+    for conn, _ in spectators:
+        manager.leave(conn)  # type: ignore[arg-type]
+    await asyncio.sleep(0)
+    running = [s for _, s in spectators if not s.task.done()]  # type: ignore[union-attr]
+    assert not running, f"{len(running)} spectators of closed rooms still running"
+
+    print(
+        f"{n_rooms:>6} rooms: "
+        f"{n_rooms / created:>10.0f} rooms/s created, "
+        f"{len(conns) / routed:>8.0f} msgs/s routed, "
+        f"churn peak {peak / 1024 / 1024:.1f} MiB, "
+        f"{len(manager.rooms)} rooms left"
+    )
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000]
+    for n in counts:
+        asyncio.run(run(n))
@@ -0,0 +1,324 @@
+"""Reconnect storm: `--clients` players drop at once and resume with their tokens.
+
+Drives `handle_connection` itself over in-memory sockets. Each pair of
+clients is matched into a room and picks colours. Then:
+
+1. every player 2 drops, and player 1 makes a move, which player 2 misses;
+2. every player 1 drops too, so all the seats are held in their grace
+   window;
+3. every client reconnects at once with its token and the last sequence
+   number it saw.
+
+It checks that each client gets its seat back, is sent exactly the frames
+it missed (no snapshot), and ends up on its room's state with unbroken
+sequence numbers. It also checks that a made-up token is refused, and that
+a seat whose player never comes back is released when the grace window
+ends, and that a player who missed more frames than are kept gets a
+snapshot instead of being disconnected for falling behind. Reports reconnects/s, latency percentiles and the bytes sent per
+resume against a snapshot. Finally it times the token lookup and the whole
+of `reconnect` at a range of session counts. The lookup is one dict probe;
+what growth there is comes from cache misses, not the number of sessions
+searched.
+
+    python bench_sessions.py [--clients 50000]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import statistics
+import time
+
+import websockets
+
+import game
+import metrics
+from bench_connection import Connection
+from room import HISTORY, RoomManager, handler
+
+
+class Socket(Connection):
+    """A connection whose client side is a queue of messages to receive."""
+
+    def __init__(self, client: "Client") -> None:
+        super().__init__()
+        self.client = client
+        self.inbox: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def recv(self) -> str:
+        if (message := await self.inbox.get()) is None:
+            raise websockets.exceptions.ConnectionClosed(None, None)
+        return message
+
+    def receive(self, message: str | bytes) -> None:
+        if self.client.socket is self:
+            self.client.receive(message)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        await super().close(code, reason)
+        self.inbox.put_nowait(None)
+
+
+class Client:
+    """Follows its room's state from frames, the way `game.js` does."""
+
+    # Replies to `reconnect` received by every client, either way.
+    answered = 0
+
+    def __init__(self) -> None:
+        self.socket: Socket | None = None
+        self.token = self.room_id = None
+        self.you_are = 0
+        self.seq = 0
+        self.pegs: dict[str, int] = {}
+        self.phase = ""
+        self.gaps = self.snapshots = self.replayed = 0
+        self.resumed = asyncio.Event()
+        self.reconnected_at = 0.0
+        self.resume_bytes = 0
+        self.resuming = False
+
+    def receive(self, message: str | bytes) -> None:
+        data = json.loads(message)
+        if self.resuming:
+            self.resume_bytes += len(message)
+        if isinstance(data, dict):
+            self.seq, self.pegs = data["seq"], data["pegs"]
+            self.phase = data["current_phase"]
+            self.snapshots += self.resuming
+        elif data[0] == "game_state_patch":
+            patch = data[1]
+            self.gaps += patch["seq"] != self.seq + 1
+            self.seq = patch["seq"]
+            self.pegs.update(patch.get("pegs", {}))
+            self.phase = patch.get("current_phase", self.phase)
+            self.replayed += self.resuming
+        elif data[0] == "hello_okay":
+            self.token, self.room_id = data[1]["token"], data[1]["room"]
+            self.you_are = data[1]["you_are"]
+        elif data[0] == "reconnect_success":
+            self.reconnected_at = time.perf_counter()
+            self.resumed.set()
+            Client.answered += 1
+        elif data[0] == "try_again":
+            self.resumed.set()
+            Client.answered += 1
+
+    def connect(self, manager: RoomManager, first: list) -> asyncio.Task:
+        self.socket = Socket(self)
+        self.socket.inbox.put_nowait(json.dumps(first))
+        return asyncio.create_task(handler(manager)(self.socket))  # type: ignore[arg-type]
+
+    def send(self, action: str, **data) -> None:
+        self.socket.inbox.put_nowait(json.dumps([action, data]))  # type: ignore[union-attr]
+
+    def drop(self) -> None:
+        self.socket.inbox.put_nowait(None)  # type: ignore[union-attr]
+        self.socket = None
+
+
+async def settle() -> None:
+    """Let every task run until nothing is left to do."""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def move(manager: RoomManager, client: Client) -> bool:
+    """Post a legal move for `client`, if it is their turn."""
+    state = manager.rooms[client.room_id].game_state  # type: ignore[index]
+    turn = game.WhichPhase.P1_TURN if client.you_are == 1 else game.WhichPhase.P2_TURN
+    if state.current_phase != turn:
+        return False
+    for color in game.Color:
+        for dst in state.valid_moves(color):
+            if dst is not state.thaler_pos:
+                client.send("make_player_move", color=color.to_string(), dst=dst.int_repr)
+                return True
+    return False
+
+
+async def storm(n_clients: int) -> None:
+    metrics.METRICS = metrics.Metrics()
+    manager = RoomManager(grace_timeout=3600, turn_timeout=3600, idle_timeout=3600)
+    clients = [Client() for _ in range(n_clients)]
+    for i in range(0, n_clients, 2):
+        clients[i].connect(manager, ["hello", {"create": True}])
+        await settle()
+        clients[i + 1].connect(manager, ["hello", {"room": clients[i].room_id}])
+    await settle()
+    pairs = list(zip(clients[::2], clients[1::2]))
+    for p1, p2 in pairs:
+        p1.send("make_player_choice", color="R")
+        p2.send("make_player_choice", color="B")
+    await settle()
+    assert all(c.phase == "P1 Turn" for c in clients), "setup didn't reach P1's turn"
+
+    for _, p2 in pairs:
+        p2.drop()
+    await settle()
+    for p1, _ in pairs:
+        assert move(manager, p1)
+    await settle()
+    for p1, _ in pairs:
+        p1.drop()
+    await settle()
+    held = sum(room.held(1) and room.held(2) for room in manager.rooms.values())
+    assert held == len(pairs) and len(manager.seats) == 0, (held, len(manager.seats))
+    missed = [manager.rooms[c.room_id].seq - c.seq for c in clients]  # type: ignore[index]
+    snapshot = len(manager.rooms[clients[0].room_id].snapshot(1))  # type: ignore[index]
+
+    for c in clients:
+        c.resuming = True
+    Client.answered = 0
+    start = time.perf_counter()
+    for c in clients:
+        c.connect(
+            manager, ["reconnect", {"token": c.token, "room": c.room_id, "seq": c.seq}]
+        )
+    while Client.answered < n_clients:
+        await asyncio.sleep(0)
+    await settle()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(c.reconnected_at - start for c in clients)
+    for c, m in zip(clients, missed):
+        room = manager.rooms[c.room_id]  # type: ignore[index]
+        assert c.reconnected_at, "a client was refused"
+        assert c.replayed == m and not c.snapshots, (c.replayed, c.snapshots, m)
+        assert c.gaps == 0 and c.seq == room.seq
+        assert c.pegs == {k.to_string(): v.int_repr for k, v in room.game_state.pegs.items()}
+    resume_bytes = statistics.mean(c.resume_bytes for c in clients)
+    print(
+        f"{n_clients:,} clients resumed in {elapsed:.2f} s ({n_clients / elapsed:,.0f}/s); "
+        f"latency p50 {latencies[len(latencies) // 2] * 1e3:.0f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.0f} ms"
+    )
+    print(
+        f"missed frames per client: {statistics.mean(missed):.1f}, all replayed "
+        f"with no gaps and no snapshots; {resume_bytes:.0f} bytes sent per resume "
+        f"(a snapshot alone is {snapshot} bytes)"
+    )
+
+    stranger = Client()
+    stranger.resuming = True
+    stranger.connect(manager, ["reconnect", {"token": "made-up", "room": clients[0].room_id}])
+    await stranger.resumed.wait()
+    assert not stranger.reconnected_at
+    print("made-up token refused")
+
+
+async def long_gap() -> None:
+    """A player who missed the whole of `history` is sent a snapshot, rather
+    than more frames than their outbox takes, and stays connected."""
+    metrics.METRICS = metrics.Metrics()
+    manager = RoomManager(grace_timeout=3600, turn_timeout=3600, idle_timeout=3600)
+    p1, p2 = Client(), Client()
+    p1.connect(manager, ["hello", {"create": True}])
+    await settle()
+    p2.connect(manager, ["hello", {"room": p1.room_id}])
+    await settle()
+    p1.send("make_player_choice", color="R")
+    p2.send("make_player_choice", color="B")
+    await settle()
+    room = manager.rooms[p1.room_id]  # type: ignore[index]
+    p2.drop()
+    await settle()
+    turns = game.WhichPhase.P1_TURN, game.WhichPhase.P2_TURN
+    while room.seq - p2.seq < HISTORY:
+        # Frames p2 misses, without the game having to last that many moves.
+        state = room.game_state
+        state.current_phase = turns[state.current_phase == turns[0]]
+        room.encode_update()
+    assert room.seq - p2.seq == len(room.history) == HISTORY
+    p2.resuming = True
+    p2.connect(manager, ["reconnect", {"token": p2.token, "room": p2.room_id, "seq": p2.seq}])
+    await asyncio.wait_for(p2.resumed.wait(), 5)
+    await settle()
+    assert p2.reconnected_at and p2.snapshots == 1 and not p2.replayed
+    assert p2.socket and p2.seq == room.seq and room.outboxes
+    print(f"missing all {HISTORY} frames in history gets a snapshot, not a disconnect")
+
+
+def lookup(n_sessions: int, tries: int = 20_000) -> tuple[float, float]:
+    """Seconds per token lookup, and per whole `reconnect` (which also
+    replaces the seat's outbox task), with `n_sessions` live."""
+
+    async def run() -> tuple[float, float]:
+        metrics.METRICS = metrics.Metrics()
+        manager = RoomManager(grace_timeout=3600)
+        sockets = []
+        for _ in range(n_sessions // 2):
+            room = manager.create_room(public=False)
+            for _ in range(2):
+                socket = Socket(Client())
+                socket.client.socket = socket
+                manager.join(socket, room.room_id)  # type: ignore[arg-type]
+                sockets.append(socket)
+        tokens = list(manager.sessions)
+        # Keep the collector from walking every room and session mid-timing.
+        gc.collect()
+        gc.freeze()
+        start = time.perf_counter()
+        for i in range(tries * 10):
+            manager.sessions.get(tokens[i * 7919 % len(tokens)])
+        found = (time.perf_counter() - start) / (tries * 10)
+        elapsed = 0.0
+        for batch in range(0, tries, 1000):
+            start = time.perf_counter()
+            for i in range(batch, batch + 1000):
+                socket = Socket(Client())
+                session = manager.reconnect(socket, tokens[i * 7919 % len(tokens)])  # type: ignore[arg-type]
+                assert session is not None
+            elapsed += time.perf_counter() - start
+            # Let the replaced connections' outboxes wind down.
+            await settle()
+        gc.unfreeze()
+        return found, elapsed / tries
+
+    return asyncio.run(run())
+
+
+async def grace() -> None:
+    """A player who never comes back loses the seat when the window ends."""
+    metrics.METRICS = metrics.Metrics()
+    manager = RoomManager(grace_timeout=0.3)
+    manager.timers.tick = 0.05
+    wheel = asyncio.create_task(manager.timers.run())
+    p1, p2 = Client(), Client()
+    p1.connect(manager, ["hello", {"create": True}])
+    await settle()
+    p2.connect(manager, ["hello", {"room": p1.room_id}])
+    await settle()
+    room = manager.rooms[p1.room_id]  # type: ignore[index]
+    p2.drop()
+    await settle()
+    assert room.held(2) and room.free_seat() is None
+    await asyncio.sleep(0.6)
+    assert not room.held(2) and room.free_seat() == 2 and p2.token not in manager.sessions
+    p1.drop()
+    await settle()
+    assert room.held(1)
+    await asyncio.sleep(0.6)
+    assert room.room_id not in manager.rooms and not manager.sessions
+    wheel.cancel()
+    print(f"seats released after the grace window ({metrics.METRICS.sessions_expired} expired)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50_000)
+    args = parser.parse_args()
+    asyncio.run(storm(args.clients))
+    asyncio.run(grace())
+    asyncio.run(long_gap())
+    for n in (1_000, 10_000, 100_000):
+        found, reconnect = lookup(n)
+        print(
+            f"{n:>7,} sessions: token lookup {found * 1e9:4.0f} ns, "
+            f"whole reconnect {reconnect * 1e6:5.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Cold-start import time for the modules short-lived processes load.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for
+each module, best of N runs, and reports the module's cumulative import time
+and the share of it spent in dataclasses_json and marshmallow, which should
+now be zero until something first calls `to_json`. Finishes by timing that
+first call, which is where the import cost has moved to.
+
+    python bench_startup.py [runs] [modules...]
+"""
+
+import subprocess
+import sys
+
+MODULES = ["game", "wire", "bot", "room", "workers"]
+SERIALIZER = ("dataclasses_json", "marshmallow")
+
+
+def import_times(statement: str) -> dict[str, int]:
+    """Cumulative import time in microseconds of each top-level import."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(runs: int, modules: list[str]) -> None:
+    print(f"{'module':>10}  {'import ms':>9}  {'serializer ms':>13}")
+    for module in modules:
+        best, serializer = float("inf"), 0
+        for _ in range(runs):
+            times = import_times(f"import {module}")
+            if times[module] < best:
+                best = times[module]
+                # marshmallow is normally imported by, and counted in, dataclasses_json.
+                serializer = max(times.get(name, 0) for name in SERIALIZER)
+        print(f"{module:>10}  {best / 1e3:>9.1f}  {serializer / 1e3:>13.1f}")
+
+    first_call = min(
+        int(
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    "import time, game; s = game.GameState.create(); "
+                    "t = time.perf_counter(); s.to_json(); "
+                    "print(round((time.perf_counter() - t) * 1e6))",
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        )
+        for _ in range(runs)
+    )
+    print(f"first GameState.to_json() call: {first_call / 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    main(runs, sys.argv[2:] or MODULES)
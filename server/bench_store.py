@@ -0,0 +1,101 @@
+"""Benchmark for the write-ahead log store.
+
+Plays a few random moves in each of N rooms while logging them to a
+`FileStore`, snapshotting halfway. Reports append throughput (including
+batched fsyncs), snapshot time and how long recovery takes, and checks the
+recovered rooms match the live ones.
+
+    python bench_store.py [--rooms 100000] [--moves 6]
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+
+import game
+from store import FileStore
+
+
+def simulate(room_id: str, rooms: dict[str, game.GameState], moves: int) -> list:
+    """Play a room's opening; return the store calls that log it, for timing later."""
+    log: list = []
+    state = rooms[room_id] = game.GameState.create()
+    initial = game.GameState.from_dict_fast(json.loads(state.to_json_fast()))
+    log.append(lambda store: store.created(room_id, initial))
+    state.current_phase = game.WhichPhase.SELECTING
+    log.append(lambda store: store.phase(room_id, game.WhichPhase.SELECTING))
+    for player in (1, 2):
+        color = random.choice(list(game.Color))
+        state.make_player_choice(player, color)
+        log.append(
+            lambda store, p=player, c=color: store.action(
+                room_id, p, "make_player_choice", c
+            )
+        )
+    for _ in range(moves):
+        if state.game_ended_state != "Not_yet":
+            break
+        player = 1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+        options = [(c, d) for c in game.Color for d in state.valid_moves(c)]
+        if not options:
+            break
+        color, dst = random.choice(options)
+        state.make_player_move(player, color, dst)
+        log.append(
+            lambda store, p=player, c=color, d=dst: store.action(
+                room_id, p, "make_player_move", c, d
+            )
+        )
+    return log
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--moves", type=int, default=6, help="random moves per room")
+    args = parser.parse_args()
+    random.seed(0)
+
+    rooms: dict[str, game.GameState] = {}
+    actions = [simulate(f"room{i}", rooms, args.moves) for i in range(args.rooms)]
+    records = sum(len(a) for a in actions)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = FileStore.open(directory)
+        half = len(actions) // 2
+        start = time.perf_counter()
+        for log in actions[:half]:
+            for record in log:
+                record(store)
+        store.flush()
+        appending = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store.snapshot({room_id: rooms[room_id] for room_id in list(rooms)[:half]})
+        snapshotting = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for log in actions[half:]:
+            for record in log:
+                record(store)
+        store.flush()
+        appending += time.perf_counter() - start
+        store.close()
+
+        start = time.perf_counter()
+        recovered = FileStore.open(directory).recover()
+        recovering = time.perf_counter() - start
+
+    assert recovered.keys() == rooms.keys()
+    for room_id, state in rooms.items():
+        assert recovered[room_id].to_json_fast() == state.to_json_fast(), room_id
+
+    print(f"append:   {records / appending:>10.0f} records/s ({records} records)")
+    print(f"snapshot: {snapshotting:>10.2f} s for {args.rooms // 2} rooms")
+    print(f"recover:  {recovering:>10.2f} s for {len(recovered)} rooms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Generation time, size, consistency and lookup latency of the endgame tablebase.
+
+Generates the tablebase (or opens `--path` if it exists), then samples
+random positions with all pegs near the thaler as `GameState`s. For each,
+it checks that the stored value agrees with the values of its moves, which
+are generated by `GameState.generate_moves` rather than the solver's own
+tables:
+
+- won positions have a move that wins;
+- lost positions have moves, and every one of them loses;
+- drawn positions have neither.
+
+Finally reports the latency of a probe from raw cells, from a `GameState`,
+and of rating every move of a position, plus the time to unpack a whole
+zone from the mapping.
+
+    python bench_tablebase.py [--distance 2] [--path tablebase.bin] [--samples 20000]
+"""
+
+import argparse
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+
+import game
+import tablebase
+from tablebase import DRAW, LOSS, OUTCOMES, WIN, Tablebase
+
+
+def sample(rng: random.Random, distance: int) -> game.GameState:
+    """A random running game with every peg within `distance` of the thaler."""
+    while True:
+        thaler = rng.randrange(game.BOARD_CELLS)
+        cells = tablebase.zone_cells(thaler, distance)
+        if len(cells) >= tablebase.PEGS:
+            break
+    pegs = rng.sample(cells, tablebase.PEGS)
+    p1, p2 = rng.sample(list(game.Color), 2)
+    return game.GameState(
+        pegs={color: game.Coords(cell) for color, cell in zip(game.Color, pegs)},
+        thaler_pos=game.Coords(thaler),
+        current_phase=rng.choice([game.WhichPhase.P1_TURN, game.WhichPhase.P2_TURN]),
+        p1_color=p1,
+        p2_color=p2,
+    )
+
+
+def check(table: Tablebase, states: list[game.GameState]) -> dict[int, int]:
+    seen = dict.fromkeys(OUTCOMES, 0)
+    for state in states:
+        value = table.probe(state)
+        rated = table.rate_moves(state)
+        moves = sum(len(state.generate_moves(color)) for color in game.Color)
+        assert value is not None and len(rated) == moves, state
+        outcomes = set(rated.values())
+        if value == WIN:
+            assert WIN in outcomes, state
+        elif value == LOSS:
+            assert outcomes == {LOSS}, state
+        else:
+            assert WIN not in outcomes and outcomes != {LOSS}, state
+        seen[value] += 1
+    return seen
+
+
+def per_call(function, items: list) -> float:
+    start = time.perf_counter()
+    for item in items:
+        function(*item)
+    return (time.perf_counter() - start) / len(items)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--distance", type=int, default=2)
+    parser.add_argument("--path", type=Path, default=Path("tablebase.bin"))
+    parser.add_argument("--samples", type=int, default=20_000)
+    args = parser.parse_args()
+
+    if not args.path.exists():
+        start = time.perf_counter()
+        tablebase.generate(args.distance, args.path)
+        print(f"generated in {time.perf_counter() - start:.1f} s")
+    table = Tablebase.open(args.path)
+    positions = sum(size for _, _, size in table.entries.values())
+    size = args.path.stat().st_size
+    print(
+        f"{args.path}: distance {table.distance}, {positions} positions, "
+        f"{size} bytes ({size * 8 / positions:.2f} bits/position)"
+    )
+
+    rng = random.Random(0)
+    states = [sample(rng, table.distance) for _ in range(args.samples)]
+    seen = check(table, states)
+    print(
+        f"{len(states)} sampled positions agree with their moves: "
+        + ", ".join(f"{seen[value]} {OUTCOMES[value]}" for value in (WIN, LOSS, DRAW))
+    )
+
+    raw = []
+    for state in states:
+        mover, other = Tablebase.colors(state)  # type: ignore[misc]
+        pegs = [peg.int_repr for peg in state.pegs.values()]
+        raw.append((state.thaler_pos.int_repr, pegs, mover, other))
+    print(f"probe_pegs: {per_call(table.probe_pegs, raw) * 1e6:.2f} us")
+    print(f"probe:      {per_call(table.probe, [(s,) for s in states]) * 1e6:.2f} us")
+    print(f"rate_moves: {per_call(table.rate_moves, [(s,) for s in states]) * 1e6:.2f} us")
+
+    shape = max(table.entries, key=lambda shape: table.entries[shape][2])
+    start = time.perf_counter()
+    values = table.values(shape)
+    counts = np.bincount(values, minlength=3)
+    print(
+        f"unpacked zone {shape} ({values.size} positions) in "
+        f"{(time.perf_counter() - start) * 1e3:.1f} ms: "
+        + ", ".join(f"{counts[value]} {OUTCOMES[value]}" for value in (WIN, LOSS, DRAW))
+    )
+    table.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Timer overhead at scale: the timer wheel against one loop timer per deadline.
+
+Tracks N rooms through a `RoomManager`, so each gets a turn clock and an
+idle deadline on the wheel, and then simulates play. Each tick a share of
+rooms make a move, which pushes both deadlines back. Rooms that fall silent
+forfeit and later expire. Reports the cost of setting rooms up, of each
+per-move reset, and of each wheel tick, plus memory per room. The same
+deadlines are then kept as `loop.call_later` handles, cancelled and
+re-created on every move, for comparison.
+
+    python bench_timers.py [--rooms 100000] [--seconds 120]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+import game
+from room import Room, RoomManager
+
+TURN_TIMEOUT = 30.0
+IDLE_TIMEOUT = 60.0
+MEMORY_SAMPLE = 10_000
+
+
+def traced(allocate) -> float:
+    """Bytes per item still allocated after `allocate()` builds MEMORY_SAMPLE of them."""
+    tracemalloc.start()
+    kept = allocate()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return memory / MEMORY_SAMPLE
+
+
+def start_match(state: game.GameState) -> None:
+    state.current_phase = game.WhichPhase.SELECTING
+    state.make_player_choice(1, game.Color.RED)
+    state.make_player_choice(2, game.Color.BLUE)
+
+
+def bench_wheel(n_rooms: int, seconds: float, move_rate: float) -> None:
+    manager = RoomManager(turn_timeout=TURN_TIMEOUT, idle_timeout=IDLE_TIMEOUT)
+    rooms = [Room(game.GameState.create(), room_id=f"room{i}") for i in range(n_rooms)]
+    for room in rooms:
+        start_match(room.game_state)
+        manager.rooms[room.room_id] = room
+    start = time.perf_counter()
+    for room in rooms:
+        manager.track(room)
+    setup = time.perf_counter() - start
+    sample = [Room(game.GameState.create()) for _ in range(MEMORY_SAMPLE)]
+    memory = traced(lambda: [manager.track(room) for room in sample])
+    for room in sample:
+        manager.close_room(room)
+
+    rng = random.Random(0)
+    ticks = round(seconds / manager.timers.tick)
+    # A fifth of the rooms go quiet and are left to time out.
+    active = rooms[: n_rooms * 4 // 5]
+    resets = fired = 0
+    reset_time = tick_time = 0.0
+    for _ in range(ticks):
+        movers = rng.sample(active, int(len(active) * move_rate * manager.timers.tick))
+        movers = [room for room in movers if room.room_id in manager.rooms]
+        start = time.perf_counter()
+        for room in movers:
+            # What perform() does for a valid move: touch, and hand the turn over.
+            room.touch()
+            room.game_state.progress_game_state()
+            room.run_turn_clock()
+        reset_time += time.perf_counter() - start
+        resets += len(movers)
+        start = time.perf_counter()
+        fired += manager.timers.advance()
+        tick_time += time.perf_counter() - start
+
+    forfeited = sum(room.game_state.current_phase == game.WhichPhase.GAME_ENDED for room in rooms)
+    print(
+        f"wheel:      setup {setup / n_rooms * 1e6:.2f} us/room, "
+        f"{memory:.0f} B/room, "
+        f"reset {reset_time / resets * 1e6:.2f} us/move, "
+        f"tick {tick_time / ticks * 1e3:.2f} ms ({fired} fired, {forfeited} forfeits, "
+        f"{len(manager.rooms)} rooms left)"
+    )
+
+
+async def bench_call_later(n_rooms: int, seconds: float, move_rate: float) -> None:
+    """The same deadlines as two `call_later` handles per room, replaced on each move."""
+    loop = asyncio.get_running_loop()
+    def schedule(n: int) -> list[list[asyncio.TimerHandle]]:
+        return [
+            [loop.call_later(TURN_TIMEOUT, lambda: None), loop.call_later(IDLE_TIMEOUT, lambda: None)]
+            for _ in range(n)
+        ]
+
+    memory = traced(lambda: schedule(MEMORY_SAMPLE))
+    start = time.perf_counter()
+    handles = schedule(n_rooms)
+    setup = time.perf_counter() - start
+
+    rng = random.Random(0)
+    tick = 0.1
+    active = handles[: n_rooms * 4 // 5]
+    resets = 0
+    reset_time = 0.0
+    for _ in range(round(seconds / tick)):
+        movers = rng.sample(active, int(len(active) * move_rate * tick))
+        start = time.perf_counter()
+        for pair in movers:
+            for i, delay in enumerate((TURN_TIMEOUT, IDLE_TIMEOUT)):
+                pair[i].cancel()
+                pair[i] = loop.call_later(delay, lambda: None)
+        reset_time += time.perf_counter() - start
+        resets += len(movers)
+    print(
+        f"call_later: setup {setup / n_rooms * 1e6:.2f} us/room, "
+        f"{memory:.0f} B/room, "
+        f"reset {reset_time / resets * 1e6:.2f} us/move, "
+        f"{len(loop._scheduled)} handles in the loop's heap"  # type: ignore[attr-defined]
+    )
+    for pair in handles:
+        for handle in pair:
+            handle.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=120.0, help="simulated time")
+    parser.add_argument(
+        "--move-rate", type=float, default=0.2, help="moves per active room per second"
+    )
+    args = parser.parse_args()
+    bench_wheel(args.rooms, args.seconds, args.move_rate)
+    asyncio.run(bench_call_later(args.rooms, args.seconds, args.move_rate))
+
+
+if __name__ == "__main__":
+    main()
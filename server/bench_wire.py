@@ -0,0 +1,108 @@
+"""Bytes and CPU per message for the JSON and binary wire formats.
+
+Covers the four messages on the hot path: a state update sent to a player,
+the `valid_moves` reply, and the `request_moves` and `make_player_move`
+actions. Each is encoded (server side for state and moves, client side for
+actions) and decoded (the other side) in both formats, after checking the
+binary frames round-trip.
+
+    python bench_wire.py [messages]
+"""
+
+import json
+import random
+import sys
+import time
+
+import game
+import wire
+from room import GameStateForClient, client_view, state_patch
+
+
+def sample_positions(n: int) -> list[tuple[game.GameState, game.Color, list[game.Coords]]]:
+    random.seed(0)
+    positions = []
+    while len(positions) < n:
+        state = game.GameState.create()
+        state.current_phase = random.choice([game.WhichPhase.P1_TURN, game.WhichPhase.P2_TURN])
+        color = random.choice(list(game.Color))
+        if moves := state.generate_moves(color):
+            positions.append((state, color, moves))
+    return positions
+
+
+def timed(n: int, fn) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def main(n: int) -> None:
+    positions = sample_positions(1000)
+    for state, color, moves in positions:
+        seq, pegs, thaler, phase = wire.decode_state(wire.encode_state(state, 7))
+        assert (seq, pegs, thaler, phase) == (7, state.pegs, state.thaler_pos, state.current_phase)
+        assert wire.decode_moves(wire.encode_moves(moves)) == sorted(m.int_repr for m in moves)
+        frame = wire.encode_action("make_player_move", color, moves[0].int_repr)
+        assert wire.decode_action(frame) == ("make_player_move", color, moves[0])
+
+    state, color, moves = positions[0]
+    dst = moves[0]
+    after = game.GameState(dict(state.pegs), state.thaler_pos, state.current_phase)
+    after.pegs[color] = dst
+    # One peg moved: the usual update once a match is running.
+    patch = state_patch(client_view(state), client_view(after))
+
+    messages = {
+        "state update": (
+            lambda: json.dumps(["game_state_patch", {"seq": 7, **patch}]),
+            json.loads,
+            lambda: wire.encode_state(after, 7),
+            wire.decode_state,
+        ),
+        "state snapshot": (
+            lambda: GameStateForClient.encode_for_players(after, 7)[0],
+            json.loads,
+            lambda: wire.encode_state(after, 7),
+            wire.decode_state,
+        ),
+        "valid_moves": (
+            lambda: json.dumps(["valid_moves", {"moves": [m.int_repr for m in moves]}]),
+            json.loads,
+            lambda: wire.encode_moves(moves),
+            wire.decode_moves,
+        ),
+        "request_moves": (
+            lambda: json.dumps(["request_moves", {"color": color.to_string()}]),
+            json.loads,
+            lambda: wire.encode_action("request_moves", color),
+            wire.decode_action,
+        ),
+        "make_player_move": (
+            lambda: json.dumps(["make_player_move", {"color": color.to_string(), "dst": dst.int_repr}]),
+            json.loads,
+            lambda: wire.encode_action("make_player_move", color, dst.int_repr),
+            wire.decode_action,
+        ),
+    }
+
+    print(f"{'':>16}  {'bytes':^12}  {'encode us':^12}  {'decode us':^12}")
+    print(f"{'message':>16}" + f"  {'json':>5} {'bin':>6}" * 3)
+    for name, (json_encode, json_decode, binary_encode, binary_decode) in messages.items():
+        text, frame = json_encode(), binary_encode()
+        costs = [
+            timed(n, json_encode),
+            timed(n, binary_encode),
+            timed(n, lambda: json_decode(text)),
+            timed(n, lambda: binary_decode(frame)),
+        ]
+        print(
+            f"{name:>16}  {len(text.encode()):>5} {len(frame):>6}"
+            f"  {costs[0] * 1e6:>5.2f} {costs[1] * 1e6:>6.2f}"
+            f"  {costs[2] * 1e6:>5.2f} {costs[3] * 1e6:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
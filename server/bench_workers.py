@@ -0,0 +1,121 @@
+"""Throughput benchmark for the multi-process server.
+
+Starts `workers.py` with 1, 2, 4 and 8 workers. For each, client processes
+open pairs of players: one creates a room, the other joins it by ID through
+the shared port (following a `redirect` when it lands on the wrong worker).
+Every player then sends `request_moves` in a loop for a fixed time. Reports
+total messages/s per worker count.
+
+    python bench_workers.py [--clients 8] [--rooms 50] [--seconds 5]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+HOST = "127.0.0.1"
+
+
+async def connect_player(port: int, hello: dict) -> tuple[websockets.ClientConnection, dict]:
+    ws = await websockets.connect(f"ws://{HOST}:{port}")
+    await ws.send(json.dumps(["hello", hello]))
+    while True:
+        header, content = json.loads(await ws.recv())
+        if header == "redirect":
+            await ws.close()
+            return await connect_player(content["port"], {"room": content["room"]})
+        if header == "hello_okay":
+            return ws, content
+
+
+async def drain(ws: websockets.ClientConnection) -> None:
+    try:
+        while True:
+            await asyncio.wait_for(ws.recv(), timeout=0.2)
+    except (TimeoutError, websockets.exceptions.ConnectionClosed):
+        pass
+
+
+def is_reply(frame: list | dict) -> bool:
+    return isinstance(frame, list) and frame[0] == "valid_moves"
+
+
+async def play(ws: websockets.ClientConnection, until: float) -> int:
+    message = json.dumps(["request_moves", {"color": "R"}])
+    count = 0
+    while time.monotonic() < until:
+        await ws.send(message)
+        while not is_reply(json.loads(await ws.recv())):
+            pass
+        count += 1
+    return count
+
+
+async def client(port: int, rooms: int, seconds: float) -> int:
+    players = []
+    for _ in range(rooms):
+        first, hello = await connect_player(port, {"create": True})
+        second, _ = await connect_player(port, {"room": hello["room"]})
+        players += [first, second]
+    await asyncio.gather(*[drain(ws) for ws in players])
+    until = time.monotonic() + seconds
+    counts = await asyncio.gather(*[play(ws, until) for ws in players])
+    await asyncio.gather(*[ws.close() for ws in players])
+    return sum(counts)
+
+
+def run_client(args: tuple[int, int, float]) -> int:
+    return asyncio.run(client(*args))
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex((HOST, port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def bench(workers: int, clients: int, rooms: int, seconds: float, port: int) -> None:
+    server = subprocess.Popen(
+        [sys.executable, "workers.py", "--workers", str(workers), "--host", HOST,
+         "--port", str(port), "--drain-timeout", "1",
+         "--metrics-port", str(port + 100)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for p in [port, *range(port + 1, port + 1 + workers)]:
+            wait_for_port(p)
+        with multiprocessing.Pool(clients) as pool:
+            counts = pool.map(run_client, [(port, rooms, seconds)] * clients)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    print(f"{workers} workers: {sum(counts) / seconds:>10.0f} msgs/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--rooms", type=int, default=50, help="rooms per client")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+    for workers in args.workers:
+        bench(workers, args.clients, args.rooms, args.seconds, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Alpha-beta search bot for the thaler game.
+
+The bot only knows its own color, so it keeps a set of colors the opponent
+might have picked and searches once per candidate (each a perfect-information
+game), averaging the scores of each root move. It drops a candidate when the
+opponent passes up an immediate win with that color.
+
+The search works on plain ints rather than `GameState`: pegs are a list of
+cells indexed by `Color.value`, moves are made and unmade in place, and
+positions are keyed into a bounded transposition table by Zobrist hash.
+"""
+
+import random
+import time
+from dataclasses import dataclass, field
+
+import game
+
+WIN = 10_000
+
+# Random keys for (color, cell), thaler cell, side to move and the assumed
+# (bot color, opponent color) pair. Seeded so hashes are stable across runs.
+_rng = random.Random(0x7A1E5)
+ZOBRIST_PEG = [[_rng.getrandbits(64) for _ in range(game.BOARD_CELLS)] for _ in game.Color]
+ZOBRIST_THALER = [_rng.getrandbits(64) for _ in range(game.BOARD_CELLS)]
+ZOBRIST_SIDE = _rng.getrandbits(64)
+ZOBRIST_COLORS = [[_rng.getrandbits(64) for _ in game.Color] for _ in game.Color]
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# (color index, destination cell)
+SearchMove = tuple[int, int]
+
+
+@dataclass(frozen=True)
+class Move:
+    color: game.Color
+    dst: game.Coords
+
+
+@dataclass(frozen=True)
+class Guess:
+    color: game.Color
+
+
+BotAction = Move | Guess
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+@dataclass
+class Position:
+    """Mutable search position with an incrementally updated Zobrist hash."""
+
+    pegs: list[int]
+    thaler: int
+    occupied: int = 0
+    hash: int = 0
+
+    def __post_init__(self) -> None:
+        self.occupied = 0
+        self.hash = ZOBRIST_THALER[self.thaler]
+        for color, cell in enumerate(self.pegs):
+            self.occupied |= 1 << cell
+            self.hash ^= ZOBRIST_PEG[color][cell]
+
+    @classmethod
+    def of_game_state(cls, game_state: game.GameState) -> "Position":
+        pegs = [0] * len(game.Color)
+        for color, peg in game_state.pegs.items():
+            pegs[color.value] = peg.int_repr
+        return cls(pegs, game_state.thaler_pos.int_repr)
+
+    def moves(self) -> list[SearchMove]:
+        """Every (color, dst) the side to move may play, like `valid_moves`."""
+        occupied = self.occupied
+        distance = game.DISTANCE[self.thaler]
+        moves: list[SearchMove] = []
+        for color, src in enumerate(self.pegs):
+            limit = distance[src]
+            for step, jump in game.MOVE_TABLE[src]:
+                if not occupied >> step & 1:
+                    if distance[step] <= limit:
+                        moves.append((color, step))
+                elif (
+                    jump is not None
+                    and not occupied >> jump & 1
+                    and distance[jump] <= limit
+                ):
+                    moves.append((color, jump))
+        return moves
+
+    def make(self, color: int, dst: int) -> int:
+        src = self.pegs[color]
+        self.pegs[color] = dst
+        self.occupied ^= (1 << src) | (1 << dst)
+        self.hash ^= ZOBRIST_PEG[color][src] ^ ZOBRIST_PEG[color][dst] ^ ZOBRIST_SIDE
+        return src
+
+    def unmake(self, color: int, src: int) -> None:
+        dst = self.pegs[color]
+        self.pegs[color] = src
+        self.occupied ^= (1 << src) | (1 << dst)
+        self.hash ^= ZOBRIST_PEG[color][src] ^ ZOBRIST_PEG[color][dst] ^ ZOBRIST_SIDE
+
+
+@dataclass
+class Bot:
+    """Plays one seat of a match. `time_budget` is seconds of search per move."""
+
+    color: game.Color
+    time_budget: float = 0.2
+    max_depth: int = 32
+    tt_size: int = 1 << 18
+    candidates: set[game.Color] = field(default_factory=lambda: set(game.Color))
+    tt: dict[int, tuple[int, int, int, SearchMove | None]] = field(default_factory=dict)
+    nodes: int = 0
+    _deadline: float = 0.0
+
+    def observe(self, before: game.GameState, move: Move) -> None:
+        """Update the opponent's possible colors from a move they just made."""
+        thaler = before.thaler_pos.int_repr
+        if move.dst.int_repr == thaler:
+            return
+        winning = {
+            color
+            for color, dst in Position.of_game_state(before).moves()
+            if dst == thaler
+        }
+        remaining = {c for c in self.candidates if c.value not in winning}
+        if remaining:
+            self.candidates = remaining
+
+    def choose(self, game_state: game.GameState) -> BotAction:
+        if len(self.candidates) == 1:
+            return Guess(next(iter(self.candidates)))
+        candidates = sorted(self.candidates, key=lambda c: c.value)
+        if not (scores := self.rate(game_state)):
+            return Guess(random.choice(candidates))
+
+        (color, dst), best = max(scores.items(), key=lambda item: item[1])
+        guess_value = WIN * (2 / len(candidates) - 1)
+        if guess_value > best:
+            return Guess(random.choice(candidates))
+        return Move(game.Color(color), game.Coords(dst))
+
+    def rate(self, game_state: game.GameState) -> dict[SearchMove, float]:
+        """Every legal move's score for the bot, averaged over the colors the
+        opponent might have, from the deepest search finished in time."""
+        position = Position.of_game_state(game_state)
+        root_moves = position.moves()
+        if not root_moves:
+            return {}
+
+        candidates = sorted(self.candidates, key=lambda c: c.value)
+        scores = {move: 0.0 for move in root_moves}
+        self._deadline = time.perf_counter() + self.time_budget
+        try:
+            for depth in range(1, self.max_depth + 1):
+                totals = {move: 0.0 for move in root_moves}
+                for opponent in candidates:
+                    for move, score in self.score_root(
+                        position, root_moves, depth, self.color.value, opponent.value
+                    ).items():
+                        totals[move] += score / len(candidates)
+                scores = totals
+                root_moves.sort(key=lambda m: -scores[m])
+        except SearchTimeout:
+            pass
+        return scores
+
+    def score_root(
+        self,
+        position: Position,
+        root_moves: list[SearchMove],
+        depth: int,
+        me: int,
+        opponent: int,
+    ) -> dict[SearchMove, float]:
+        scores: dict[SearchMove, float] = {}
+        for color, dst in root_moves:
+            if dst == position.thaler:
+                scores[(color, dst)] = self.landing_score(color, me, opponent, 0)
+                continue
+            src = position.make(color, dst)
+            try:
+                scores[(color, dst)] = -self.negamax(
+                    position, depth - 1, -WIN - 1, WIN + 1, 1, opponent, me
+                )
+            finally:
+                position.unmake(color, src)
+        return scores
+
+    @staticmethod
+    def landing_score(color: int, mover: int, other: int, ply: int) -> int:
+        """Score for the mover of putting `color` on the thaler, as in `make_player_move`."""
+        return WIN - ply if color == mover and color != other else ply - WIN
+
+    def negamax(
+        self,
+        position: Position,
+        depth: int,
+        alpha: int,
+        beta: int,
+        ply: int,
+        mover: int,
+        other: int,
+    ) -> int:
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self._deadline:
+            raise SearchTimeout
+
+        distance = game.DISTANCE[position.thaler]
+        if depth == 0:
+            return distance[position.pegs[other]] - distance[position.pegs[mover]]
+
+        key = position.hash ^ ZOBRIST_COLORS[mover][other]
+        best_move = None
+        if entry := self.tt.get(key):
+            entry_depth, score, flag, best_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER and score >= beta:
+                    return score
+                if flag == UPPER and score <= alpha:
+                    return score
+
+        moves = position.moves()
+        if not moves:
+            return 0
+        moves.sort(key=lambda m: m[1] != position.thaler)
+        if best_move in moves:
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+
+        alpha_start = alpha
+        best = -WIN - 1
+        for color, dst in moves:
+            if dst == position.thaler:
+                score = self.landing_score(color, mover, other, ply)
+            else:
+                src = position.make(color, dst)
+                try:
+                    score = -self.negamax(
+                        position, depth - 1, -beta, -alpha, ply + 1, other, mover
+                    )
+                finally:
+                    position.unmake(color, src)
+            if score > best:
+                best, best_move = score, (color, dst)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        flag = UPPER if best <= alpha_start else LOWER if best >= beta else EXACT
+        if len(self.tt) >= self.tt_size:
+            del self.tt[next(iter(self.tt))]
+        self.tt[key] = (depth, best, flag, best_move)
+        return best
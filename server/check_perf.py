@@ -0,0 +1,245 @@
+"""Performance regression check of the rules and codecs against stored timings.
+
+Times each benchmark below as the best of `--repeat` runs over the same
+seeded positions, and compares it with `perf_baseline.json`. Exits 1 if any
+of them got slower by more than `--threshold` (20% by default).
+
+Timings are stored relative to a fixed pure-Python loop timed alongside
+them, so a baseline saved on one machine is roughly right on another. Save
+a new baseline with `--save` after a change that is meant to move them, or
+when moving to a different Python.
+
+    python check_perf.py [--threshold 0.2] [--repeat 7] [--save] [benchmark...]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+
+import game
+import records
+import wire
+from batch import BatchGames
+from bench_records import random_game
+
+BASELINE = Path(__file__).with_name("perf_baseline.json")
+N_STATES = 5_000
+N_GAMES = 500
+
+# Each benchmark prepares its input, untimed, then returns the timed part and
+# how many operations it does.
+Benchmark = Callable[[], tuple[Callable[[], object], int]]
+
+
+def states() -> list[game.GameState]:
+    rng = random.Random(0)
+    return [game.GameState.create(rng.getrandbits(64)) for _ in range(N_STATES)]
+
+
+STATES = states()
+GAMES = [random_game(random.Random(n))[0] for n in range(N_GAMES)]
+
+
+def calibrate() -> tuple[Callable[[], object], int]:
+    def run() -> int:
+        total = 0
+        for i in range(1_000_000):
+            total += i * i % 7
+        return total
+
+    return run, 1_000_000
+
+
+def valid_moves() -> tuple[Callable[[], object], int]:
+    """Served from the move cache."""
+    calls = [(state, color) for state in STATES for color in game.Color]
+    for state, color in calls:
+        state.valid_moves(color)
+
+    def run() -> None:
+        for state, color in calls:
+            state.valid_moves(color)
+
+    return run, len(calls)
+
+
+def generate_moves() -> tuple[Callable[[], object], int]:
+    calls = [(state, color) for state in STATES for color in game.Color]
+
+    def run() -> None:
+        for state, color in calls:
+            state.generate_moves(color)
+
+    return run, len(calls)
+
+
+def place_thaler() -> tuple[Callable[[], object], int]:
+    """Placing the thaler on a free cell, then every colour's moves there."""
+    placed = [
+        (state, game.COORDS[next(c for c in range(game.BOARD_CELLS) if not occupied >> c & 1)])
+        for state in STATES
+        if (occupied := state.occupancy())
+    ]
+
+    def run() -> None:
+        for state, cell in placed:
+            state.current_phase = game.WhichPhase.PLACING_THALER
+            state.place_thaler(2, cell)
+            for color in game.Color:
+                state.valid_moves(color)
+
+    return run, len(placed)
+
+
+def make_player_move() -> tuple[Callable[[], object], int]:
+    """Every action of recorded games, including guesses that end them."""
+    plays = [list(record.play()) for record in GAMES]
+    starts = [record.initial_state() for record in GAMES]
+    actions = [[action for _, action in play] for play in plays]
+
+    def run() -> None:
+        for start, played in zip(starts, actions):
+            state = game.GameState(
+                pegs=dict(start.pegs),
+                thaler_pos=start.thaler_pos,
+                current_phase=start.current_phase,
+                p1_color=start.p1_color,
+                p2_color=start.p2_color,
+            )
+            for which_player, name, color, dst in played:
+                if name == "make_player_move":
+                    state.make_player_move(which_player, color, dst)
+                else:
+                    state.make_player_guess(which_player, color)
+
+    return run, sum(map(len, actions))
+
+
+def replay() -> tuple[Callable[[], object], int]:
+    """Decoding `GameRecord`s and playing them through."""
+    bodies = [record.encode() for record in GAMES]
+
+    def run() -> None:
+        for body in bodies:
+            records.GameRecord.decode(body).replay()
+
+    return run, len(bodies)
+
+
+def to_json_fast() -> tuple[Callable[[], object], int]:
+    def run() -> None:
+        for state in STATES:
+            state.to_json_fast()
+
+    return run, len(STATES)
+
+
+def from_dict_fast() -> tuple[Callable[[], object], int]:
+    dicts = [json.loads(state.to_json_fast()) for state in STATES]
+
+    def run() -> None:
+        for d in dicts:
+            game.GameState.from_dict_fast(d)
+
+    return run, len(dicts)
+
+
+def encode_state() -> tuple[Callable[[], object], int]:
+    def run() -> None:
+        for seq, state in enumerate(STATES):
+            wire.encode_state(state, seq)
+
+    return run, len(STATES)
+
+
+def to_board() -> tuple[Callable[[], object], int]:
+    def run() -> None:
+        for state in STATES:
+            state.to_board()
+
+    return run, len(STATES)
+
+
+def batch_targets() -> tuple[Callable[[], object], int]:
+    """Legal moves of 10,000 games at once."""
+    batch = BatchGames.create(10_000, np.random.default_rng(0))
+    return batch.targets, len(batch)
+
+
+BENCHMARKS: dict[str, Benchmark] = {
+    benchmark.__name__: benchmark
+    for benchmark in [
+        valid_moves,
+        generate_moves,
+        place_thaler,
+        make_player_move,
+        replay,
+        to_json_fast,
+        from_dict_fast,
+        encode_state,
+        to_board,
+        batch_targets,
+    ]
+}
+
+
+def measure(names: list[str], repeat: int) -> dict[str, float]:
+    """Best seconds per operation of each benchmark, and of the calibration
+    loop, over `repeat` rounds that each run every one of them once.
+
+    Interleaving them, rather than timing each `repeat` times in a row, lets
+    a quiet spell on a busy machine count for all of them alike.
+    """
+    best = {name: float("inf") for name in ["calibrate", *names]}
+    benchmarks = {"calibrate": calibrate} | BENCHMARKS
+    for _ in range(repeat):
+        for name in best:
+            run, ops = benchmarks[name]()
+            start = time.perf_counter()
+            run()
+            best[name] = min(best[name], (time.perf_counter() - start) / ops)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", metavar="benchmark", help=", ".join(BENCHMARKS))
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--save", action="store_true", help="store these timings as the baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    args = parser.parse_args()
+    if unknown := set(args.names) - BENCHMARKS.keys():
+        parser.error(f"no benchmark {', '.join(sorted(unknown))}")
+
+    best = measure(args.names or list(BENCHMARKS), args.repeat)
+    unit = best.pop("calibrate")
+    timings = {name: seconds / unit for name, seconds in best.items()}
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    slower = []
+    for name, relative in timings.items():
+        line = f"{name:>17}: {relative * unit * 1e6:9.3f} us/op"
+        if (base := stored.get(name)) is not None:
+            change = relative / base - 1
+            line += f"  {change:+7.1%} against the baseline"
+            if change > args.threshold:
+                slower.append(name)
+                line += "  SLOWER"
+        print(line)
+
+    if args.save:
+        args.baseline.write_text(json.dumps(stored | timings, indent=2, sort_keys=True) + "\n")
+        print(f"saved to {args.baseline}")
+    elif slower:
+        print(f"{len(slower)} slower than {args.threshold:.0%} past the baseline: {', '.join(slower)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""Randomised conformance check of the game rules, engine against reference.
+
+Generates positions and plays random actions from them through every engine
+at once, in lock-step with `Reference`, a plain statement of the rules. After
+each action it checks that every engine:
+
+- gives each colour the same set of moves (`valid_moves`);
+- accepts the same moves and rejects the same illegal ones;
+- ends the game, and picks the winner, the same way when a peg reaches the
+  thaler (`make_player_move`) or a player guesses (`make_player_guess`);
+  `check_guesses` also checks directly that a guess always ends it;
+- accepts the same thaler placements (`place_thaler`), and refuses moves
+  until the thaler is placed.
+
+Each engine keeps its own state across the actions of a case, so caches that
+carry over from one position to the next are covered. Positions come from
+several generators: fresh deals, deals played on at random, pegs crowded
+round one cell (many jumps and blocked moves), pegs lined up along the
+edges and deals waiting for player 2 to place the thaler. Every state met also has to survive the JSON and wire round trips.
+
+A failure prints the case's seed, the engine, the position and the action.
+`--seed S --case N` runs that one case again.
+
+    python check_rules.py [--cases 20000] [--seed 0] [--engine module:factory]
+
+`--engine` adds an engine to check, made by calling `factory()`; it only has
+to implement the methods of `Engine`.
+"""
+
+import argparse
+import dataclasses
+import importlib
+import json
+import random
+import time
+from typing import Protocol
+
+import numpy as np
+
+import game
+import wire
+from batch import GAME_ENDED, P1_TURN, BatchGames
+from game import Color, GameState, MaybeGameEnded, WhichPhase
+
+MAX_PLIES = 60
+COLORS = list(Color)
+TURNS = [WhichPhase.P1_TURN, WhichPhase.P2_TURN]
+
+# Each peg's cell in `Color` order, the thaler's, the phase and the result.
+Position = tuple[tuple[int, ...], int, WhichPhase, MaybeGameEnded]
+
+
+class Engine(Protocol):
+    """One implementation of the rules, holding one game at a time.
+
+    `move` and `guess` are played by whoever's turn it is.
+    """
+
+    name: str
+
+    def load(self, state: GameState) -> None: ...
+
+    def moves(self, color: Color) -> list[int]: ...
+
+    def move(self, color: Color, dst: int) -> bool:
+        """Play the move; False, leaving the game as it was, if it's illegal."""
+        ...
+
+    def guess(self, color: Color) -> None: ...
+
+    def place(self, dst: int) -> bool:
+        """Player 2 places the thaler; False if they can't put it there."""
+        ...
+
+    def position(self) -> Position: ...
+
+
+class Reference:
+    """The rules as written, with no caching or bit tricks."""
+
+    name = "reference"
+
+    def load(self, state: GameState) -> None:
+        self.state = copy_state(state)
+
+    def moves(self, color: Color) -> list[int]:
+        if self.state.current_phase not in TURNS:
+            return []
+        return [cell.int_repr for cell in self.state.valid_moves_reference(color)]
+
+    def move(self, color: Color, dst: int) -> bool:
+        if dst not in self.moves(color):
+            return False
+        state = self.state
+        state.pegs[color] = game.COORDS[dst]
+        if dst == state.thaler_pos.int_repr:
+            # Reaching the thaler wins for a player moving their own colour,
+            # unless the opponent picked that colour too; otherwise it loses.
+            p1_moving = state.current_phase == WhichPhase.P1_TURN
+            own, other = (
+                (state.p1_color, state.p2_color) if p1_moving else (state.p2_color, state.p1_color)
+            )
+            self.end(p1_moving == (color == own and color != other))
+        else:
+            self.next_turn()
+        return True
+
+    def guess(self, color: Color) -> None:
+        p1_guessing = self.state.current_phase == WhichPhase.P1_TURN
+        other = self.state.p2_color if p1_guessing else self.state.p1_color
+        self.end(p1_guessing == (color == other))
+
+    def place(self, dst: int) -> bool:
+        state = self.state
+        if state.current_phase != WhichPhase.PLACING_THALER:
+            return False
+        if any(peg.int_repr == dst for peg in state.pegs.values()):
+            return False
+        state.thaler_pos = game.COORDS[dst]
+        state.current_phase = WhichPhase.P1_TURN
+        return True
+
+    def end(self, p1_won: bool) -> None:
+        self.state.game_ended_state = "P1_won" if p1_won else "P2_won"
+        self.state.current_phase = WhichPhase.GAME_ENDED
+
+    def next_turn(self) -> None:
+        phase = self.state.current_phase
+        self.state.current_phase = TURNS[phase == WhichPhase.P1_TURN]
+
+    def position(self) -> Position:
+        return state_position(self.state)
+
+
+class GameEngine:
+    """`GameState` itself, with `MOVE_CACHE` on or off."""
+
+    def __init__(self, cached: bool) -> None:
+        self.cached = cached
+        self.name = "game" if cached else "game (uncached)"
+
+    def load(self, state: GameState) -> None:
+        self.state = copy_state(state)
+
+    def moves(self, color: Color) -> list[int]:
+        # Asked for outside a turn too, as `request_moves` may be, so a move
+        # cache that outlives a thaler placement shows up.
+        with use_cache(self.cached):
+            moves = [cell.int_repr for cell in self.state.valid_moves(color)]
+        return moves if self.state.current_phase in TURNS else []
+
+    def move(self, color: Color, dst: int) -> bool:
+        with use_cache(self.cached):
+            return self.state.make_player_move(self.player(), color, game.COORDS[dst]) is None
+
+    def guess(self, color: Color) -> None:
+        if (invalid := self.state.make_player_guess(self.player(), color)) is not None:
+            raise AssertionError(invalid.message)
+
+    def place(self, dst: int) -> bool:
+        with use_cache(self.cached):
+            return self.state.place_thaler(self.player(), game.COORDS[dst]) is None
+
+    def player(self):
+        return 1 if self.state.current_phase == WhichPhase.P1_TURN else 2
+
+    def position(self) -> Position:
+        return state_position(self.state)
+
+
+class BatchEngine:
+    """`batch.BatchGames`, one game wide.
+
+    `BatchGames` has no placement phase: a game loaded before its thaler is
+    placed is held as ended, and `place` starts it.
+    """
+
+    name = "batch"
+    PHASES = [WhichPhase.P1_TURN, WhichPhase.P2_TURN, WhichPhase.GAME_ENDED]
+    RESULTS: list[MaybeGameEnded] = ["Not_yet", "P1_won", "P2_won"]
+
+    def load(self, state: GameState) -> None:
+        self.games = BatchGames.of_game_states([state])
+        self.placing = state.current_phase == WhichPhase.PLACING_THALER
+
+    def moves(self, color: Color) -> list[int]:
+        return [int(t) for t in self.games.targets()[0, color.value] if t >= 0]
+
+    def move(self, color: Color, dst: int) -> bool:
+        targets = self.games.targets()
+        directions = (targets[0, color.value] == dst).nonzero()[0]
+        if self.games.phase[0] == GAME_ENDED or not len(directions):
+            return False
+        self.games.apply_moves(
+            self.array(color.value), self.array(int(directions[0])), self.array(True), targets
+        )
+        return True
+
+    def guess(self, color: Color) -> None:
+        self.games.apply_guesses(self.array(color.value), self.array(True))
+
+    def place(self, dst: int) -> bool:
+        if not self.placing or dst in self.games.pegs[0]:
+            return False
+        self.placing = False
+        self.games.thaler[0] = dst
+        self.games.phase[0] = P1_TURN
+        return True
+
+    def array(self, value) -> np.ndarray:
+        return np.array([value])
+
+    def position(self) -> Position:
+        games = self.games
+        return (
+            tuple(int(cell) for cell in games.pegs[0]),
+            int(games.thaler[0]),
+            WhichPhase.PLACING_THALER if self.placing else self.PHASES[games.phase[0]],
+            self.RESULTS[games.result[0]],
+        )
+
+
+class use_cache:
+    """Turn `MOVE_CACHE` on or off for the duration of a `with` block."""
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+    def __enter__(self) -> None:
+        self.saved, game.MOVE_CACHE.enabled = game.MOVE_CACHE.enabled, self.enabled
+
+    def __exit__(self, *exc) -> None:
+        game.MOVE_CACHE.enabled = self.saved
+
+
+def copy_state(state: GameState) -> GameState:
+    """Every field of `state`, with pegs of its own and no cached moves."""
+    return dataclasses.replace(state, pegs=dict(state.pegs))
+
+
+def state_position(state: GameState) -> Position:
+    return (
+        tuple(peg.int_repr for peg in state.pegs.values()),
+        state.thaler_pos.int_repr,
+        state.current_phase,
+        state.game_ended_state,
+    )
+
+
+def in_play(rng: random.Random, thaler: int, cells: list[int]) -> GameState:
+    """A game on `thaler` and `cells` at a random player's turn, with random
+    colour picks; both players pick the same colour now and then."""
+    p1 = rng.choice(COLORS)
+    p2 = p1 if rng.random() < 0.15 else rng.choice(COLORS)
+    return GameState(
+        pegs={color: game.COORDS[cell] for color, cell in zip(COLORS, cells)},
+        thaler_pos=game.COORDS[thaler],
+        current_phase=rng.choice(TURNS),
+        p1_color=p1,
+        p2_color=p2,
+    )
+
+
+def dealt(rng: random.Random) -> GameState:
+    cells = game.deal(rng)
+    return in_play(rng, cells[-1], cells[:-1])
+
+
+def played(rng: random.Random) -> GameState:
+    """A deal after up to 30 random moves that didn't end it."""
+    state = dealt(rng)
+    for _ in range(rng.randrange(30)):
+        color = rng.choice(COLORS)
+        moves = [m for m in state.valid_moves_reference(color) if m is not state.thaler_pos]
+        if moves:
+            state.pegs[color] = rng.choice(moves)
+    return state
+
+
+def crowded(rng: random.Random) -> GameState:
+    """Pegs packed within two cells of one spot, the thaler close by."""
+    x, y = rng.randrange(2, 5), rng.randrange(2, 5)
+    near = [
+        (y + dy) * game.BOARD_SIZE + x + dx for dy in range(-2, 3) for dx in range(-2, 3)
+    ]
+    cells = rng.sample(near, len(COLORS) + 1)
+    return in_play(rng, cells[-1], cells[:-1])
+
+
+def edges(rng: random.Random) -> GameState:
+    """Pegs on the edges of the board, where steps and jumps fall off it."""
+    last = game.BOARD_SIZE - 1
+    border = [
+        cell
+        for cell in range(game.BOARD_CELLS)
+        if {cell // game.BOARD_SIZE, cell % game.BOARD_SIZE} & {0, last}
+    ]
+    cells = rng.sample(border, len(COLORS))
+    thaler = rng.choice([cell for cell in range(game.BOARD_CELLS) if cell not in cells])
+    return in_play(rng, thaler, cells)
+
+
+def placing(rng: random.Random) -> GameState:
+    """A deal with player 2 about to place the thaler."""
+    state = dealt(rng)
+    state.placement = True
+    state.current_phase = WhichPhase.PLACING_THALER
+    return state
+
+
+GENERATORS = [dealt, played, crowded, edges, placing]
+
+
+class Mismatch(AssertionError):
+    pass
+
+
+def check_round_trips(state: GameState, rng: random.Random) -> None:
+    """JSON and wire encodings give back the state they were made from."""
+    text = state.to_json()
+    assert state.to_json_fast() == text, "to_json_fast differs from to_json"
+    assert GameState.from_json(text) == state, "from_json(to_json()) differs"
+    assert GameState.from_dict_fast(json.loads(text)) == state, "from_dict_fast differs"
+    seq = rng.getrandbits(32)
+    assert wire.decode_state(wire.encode_state(state, seq)) == (
+        seq, state.pegs, state.thaler_pos, state.current_phase
+    ), "wire state frame differs"
+
+
+def random_state(rng: random.Random) -> GameState:
+    """Any phase, picks or none, any result: for the round trips."""
+    state = rng.choice(GENERATORS)(rng)
+    state.current_phase = rng.choice(list(WhichPhase))
+    state.p1_color = rng.choice([None, *COLORS])
+    state.p2_color = rng.choice([None, *COLORS])
+    state.game_ended_state = rng.choice(["Not_yet", "P1_won", "P2_won"])
+    state.placement = rng.random() < 0.5
+    return state
+
+
+def run_case(seed: int, case: int, engines: list[Engine]) -> int:
+    """Play one case through `engines`; returns the number of actions."""
+    rng = random.Random(f"{seed}:{case}")
+    check_round_trips(random_state(rng), rng)
+    generator = GENERATORS[case % len(GENERATORS)]
+    start = generator(rng)
+    reference = Reference()
+    everyone: list[Engine] = [reference, *engines]
+    for engine in everyone:
+        engine.load(start)
+    history: list[str] = []
+
+    def fail(engine: Engine, what: str, expected, got) -> Mismatch:
+        return Mismatch(
+            f"seed {seed} case {case} ({generator.__name__}), engine {engine.name!r}: "
+            f"{what}\n  expected {expected}\n  got      {got}\n"
+            f"  start {start.to_json_fast()}\n{start.to_board()}\n"
+            f"  actions {' '.join(history) or '-'}\n"
+            f"  rerun with --seed {seed} --case {case}"
+        )
+
+    for _ in range(MAX_PLIES):
+        moves = {color: sorted(reference.moves(color)) for color in COLORS}
+        for engine in engines:
+            for color in COLORS:
+                if (got := sorted(engine.moves(color))) != moves[color]:
+                    raise fail(engine, f"moves of {color.to_string()}", moves[color], got)
+        state = reference.state
+        if state.current_phase == WhichPhase.GAME_ENDED:
+            color, dst = rng.choice(COLORS), rng.randrange(game.BOARD_CELLS)
+            history.append(f"{color.to_string()}>{dst}(after the end)")
+            for engine in engines:
+                if engine.move(color, dst):
+                    raise fail(engine, "move after the game ended", "rejected", "accepted")
+            break
+
+        if state.current_phase == WhichPhase.PLACING_THALER:
+            cell = rng.randrange(game.BOARD_CELLS)
+            if rng.random() < 0.2:
+                # Nobody moves a peg before the thaler is placed.
+                color = rng.choice(COLORS)
+                history.append(f"{color.to_string()}>{cell}(while placing)")
+                for engine in engines:
+                    if engine.move(color, cell):
+                        raise fail(engine, history[-1], "rejected", "accepted")
+                continue
+            history.append(f"T>{cell}")
+            accepted = reference.place(cell)
+            for engine in engines:
+                if engine.place(cell) != accepted:
+                    raise fail(engine, f"placement {history[-1]}", accepted, not accepted)
+            expected = reference.position()
+            for engine in engines:
+                if (got := engine.position()) != expected:
+                    raise fail(engine, f"position after {history[-1]}", expected, got)
+            continue
+
+        legal = [(color, dst) for color in COLORS for dst in moves[color]]
+        winning = [m for m in legal if m[1] == state.thaler_pos.int_repr]
+        roll = rng.random()
+        if not legal or roll < 0.08:
+            action = rng.choice(COLORS)
+            history.append(f"guess {action.to_string()}")
+            for engine in everyone:
+                engine.guess(action)
+        else:
+            if roll < 0.2:
+                color = rng.choice(COLORS)
+                illegal = [c for c in range(game.BOARD_CELLS) if c not in moves[color]]
+                move = color, rng.choice(illegal)
+            elif winning and roll < 0.4:
+                move = rng.choice(winning)
+            else:
+                move = rng.choice(legal)
+            history.append(f"{move[0].to_string()}>{move[1]}")
+            accepted = reference.move(*move)
+            for engine in engines:
+                if engine.move(*move) != accepted:
+                    raise fail(engine, f"move {history[-1]}", accepted, not accepted)
+
+        expected = reference.position()
+        for engine in engines:
+            if (got := engine.position()) != expected:
+                raise fail(engine, f"position after {history[-1]}", expected, got)
+        check_round_trips(reference.state, rng)
+    return len(history)
+
+
+def check_guesses() -> None:
+    """A guess, right or wrong, ends the game on the spot: the guesser wins
+    if it is right, and nothing more can be played after it."""
+    for which_player, phase in enumerate(TURNS, 1):
+        for right in (True, False):
+            state = GameState.create(which_player)
+            state.p1_color, state.p2_color = Color.RED, Color.BLUE
+            state.current_phase = phase
+            other = state.p2_color if which_player == 1 else state.p1_color
+            guess = other if right else Color.GREEN
+            assert state.make_player_guess(which_player, guess) is None  # type: ignore[arg-type]
+            winner = which_player if right else 3 - which_player
+            assert state.current_phase == WhichPhase.GAME_ENDED, state.current_phase
+            assert state.game_ended_state == f"P{winner}_won", state.game_ended_state
+            for player in (1, 2):
+                assert state.make_player_guess(player, guess) is not None, "guess after the end"
+                for color in COLORS:
+                    for dst in state.generate_moves(color):
+                        assert state.make_player_move(player, color, dst) is not None
+
+
+def load_engine(spec: str) -> Engine:
+    module, _, factory = spec.partition(":")
+    return getattr(importlib.import_module(module), factory)()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--case", type=int, help="run only this case")
+    parser.add_argument(
+        "--engine", action="append", default=[], help="module:factory of another engine"
+    )
+    args = parser.parse_args()
+    engines: list[Engine] = [GameEngine(cached=True), GameEngine(cached=False), BatchEngine()]
+    engines += [load_engine(spec) for spec in args.engine]
+
+    check_guesses()
+    cases = [args.case] if args.case is not None else range(args.cases)
+    start = time.perf_counter()
+    actions = sum(run_case(args.seed, case, engines) for case in cases)
+    print(
+        f"{len(cases):,} cases, {actions:,} actions: {', '.join(e.name for e in engines)} "
+        f"agree with the reference ({time.perf_counter() - start:.1f} s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
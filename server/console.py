@@ -0,0 +1,218 @@
+"""Live terminal dashboard of many rooms' boards, updated by cursor-addressed diffs.
+
+Rooms are tiled across the terminal, each as a title line (room ID and
+phase) over its board as drawn by `GameState.to_board`. A `BoardRenderer`
+keeps each room's rendered cells and re-renders only the cells that changed
+since it last drew the room. A frame then moves the cursor to each of those
+cells and rewrites just that cell, so a move costs about 40 bytes of output
+rather than a redraw of the whole board, and quiet rooms cost nothing.
+
+Started by `room.py --console`, which writes frames to stdout. The server
+logs to stderr, so redirect that elsewhere.
+"""
+
+import asyncio
+import itertools
+import shutil
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from typing import TextIO
+
+import game
+
+TILE_WIDTH = game.BOARD_SIZE * 2 + 2
+TILE_HEIGHT = game.BOARD_SIZE + 2
+CLEAR = "\033[2J"
+HIDE_CURSOR, SHOW_CURSOR = "\033[?25l", "\033[?25h"
+PEG_CELLS = list(game.PEG_CELLS.values())
+
+
+def move_to(line: int, column: int) -> str:
+    """Cursor to a 0-based screen position."""
+    return f"\033[{line + 1};{column + 1}H"
+
+
+@dataclass
+class BoardRenderer:
+    """One room's board as last rendered, cell by cell."""
+
+    cells: list[str] = field(default_factory=lambda: game.EMPTY_CELLS.copy())
+    # The position last drawn, and each peg's cell in Color order then the
+    # thaler's.
+    key: game.PositionKey | None = None
+    drawn: list[int] = field(default_factory=list)
+    # The rows of `to_board`, rebuilt only when one of their cells changes.
+    rows: list[str] = field(default_factory=list)
+
+    def update(self, game_state: game.GameState) -> list[int]:
+        """Re-render the cells that changed since the last update; returns them."""
+        key = game_state.position_key()
+        if key == self.key:
+            return []
+        self.key = key
+        now = [peg.int_repr for peg in key[1:]]
+        now.append(key[0].int_repr)
+        moved = [
+            cell
+            for before, after in itertools.zip_longest(self.drawn, now)
+            if before != after
+            for cell in (before, after)
+            if cell is not None
+        ]
+        dirty = []
+        for cell in set(moved):
+            # The thaler is drawn over a peg on its cell.
+            if cell == now[-1]:
+                rendered = game.THALER_CELL
+            elif cell in now:
+                rendered = PEG_CELLS[now.index(cell)]
+            else:
+                rendered = game.EMPTY_CELLS[cell]
+            if self.cells[cell] != rendered:
+                self.cells[cell] = rendered
+                dirty.append(cell)
+        self.drawn = now
+        if self.rows:
+            for r in {cell // game.BOARD_SIZE for cell in dirty}:
+                start = r * game.BOARD_SIZE
+                self.rows[r] = game.row(self.cells[start : start + game.BOARD_SIZE])
+        return dirty
+
+    def render(self, game_state: game.GameState) -> str:
+        """The same text as `game_state.to_board()`."""
+        if not self.rows:
+            self.rows = [game.row(self.cells[r : r + 7]) for r in range(0, 49, 7)]
+        self.update(game_state)
+        return "\n".join(self.rows)
+
+
+@dataclass
+class Tile:
+    index: int
+    board: BoardRenderer = field(default_factory=BoardRenderer)
+    # The phase shown in the title line, None until it is drawn.
+    phase: game.WhichPhase | None = None
+
+
+@dataclass
+class Dashboard:
+    """Which room is drawn where, and what the terminal shows for each.
+
+    `frame` returns the output that brings the terminal up to date. Rooms
+    take the first free tile in reading order and keep it until they close.
+    Rooms that don't fit aren't shown, but are counted on the status line.
+    """
+
+    width: int = 80
+    height: int = 24
+    tiles: dict[str, Tile] = field(default_factory=dict)
+    free: list[int] = field(default_factory=list)
+    # Tiles handed out so far; freed ones are reused lowest first.
+    used: int = 0
+    status: str = ""
+    # The next frame clears the screen and draws everything.
+    full: bool = True
+
+    @property
+    def capacity(self) -> int:
+        return (self.width // TILE_WIDTH) * ((self.height - 1) // TILE_HEIGHT)
+
+    def origin(self, index: int) -> tuple[int, int]:
+        per_line = self.width // TILE_WIDTH
+        return index // per_line * TILE_HEIGHT, index % per_line * TILE_WIDTH
+
+    def resize(self, width: int, height: int) -> None:
+        """Lay the tiles out again for a terminal of a new size."""
+        self.width, self.height = width, height
+        self.tiles.clear()
+        self.free.clear()
+        self.used = 0
+        self.full = True
+
+    def frame(self, rooms: Mapping[str, game.GameState]) -> str:
+        out: list[str] = []
+        if self.full:
+            out.append(CLEAR)
+            for tile in self.tiles.values():
+                tile.board, tile.phase = BoardRenderer(), None
+        for room_id in [room_id for room_id in self.tiles if room_id not in rooms]:
+            self.free.append(self.tiles.pop(room_id).index)
+            if not self.full:
+                line, column = self.origin(self.free[-1])
+                blank = " " * TILE_WIDTH
+                out += [move_to(line + i, column) + blank for i in range(TILE_HEIGHT)]
+        self.free.sort(reverse=True)
+        for room_id, game_state in rooms.items():
+            if not (tile := self.tiles.get(room_id)):
+                if self.free:
+                    index = self.free.pop()
+                elif self.used < self.capacity:
+                    index, self.used = self.used, self.used + 1
+                else:
+                    continue
+                tile = self.tiles[room_id] = Tile(index)
+            self.draw(tile, room_id, game_state, out)
+        status = f"{len(rooms)} rooms, {len(self.tiles)} shown"
+        if status != self.status or self.full:
+            self.status = status
+            out.append(move_to(self.height - 1, 0) + game.RESET_CODE + status + "\033[K")
+        self.full = False
+        if out:
+            out.append(game.RESET_CODE)
+        return "".join(out)
+
+    def draw(
+        self, tile: Tile, room_id: str, game_state: game.GameState, out: list[str]
+    ) -> None:
+        line, column = self.origin(tile.index)
+        if game_state.current_phase is not tile.phase:
+            tile.phase = game_state.current_phase
+            title = f"{room_id} {tile.phase.value}"[: TILE_WIDTH - 1]
+            out.append(move_to(line, column) + game.RESET_CODE + title.ljust(TILE_WIDTH - 1))
+        fresh = tile.board.key is None
+        dirty = tile.board.update(game_state)
+        cells = tile.board.cells
+        if fresh:
+            # A new tile shows the whole board, empty cells included.
+            for r in range(game.BOARD_SIZE):
+                start = r * game.BOARD_SIZE
+                out.append(
+                    move_to(line + 1 + r, column) + game.row(cells[start : start + game.BOARD_SIZE])
+                )
+            return
+        for cell in dirty:
+            r, c = divmod(cell, game.BOARD_SIZE)
+            out.append(move_to(line + 1 + r, column + c * 2) + cells[cell])
+
+
+async def show(
+    rooms: Callable[[], Mapping[str, game.GameState]],
+    out: TextIO,
+    interval: float = 0.1,
+) -> None:
+    """Write a frame to `out` every `interval` seconds, following terminal
+    resizes.
+
+    Frames are written from a worker thread, so a terminal that is slow to
+    take a full redraw, or not reading at all, never blocks the event loop.
+    No frame is drawn while the last one is still being written: frames are
+    diffs against what was drawn, so the next one covers everything that
+    changed in the meantime.
+    """
+
+    def write(text: str) -> None:
+        out.write(text)
+        out.flush()
+
+    dashboard = Dashboard(*shutil.get_terminal_size())
+    await asyncio.to_thread(write, HIDE_CURSOR)
+    try:
+        while True:
+            size = shutil.get_terminal_size()
+            if size != (dashboard.width, dashboard.height):
+                dashboard.resize(*size)
+            if frame := dashboard.frame(rooms()):
+                await asyncio.to_thread(write, frame)
+            await asyncio.sleep(interval)
+    finally:
+        write(SHOW_CURSOR + game.RESET_CODE)
@@ -1,16 +1,82 @@
+import json
 import random
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import cast, Literal, Self
+from types import ModuleType
+from typing import Any, cast, Literal, Self
 
-from dataclasses_json import dataclass_json
+BOARD_SIZE = 7
 
+BOARD_CELLS = BOARD_SIZE * BOARD_SIZE
+
+
+class LazyJson:
+    """`@dataclass_json`'s methods, importing dataclasses_json on first use.
+
+    dataclasses_json pulls in marshmallow, which takes longer to import than
+    the rest of the server put together, and only tooling and the reference
+    encoders need it: the hot paths use `to_json_fast` and friends. The first
+    call applies the decorator to the class, replacing these stand-ins.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def _dataclass_json(cls) -> Any:
+        if "to_json" not in cls.__dict__:
+            from dataclasses_json import dataclass_json
+
+            dataclass_json(cls)
+        return cls
+
+    def to_json(self, **kwargs: Any) -> str:
+        return self._dataclass_json().to_json(self, **kwargs)
+
+    def to_dict(self, encode_json: bool = False) -> dict[str, Any]:
+        return self._dataclass_json().to_dict(self, encode_json)
+
+    @classmethod
+    def from_json(cls, s: str | bytes, **kwargs: Any) -> Self:
+        return cls._dataclass_json().from_json(s, **kwargs)
+
+    @classmethod
+    def from_dict(cls, kvs: dict, *, infer_missing: bool = False) -> Self:
+        return cls._dataclass_json().from_dict(kvs, infer_missing=infer_missing)
+
+    @classmethod
+    def schema(cls, **kwargs: Any) -> Any:
+        return cls._dataclass_json().schema(**kwargs)
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Coords(LazyJson):
+    """A board cell.
+
+    There is exactly one instance per cell, held in `COORDS`: constructing a
+    `Coords` looks the cell up instead of allocating, so equality and hashing
+    are by identity.
+    """
 
-@dataclass_json
-@dataclass(frozen=True)
-class Coords:
     int_repr: int
 
+    def __new__(cls, int_repr: int) -> "Coords":
+        if type(int_repr) is int and 0 <= int_repr < BOARD_CELLS:
+            return COORDS[int_repr]
+        raise ValueError(f"Not a board cell: {int_repr!r}")
+
+    def __init__(self, int_repr: int) -> None:
+        # Cells are filled in once when `COORDS` is built.
+        pass
+
+    def __reduce__(self) -> tuple[type, tuple[int]]:
+        return self.__class__, (self.int_repr,)
+
+    def __copy__(self) -> Self:
+        return self
+
+    def __deepcopy__(self, memo: dict) -> Self:
+        return self
+
     def to_xy(self) -> tuple[int, int]:
         return (self.int_repr % 7), (self.int_repr // 7)
 
@@ -27,6 +93,61 @@ class Coords:
         return max(abs(x1 - x2), abs(y1 - y2))
 
 
+def _make_cell(int_repr: int) -> Coords:
+    cell = object.__new__(Coords)
+    object.__setattr__(cell, "int_repr", int_repr)
+    return cell
+
+
+COORDS: tuple[Coords, ...] = tuple(
+    _make_cell(pos) for pos in range(BOARD_CELLS)
+)
+
+
+# The 8 king-move directions, in the order `valid_moves` has always probed them.
+DIRECTIONS = [
+    (up_down, left_right)
+    for up_down in [-1, 0, 1]
+    for left_right in [-1, 0, 1]
+    if (up_down, left_right) != (0, 0)
+]
+
+
+def offset_cell(pos: int, dx: int, dy: int) -> int | None:
+    x, y = pos % BOARD_SIZE + dx, pos // BOARD_SIZE + dy
+    if not (0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE):
+        return None
+    return y * BOARD_SIZE + x
+
+
+# MOVE_TABLE[pos] holds one (step, jump) pair per direction: the neighbouring
+# cell and the cell two away, or None where that runs off the board.
+MOVE_TABLE: list[list[tuple[int, int | None]]] = [
+    [
+        (step, offset_cell(pos, dx * 2, dy * 2))
+        for dx, dy in DIRECTIONS
+        if (step := offset_cell(pos, dx, dy)) is not None
+    ]
+    for pos in range(BOARD_CELLS)
+]
+
+# DISTANCE[a][b] is the Chebyshev (king-move) distance between two cells.
+DISTANCE: list[list[int]] = [
+    [
+        max(abs(a % BOARD_SIZE - b % BOARD_SIZE), abs(a // BOARD_SIZE - b // BOARD_SIZE))
+        for b in range(BOARD_CELLS)
+    ]
+    for a in range(BOARD_CELLS)
+]
+
+# NEAR[pos] has a bit set for every cell within two king moves of `pos`:
+# the only cells whose moves can change when `pos` is vacated or filled.
+NEAR: list[int] = [
+    sum(1 << b for b in range(BOARD_CELLS) if DISTANCE[a][b] <= 2)
+    for a in range(BOARD_CELLS)
+]
+
+
 class Color(Enum):
     RED = 0
     ORANGE = 1
@@ -55,16 +176,10 @@ class Color(Enum):
 
     @classmethod
     def of_string(cls, s: str) -> Self | None:
-        mapping = {
-            "R": cls.RED,
-            "O": cls.ORANGE,
-            "Y": cls.YELLOW,
-            "G": cls.GREEN,
-            "B": cls.BLUE,
-            "P": cls.PINK,
-            "U": cls.PURPLE,
-        }
-        return mapping.get(s)
+        return COLOR_OF_STRING.get(s)  # type: ignore[return-value]
+
+
+COLOR_OF_STRING = {color.to_string(): color for color in Color}
 
 
 COLOR_CODES = {
@@ -85,12 +200,16 @@ THALER_CODE = "\033[47m"
 class WhichPhase(Enum):
     WAITING_FOR_START = "Waiting for start"
     SELECTING = "Selecting"
-    PLACING_THALER = ""
+    PLACING_THALER = "Placing thaler"
     P1_TURN = "P1 Turn"
     P2_TURN = "P2 Turn"
     GAME_ENDED = "Game ended"
 
 
+# JSON for each phase, as dataclasses_json encodes it.
+PHASE_JSON = {phase: json.dumps(phase.value) for phase in WhichPhase}
+
+
 @dataclass
 class InvalidAction:
     message: str
@@ -98,19 +217,24 @@ class InvalidAction:
 
 Cell = Color | Literal["Thaler"] | None
 
+COLOR_ORDER = list(Color)
+
+# The thaler then every peg; Coords compare by identity, so this compares in C.
+PositionKey = tuple[Coords, ...]
+
+# Moves for each colour, indexed by `Color.value`; None until first asked for.
+MoveLists = list[list[Coords] | None]
+
 MaybeGameEnded = Literal["P1_won", "P2_won", "Not_yet"]
 
 
-@dataclass_json
 @dataclass
-class GameState:
+class GameState(LazyJson):
     pegs: dict[Color, Coords] = field(
         metadata={
             "dataclasses_json": {
                 "encoder": lambda d: {k.value: v.int_repr for k, v in d.items()},
-                "decoder": lambda d: {
-                    Color.of_string(k): Coords(v) for k, v in d.items()
-                },
+                "decoder": lambda d: {Color(int(k)): Coords(v) for k, v in d.items()},
             }
         }
     )
@@ -119,24 +243,71 @@ class GameState:
     p1_color: Color | None = None
     p2_color: Color | None = None
     game_ended_state: MaybeGameEnded = "Not_yet"
+    # Player 2 places the thaler once both colours are picked, rather than
+    # playing to the cell it was dealt.
+    placement: bool = False
+    # Position key, its occupancy bitboard and the moves generated there.
+    _moves: tuple[PositionKey, int, MoveLists] | None = field(
+        default=None,
+        init=False,
+        repr=False,
+        compare=False,
+        metadata={"dataclasses_json": {"exclude": lambda _: True}},
+    )
+
+    def __post_init__(self) -> None:
+        # `position_key` relies on pegs iterating in `Color` order; assigning
+        # to an existing key keeps it that way.
+        if list(self.pegs) != COLOR_ORDER:
+            self.pegs = {color: self.pegs[color] for color in Color}
 
     @classmethod
-    def create(cls) -> Self:
-        thaler_pos, pegs = generate_peg_positions()
+    def create(cls, seed: int | None = None, placement: bool = False) -> Self:
+        """A new game; the same `seed` always deals the same board."""
+        rng = random if seed is None else random.Random(seed)
+        thaler_pos, pegs = generate_peg_positions(rng)
         return cls(
             thaler_pos=thaler_pos,
             pegs=pegs,
+            placement=placement,
+        )
+
+    def to_json_fast(self) -> str:
+        """Byte-identical to `to_json()`, without the dataclasses_json machinery."""
+        pegs = ", ".join(
+            f'"{color.value}": {peg.int_repr}' for color, peg in self.pegs.items()
+        )
+        p1 = "null" if self.p1_color is None else self.p1_color.value
+        p2 = "null" if self.p2_color is None else self.p2_color.value
+        return (
+            f'{{"pegs": {{{pegs}}}, '
+            f'"thaler_pos": {{"int_repr": {self.thaler_pos.int_repr}}}, '
+            f'"current_phase": {PHASE_JSON[self.current_phase]}, '
+            f'"p1_color": {p1}, "p2_color": {p2}, '
+            f'"game_ended_state": {json.dumps(self.game_ended_state)}, '
+            f'"placement": {"true" if self.placement else "false"}}}'
+        )
+
+    @classmethod
+    def from_dict_fast(cls, d: dict) -> Self:
+        """Inverse of `to_json_fast`, taking the already-parsed JSON object."""
+        p1, p2 = d["p1_color"], d["p2_color"]
+        return cls(
+            pegs={Color(int(k)): Coords(v) for k, v in d["pegs"].items()},
+            thaler_pos=Coords(d["thaler_pos"]["int_repr"]),
+            current_phase=WhichPhase(d["current_phase"]),
+            p1_color=None if p1 is None else Color(p1),
+            p2_color=None if p2 is None else Color(p2),
+            game_ended_state=d["game_ended_state"],
+            # Missing from states stored before thaler placement existed.
+            placement=d.get("placement", False),
         )
 
     def to_board(self) -> str:
-        board = [
-            color_cell("  ", [RESET_CODE, "\033[100m"][idx % 2]) for idx in range(0, 49)
-        ]
+        board = EMPTY_CELLS.copy()
         for color, peg in self.pegs.items():
-            board[peg.int_repr] = color_cell(
-                f"{color.to_string()} ", COLOR_CODES[color]
-            )
-        board[self.thaler_pos.int_repr] = color_cell(f"T ", THALER_CODE)
+            board[peg.int_repr] = PEG_CELLS[color]
+        board[self.thaler_pos.int_repr] = THALER_CELL
         rows = [row(board[r : r + 7]) for r in range(0, 49, 7)]
         return "\n".join(rows)
 
@@ -150,13 +321,72 @@ class GameState:
                 elif which_player == 2 and self.p2_color is None:
                     self.p2_color = which_color
                 if self.p1_color is not None and self.p2_color is not None:
-                    self.current_phase = WhichPhase.P1_TURN
+                    self.current_phase = (
+                        WhichPhase.PLACING_THALER if self.placement else WhichPhase.P1_TURN
+                    )
             case WhichPhase.PLACING_THALER | WhichPhase.WAITING_FOR_START:
                 return InvalidAction("Not started yet!")
             case WhichPhase.P1_TURN | WhichPhase.P2_TURN | WhichPhase.GAME_ENDED:
                 return InvalidAction("Game is already running!")
 
+    def occupancy(self) -> int:
+        """49-bit board with bit `n` set when a peg sits on cell `n`."""
+        occupied = 0
+        for peg in self.pegs.values():
+            occupied |= 1 << peg.int_repr
+        return occupied
+
+    def position_key(self) -> PositionKey:
+        """The thaler followed by each colour's peg, in `Color` order."""
+        return self.thaler_pos, *self.pegs.values()
+
     def valid_moves(self, color: Color) -> list[Coords]:
+        if not MOVE_CACHE.enabled:
+            return self.generate_moves(color)
+        return self.cached_moves(self.position_key(), color).copy()
+
+    def cached_moves(self, key: PositionKey, color: Color) -> list[Coords]:
+        """`color`'s moves in the position `key`, generated at most once."""
+        # Indexed by `_value_`: hashing an Enum member, or reading `.value`,
+        # runs in Python.
+        index = color._value_
+        if (cached := self._moves) is None or cached[0] != key:
+            cached = self._moves = key, self.occupancy(), [None] * len(Color)
+        elif (moves := cached[2][index]) is not None:
+            MOVE_CACHE.hits += 1
+            return moves
+        MOVE_CACHE.misses += 1
+        # key is the thaler then every peg in `Color` order.
+        moves = cached[2][index] = generate_moves(
+            key[index + 1].int_repr, cached[1], DISTANCE[key[0].int_repr]
+        )
+        return moves
+
+    def carry_moves(self, key: PositionKey, src: Coords, dst: Coords) -> None:
+        """Keep the moves cached for `key` that a peg going from `src` to
+        `dst` cannot have changed: those of pegs more than two cells away."""
+        if (cached := self._moves) is None or cached[0] != key:
+            return
+        new_key = self.position_key()
+        affected = NEAR[src.int_repr] | NEAR[dst.int_repr]
+        entry = cached[2]
+        for index, moves in enumerate(entry):
+            if moves is not None and affected >> new_key[index + 1].int_repr & 1:
+                entry[index] = None
+        occupied = cached[1] ^ (1 << src.int_repr) ^ (1 << dst.int_repr)
+        self._moves = new_key, occupied, entry
+
+    def generate_moves(self, color: Color) -> list[Coords]:
+        """`valid_moves` computed from the bitboard, bypassing `MOVE_CACHE`."""
+        return generate_moves(
+            self.pegs[color].int_repr,
+            self.occupancy(),
+            DISTANCE[self.thaler_pos.int_repr],
+        )
+
+    def valid_moves_reference(self, color: Color) -> list[Coords]:
+        """Straightforward version of `valid_moves`, kept to check it against."""
+
         def is_closer_to_thaler_than_current(new_coord: Coords) -> bool:
             before = self.pegs[color].distance_from(self.thaler_pos)
             after = new_coord.distance_from(self.thaler_pos)
@@ -196,14 +426,24 @@ class GameState:
                     else WhichPhase.P2_TURN
                 )
 
-    def place_thaler(self, which_player: Literal[1, 2], dst: Coords):
-        match self.current_state:
+    def place_thaler(
+        self, which_player: Literal[1, 2], dst: Coords
+    ) -> None | InvalidAction:
+        match self.current_phase:
             case WhichPhase.SELECTING | WhichPhase.WAITING_FOR_START:
                 return InvalidAction("Can't make move when initializing!")
             case WhichPhase.GAME_ENDED:
                 return InvalidAction("Game is already over!")
             case WhichPhase.P1_TURN | WhichPhase.P2_TURN:
-
+                return InvalidAction("The thaler is already placed!")
+            case WhichPhase.PLACING_THALER if which_player != 2:
+                return InvalidAction("Player 2 places the thaler!")
+        if self.occupancy() >> dst.int_repr & 1:
+            return InvalidAction("The thaler can't go on a peg!")
+        # Moves cached for the old position are keyed by its thaler, so they
+        # are never served for the new one.
+        self.thaler_pos = dst
+        self.current_phase = WhichPhase.P1_TURN
 
     def make_player_move(
         self, which_player: Literal[1, 2], color: Color, dst: Coords
@@ -221,18 +461,23 @@ class GameState:
                 pass
             case WhichPhase.P1_TURN | WhichPhase.P2_TURN:
                 return InvalidAction(f"It's not Player {which_player}'s turn!")
-        if dst in self.valid_moves(color):
+        if not MOVE_CACHE.enabled:
+            if dst not in self.generate_moves(color):
+                return InvalidAction("You bruh'd with an invalid move")
             self.pegs[color] = dst
         else:
-            return InvalidAction("You bruh'd with an invalid move")
-        matching_thaler = [
-            color for color, coords in self.pegs.items() if coords == self.thaler_pos
-        ]
-        if not matching_thaler:
+            key = self.position_key()
+            if dst not in self.cached_moves(key, color):
+                return InvalidAction("You bruh'd with an invalid move")
+            src = self.pegs[color]
+            self.pegs[color] = dst
+            self.carry_moves(key, src, dst)
+        # Only the peg that just moved can have reached the thaler: any
+        # earlier arrival would already have ended the game.
+        if dst is not self.thaler_pos:
             self.game_ended_state = "Not_yet"
         else:
-            matching_thaler = matching_thaler[0]
-            match matching_thaler, matching_thaler, self.current_phase:
+            match color, color, self.current_phase:
                 case self.p1_color, self.p2_color, WhichPhase.P1_TURN:
                     self.game_ended_state = "P2_won"
                 case self.p1_color, _, WhichPhase.P1_TURN:
@@ -251,6 +496,8 @@ class GameState:
     def make_player_guess(
         self, which_player: Literal[1, 2], guess_of_other: Color
     ) -> None | InvalidAction:
+        """Guess the other player's colour, which ends the game either way:
+        `which_player` wins if it is right and loses if not."""
         match self.current_phase:
             case WhichPhase.SELECTING | WhichPhase.WAITING_FOR_START:
                 return InvalidAction("Can't make move when initializing!")
@@ -269,8 +516,62 @@ class GameState:
         )
         won, lost = ("P1_won", "P2_won") if which_player == 1 else ("P2_won", "P1_won")
         self.game_ended_state = won if other_player_color == guess_of_other else lost
+        self.progress_game_state()
         return
 
+    def forfeit(self, which_player: Literal[1, 2]) -> None | InvalidAction:
+        """`which_player` ran out of time on their turn; the other player wins."""
+        match self.current_phase:
+            case WhichPhase.P1_TURN if which_player == 1:
+                pass
+            case WhichPhase.P2_TURN if which_player == 2:
+                pass
+            case _:
+                return InvalidAction(f"It's not Player {which_player}'s turn!")
+        self.game_ended_state = "P2_won" if which_player == 1 else "P1_won"
+        self.progress_game_state()
+
+
+def generate_moves(src: int, occupied: int, distance: list[int]) -> list[Coords]:
+    """Moves for the peg on `src`, given the occupancy bitboard and every
+    cell's distance from the thaler."""
+    limit = distance[src]
+    valid_moves: list[Coords] = []
+    for step, jump in MOVE_TABLE[src]:
+        if not occupied >> step & 1:
+            if distance[step] <= limit:
+                valid_moves.append(COORDS[step])
+        elif (
+            jump is not None
+            and not occupied >> jump & 1
+            and distance[jump] <= limit
+        ):
+            valid_moves.append(COORDS[jump])
+    return valid_moves
+
+
+@dataclass
+class MoveCache:
+    """Counters for the moves each `GameState` caches for its position.
+
+    A state keeps one entry, keyed on `position_key()` so any change to the
+    pegs or thaler misses, and fills it one colour at a time as moves are
+    asked for. After a move it keeps the colours the move cannot affect.
+    Only the current position is kept: rooms start from random layouts and
+    rarely revisit one, and a shared table of positions costs more in
+    garbage collection than generating the moves again.
+    """
+
+    enabled: bool = True
+    hits: int = 0
+    misses: int = 0
+
+    def clear(self) -> None:
+        self.hits = self.misses = 0
+
+
+MOVE_CACHE = MoveCache()
+
 
 def color_cell(cell_content: str, color: Color | str) -> str:
     esc = color if isinstance(color, str) else COLOR_CODES[color]
@@ -281,8 +582,22 @@ def row(cells: list[str]) -> str:
     return "".join(cells) + RESET_CODE
 
 
-def generate_peg_positions() -> tuple[Coords, dict[Color, Coords]]:
-    all_pos = random.sample(list(range(0, 49)), k=8)
+# Every cell `to_board` can draw, rendered once: the checkered empty board,
+# each colour's peg and the thaler.
+EMPTY_CELLS = [color_cell("  ", [RESET_CODE, "\033[100m"][idx % 2]) for idx in range(0, 49)]
+PEG_CELLS = {color: color_cell(f"{color.to_string()} ", COLOR_CODES[color]) for color in Color}
+THALER_CELL = color_cell("T ", THALER_CODE)
+
+
+def deal(rng: random.Random | ModuleType = random) -> list[int]:
+    """The starting cells of the pegs in Color order, then of the thaler."""
+    return rng.sample(list(range(0, 49)), k=8)
+
+
+def generate_peg_positions(
+    rng: random.Random | ModuleType = random,
+) -> tuple[Coords, dict[Color, Coords]]:
+    all_pos = deal(rng)
     color_pos = {Color(idx): Coords(pos) for idx, pos in enumerate(all_pos[:7])}
     thaler_pos = Coords(all_pos[7])
     return thaler_pos, color_pos
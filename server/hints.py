@@ -0,0 +1,173 @@
+"""Move analysis for `request_hint`, run off the event loop.
+
+A hint is a `Bot` search of one position for one player. The player doesn't
+know the opponent's color, so neither does the search. Searches run in a
+process pool, so a room asking for one never holds up the other rooms on the
+event loop. Each search is keyed by what it looked at: pegs, thaler and the
+player's color. Results go into a bounded cache, and a request for a position
+already being searched waits on that search instead of starting another.
+
+A suggestion for the current position is wanted only until someone moves.
+`Room` cancels its suggestions then. A search still queued is dropped once
+nobody is waiting on it. One that has started runs out its time budget, and
+its result is still cached.
+
+Each player's requests are limited by a `TokenBucket`.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import game
+import metrics
+from bot import WIN, Bot
+
+# (pegs in Color order, thaler, color of the player asking)
+PositionKey = tuple[tuple[int, ...], int, int]
+# (color, dst, score) for every legal move, best first; scores run from -1
+# (certain loss) to 1 (certain win).
+Analysis = list[tuple[int, int, float]]
+
+
+def position_key(game_state: game.GameState, color: game.Color) -> PositionKey:
+    pegs = tuple(peg.int_repr for peg in game_state.pegs.values())
+    return pegs, game_state.thaler_pos.int_repr, color.value
+
+
+def analyse(key: PositionKey, budget: float) -> Analysis:
+    """Search one position; runs in a pool worker."""
+    pegs, thaler, color = key
+    state = game.GameState(
+        pegs={game.Color(i): game.COORDS[cell] for i, cell in enumerate(pegs)},
+        thaler_pos=game.COORDS[thaler],
+    )
+    scores = Bot(game.Color(color), time_budget=budget).rate(state)
+    ranked = sorted(scores.items(), key=lambda item: -item[1])
+    return [(peg, dst, round(score / WIN, 4)) for (peg, dst), score in ranked]
+
+
+def pool(workers: int | None = None, niceness: int = 10) -> ProcessPoolExecutor:
+    """Search processes at a lower priority than the server, so on a busy
+    machine the event loop still gets the CPU first."""
+    return ProcessPoolExecutor(workers, initializer=os.nice, initargs=(niceness,))
+
+
+@dataclass
+class TokenBucket:
+    """Allows `burst` requests at once, refilled at `rate` per second."""
+
+    rate: float = 0.5
+    burst: float = 3.0
+    tokens: float = 3.0
+    updated: float = field(default_factory=time.monotonic)
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+@dataclass
+class Search:
+    """A requested search, and how many requests are waiting on it. `job` is
+    set once it has been handed to the pool."""
+
+    result: asyncio.Future
+    job: Future | None = None
+    waiting: int = 1
+
+
+@dataclass
+class Hints:
+    """The analysis pool, its result cache and the searches asked for.
+
+    Searches queue here rather than in the executor, and one is handed to
+    the pool only when a process is free, newest first: under load the
+    requests most likely still wanted go first, and the ones cancelled while
+    waiting never cost a search. With no `executor`, searches run inline on
+    the event loop, which is only useful to compare against.
+    """
+
+    executor: Executor | None = None
+    # Searches handed to the pool at once; its number of processes.
+    slots: int = 1
+    budget: float = 0.2
+    cache_size: int = 4096
+    rate: float = 0.5
+    burst: float = 3.0
+    cache: dict[PositionKey, Analysis] = field(default_factory=dict)
+    queued: dict[PositionKey, Search] = field(default_factory=dict)
+    running: dict[PositionKey, Search] = field(default_factory=dict)
+
+    @classmethod
+    def with_pool(cls, workers: int, **options) -> "Hints":
+        return cls(pool(workers), workers, **options)
+
+    def bucket(self) -> TokenBucket:
+        return TokenBucket(self.rate, self.burst, self.burst)
+
+    async def analysis(self, key: PositionKey) -> Analysis:
+        """The analysis of `key`, from the cache, a search already asked
+        for, or a new one."""
+        if (cached := self.cache.get(key)) is not None:
+            metrics.METRICS.hints_cached += 1
+            return cached
+        if self.executor is None:
+            return self.store(key, analyse(key, self.budget))
+        if search := self.running.get(key) or self.queued.get(key):
+            search.waiting += 1
+        else:
+            search = self.queued[key] = Search(asyncio.get_running_loop().create_future())
+            self.submit()
+        try:
+            return await asyncio.shield(search.result)
+        except asyncio.CancelledError:
+            search.waiting -= 1
+            # Nobody wants it any more: drop it if it hasn't started.
+            if not search.waiting and self.queued.pop(key, None):
+                search.result.cancel()
+                metrics.METRICS.hints_cancelled += 1
+            raise
+
+    def submit(self) -> None:
+        """Hand the newest queued searches to the pool while it has room."""
+        while self.queued and len(self.running) < self.slots:
+            key = next(reversed(self.queued))
+            search = self.running[key] = self.queued.pop(key)
+            search.job = self.executor.submit(analyse, key, self.budget)  # type: ignore[union-attr]
+            started = time.perf_counter()
+            asyncio.wrap_future(search.job).add_done_callback(
+                lambda job, key=key, started=started: self.finished(key, job, started)
+            )
+
+    def finished(self, key: PositionKey, job: asyncio.Future, started: float) -> None:
+        search = self.running.pop(key)
+        if job.cancelled():
+            search.result.cancel()
+        elif (error := job.exception()) is not None:
+            search.result.set_exception(error)
+        else:
+            # Cached even if everyone waiting has gone.
+            search.result.set_result(self.store(key, job.result()))
+            metrics.METRICS.hint_search.observe(time.perf_counter() - started)
+        self.submit()
+
+    def store(self, key: PositionKey, analysis: Analysis) -> Analysis:
+        if len(self.cache) >= self.cache_size:
+            del self.cache[next(iter(self.cache))]
+        self.cache[key] = analysis
+        return analysis
+
+    def shutdown(self) -> None:
+        for search in self.queued.values():
+            search.result.cancel()
+        self.queued.clear()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,280 @@
+"""Headless load generator for the websocket protocol.
+
+Opens pairs of simulated players against a running server (or one it spawns
+with `workers.py`). Each pair plays real matches: `hello`, both
+`make_player_choice`s, then alternating `request_moves` / `make_player_move`
+turns, ending with a `make_player_guess` if nobody lands on the thaler first.
+Round-trip time is measured from sending an action to the reply it causes.
+Reports p50/p99/p999 latency per action, messages/s and server RSS, and
+writes them to a JSON file for comparing runs across commits.
+
+    python loadgen.py --spawn 1 --pairs 1000 --seconds 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import websockets
+
+import game
+
+COLORS = [color.to_string() for color in game.Color]
+
+
+@dataclass
+class Stats:
+    rtt: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    games: int = 0
+    errors: int = 0
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        result = {}
+        for action, samples in sorted(self.rtt.items()):
+            samples.sort()
+            result[action] = {
+                "count": len(samples),
+                **{
+                    name: round(samples[min(int(q * len(samples)), len(samples) - 1)] * 1000, 3)
+                    for name, q in [("p50_ms", 0.5), ("p99_ms", 0.99), ("p999_ms", 0.999)]
+                },
+            }
+        return result
+
+
+@dataclass
+class Player:
+    ws: websockets.ClientConnection
+    frames: asyncio.Queue = field(default_factory=asyncio.Queue)
+    phase: str = ""
+
+    async def read(self) -> None:
+        try:
+            async for message in self.ws:
+                self.frames.put_nowait(json.loads(message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def expect(self, header: str) -> list | dict:
+        """Wait for the next frame of a kind, tracking phase from state frames on the way."""
+        while True:
+            frame = await self.frames.get()
+            if isinstance(frame, dict):
+                self.phase = frame.get("current_phase", self.phase)
+                if header == "game_state":
+                    return frame
+                continue
+            if frame[0] == "game_state_patch":
+                self.phase = frame[1].get("current_phase", self.phase)
+            if frame[0] == header:
+                return frame
+            if frame[0] in ("invalid_action", "try_again"):
+                raise RuntimeError(frame)
+
+    def drain(self) -> None:
+        """Drop frames already received; none of them can answer the next action."""
+        while not self.frames.empty():
+            frame = self.frames.get_nowait()
+            if isinstance(frame, dict):
+                self.phase = frame.get("current_phase", self.phase)
+            elif frame[0] == "game_state_patch":
+                self.phase = frame[1].get("current_phase", self.phase)
+
+    async def call(self, stats: Stats, action: str, data: dict, reply: str) -> list | dict:
+        self.drain()
+        start = time.perf_counter()
+        await self.ws.send(json.dumps([action, data]))
+        frame = await self.expect(reply)
+        stats.rtt[action].append(time.perf_counter() - start)
+        return frame
+
+
+async def connect(host: str, port: int, hello: dict) -> tuple[Player, dict]:
+    ws = await websockets.connect(f"ws://{host}:{port}", max_queue=None)
+    await ws.send(json.dumps(["hello", hello]))
+    header, content = json.loads(await ws.recv())
+    if header == "redirect":
+        await ws.close()
+        return await connect(host, content["port"], {"room": content["room"]})
+    if header != "hello_okay":
+        await ws.close()
+        raise RuntimeError([header, content])
+    player = Player(ws)
+    asyncio.create_task(player.read())
+    return player, content
+
+
+async def play_match(host: str, port: int, stats: Stats, rng: random.Random, max_plies: int) -> None:
+    p1, hello = await connect(host, port, {"create": True})
+    p2, _ = await connect(host, port, {"room": hello["room"]})
+    players = {"P1 Turn": p1, "P2 Turn": p2}
+    try:
+        await p1.expect("game_state")
+        await p2.expect("game_state")
+        for player in (p1, p2):
+            await player.call(
+                stats, "make_player_choice", {"color": rng.choice(COLORS)}, "color_confirmed"
+            )
+        await p1.expect("game_state_patch")
+
+        for _ in range(max_plies):
+            if (mover := players.get(p1.phase)) is None:
+                break
+            for color in rng.sample(COLORS, len(COLORS)):
+                _, reply = await mover.call(
+                    stats, "request_moves", {"color": color}, "valid_moves"
+                )
+                if reply["moves"]:
+                    break
+            else:
+                break
+            await mover.call(
+                stats,
+                "make_player_move",
+                {"color": color, "dst": rng.choice(reply["moves"])},
+                "game_state_patch",
+            )
+            if mover is p2:
+                p1.phase = p2.phase
+        if (mover := players.get(p1.phase)) is not None:
+            await mover.call(
+                stats, "make_player_guess", {"color": rng.choice(COLORS)}, "game_state_patch"
+            )
+        stats.games += 1
+    finally:
+        await asyncio.gather(p1.ws.close(), p2.ws.close())
+
+
+async def run_pair(
+    host: str, port: int, stats: Stats, until: float, seed: int, max_plies: int
+) -> None:
+    rng = random.Random(seed)
+    while time.monotonic() < until:
+        try:
+            await play_match(host, port, stats, rng, max_plies)
+        except (RuntimeError, OSError, websockets.exceptions.WebSocketException):
+            stats.errors += 1
+            await asyncio.sleep(0.1)
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident set size of a process and all its descendants (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            total = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, ValueError):
+        return 0
+    return total + sum(rss_bytes(child) for child in children)
+
+
+async def sample_rss(pid: int, peak: list[int]) -> None:
+    while True:
+        peak[0] = max(peak[0], rss_bytes(pid))
+        await asyncio.sleep(0.5)
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def wait_for_server(host: str, port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def main(args: argparse.Namespace) -> dict:
+    server = None
+    pid = args.server_pid
+    if args.spawn:
+        server = subprocess.Popen(
+            [sys.executable, "workers.py", "--workers", str(args.spawn),
+             "--host", args.host, "--port", str(args.port),
+             "--metrics-port", str(args.port + 100), "--drain-timeout", "1"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        pid = server.pid
+    peak = [0]
+    try:
+        for port in [args.port, *range(args.port + 1, args.port + 1 + (args.spawn or 0))]:
+            await wait_for_server(args.host, port)
+        sampler = asyncio.create_task(sample_rss(pid, peak)) if pid else None
+
+        stats = Stats()
+        start = time.monotonic()
+        until = start + args.seconds
+        await asyncio.gather(
+            *[
+                run_pair(args.host, args.port, stats, until, args.seed + i, args.max_plies)
+                for i in range(args.pairs)
+            ]
+        )
+        elapsed = time.monotonic() - start
+        if sampler:
+            sampler.cancel()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    messages = sum(len(samples) for samples in stats.rtt.values())
+    return {
+        "commit": current_commit(),
+        "timestamp": time.time(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "players": args.pairs * 2,
+        "games": stats.games,
+        "errors": stats.errors,
+        "messages": messages,
+        "msgs_per_s": round(messages / elapsed, 1),
+        "latency": stats.summary(),
+        "server_rss_mb": round(peak[0] / 2**20, 1) if pid else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--spawn", type=int, metavar="WORKERS", help="start workers.py first")
+    parser.add_argument("--server-pid", type=int, help="sample RSS of an existing server")
+    parser.add_argument("--pairs", type=int, default=500, help="concurrent matches")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--max-plies", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="default: loadgen-<commit>.json")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    results = asyncio.run(main(args))
+    output = args.output or Path(f"loadgen-{results['commit'] or 'local'}.json")
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print(json.dumps(results, indent=2))
+    print(f"written to {output}")
@@ -0,0 +1,279 @@
+"""Metrics and logging for the websocket server.
+
+`METRICS` collects fixed-bucket histograms and counters and renders them in
+the Prometheus text format for `serve_metrics`. Every message and broadcast is
+counted, but only one in `sample_every` messages is timed, along with the
+broadcast after it, which keeps the hot-path cost to a counter increment.
+Log records are rendered to JSON lines and queued, so the event loop never
+writes; a background thread does the writing.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import TextIO
+
+# Seconds, from 10us to 1s.
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = BUCKETS
+    counts: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+    total: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.total}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+        return lines
+
+
+@dataclass
+class Metrics:
+    action_latency: dict[str, Histogram] = field(default_factory=dict)
+    json_decode: Histogram = field(default_factory=Histogram)
+    json_encode: Histogram = field(default_factory=Histogram)
+    broadcast_fanout: Histogram = field(default_factory=Histogram)
+    loop_lag: Histogram = field(default_factory=Histogram)
+    hint_search: Histogram = field(default_factory=Histogram)
+    messages: int = 0
+    invalid_actions: int = 0
+    broadcasts: int = 0
+    spectator_resyncs: int = 0
+    coalesced_frames: int = 0
+    slow_disconnects: int = 0
+    hints: int = 0
+    hints_cached: int = 0
+    hints_cancelled: int = 0
+    hints_limited: int = 0
+    resumes: int = 0
+    sessions_expired: int = 0
+    sample_every: int = 256
+    # Set by a timed message, so the broadcast after it is timed too.
+    broadcast_due: bool = False
+    # Sampled when scraped, e.g. "rooms": lambda: len(manager.rooms)
+    gauges: dict[str, Callable[[], float]] = field(default_factory=dict)
+
+    def sample_message(self) -> bool:
+        """Count a message; True when this one, and the broadcast that
+        follows it, should be timed."""
+        self.messages += 1
+        if self.messages % self.sample_every:
+            return False
+        self.broadcast_due = True
+        return True
+
+    def observe_message(
+        self, action: str, started: float, decoded: float, finished: float
+    ) -> None:
+        self.json_decode.observe(decoded - started)
+        if (histogram := self.action_latency.get(action)) is None:
+            histogram = self.action_latency[action] = Histogram()
+        histogram.observe(finished - started)
+
+    def observe_broadcast(self, started: float, encoded: float, finished: float) -> None:
+        self.broadcasts += 1
+        self.json_encode.observe(encoded - started)
+        self.broadcast_fanout.observe(finished - encoded)
+
+    def render(self) -> str:
+        lines = [
+            "# TYPE bajee_messages_total counter",
+            f"bajee_messages_total {self.messages}",
+            "# TYPE bajee_invalid_actions_total counter",
+            f"bajee_invalid_actions_total {self.invalid_actions}",
+            "# TYPE bajee_broadcasts_total counter",
+            f"bajee_broadcasts_total {self.broadcasts}",
+            "# TYPE bajee_spectator_resyncs_total counter",
+            f"bajee_spectator_resyncs_total {self.spectator_resyncs}",
+            "# TYPE bajee_coalesced_frames_total counter",
+            f"bajee_coalesced_frames_total {self.coalesced_frames}",
+            "# TYPE bajee_slow_disconnects_total counter",
+            f"bajee_slow_disconnects_total {self.slow_disconnects}",
+            "# TYPE bajee_hints_total counter",
+            f"bajee_hints_total {self.hints}",
+            "# TYPE bajee_hints_cached_total counter",
+            f"bajee_hints_cached_total {self.hints_cached}",
+            "# TYPE bajee_hints_cancelled_total counter",
+            f"bajee_hints_cancelled_total {self.hints_cancelled}",
+            "# TYPE bajee_hints_limited_total counter",
+            f"bajee_hints_limited_total {self.hints_limited}",
+            "# TYPE bajee_resumes_total counter",
+            f"bajee_resumes_total {self.resumes}",
+            "# TYPE bajee_sessions_expired_total counter",
+            f"bajee_sessions_expired_total {self.sessions_expired}",
+            "# TYPE bajee_action_latency_seconds histogram",
+        ]
+        for action, histogram in sorted(self.action_latency.items()):
+            lines += histogram.render("bajee_action_latency_seconds", f'action="{action}"')
+        for name, histogram in [
+            ("bajee_json_decode_seconds", self.json_decode),
+            ("bajee_json_encode_seconds", self.json_encode),
+            ("bajee_broadcast_fanout_seconds", self.broadcast_fanout),
+            ("bajee_event_loop_lag_seconds", self.loop_lag),
+            ("bajee_hint_search_seconds", self.hint_search),
+        ]:
+            lines.append(f"# TYPE {name} histogram")
+            lines += histogram.render(name)
+        for name, gauge in sorted(self.gauges.items()):
+            lines.append(f"# TYPE bajee_{name} gauge")
+            lines.append(f"bajee_{name} {gauge()}")
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics(Metrics):
+    """Times nothing; used to measure what instrumentation costs."""
+
+    def sample_message(self) -> bool:
+        return False
+
+
+METRICS = Metrics()
+
+
+async def monitor_loop_lag(interval: float = 0.25) -> None:
+    """Record how late the event loop wakes up from a fixed sleep."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        METRICS.loop_lag.observe(max(loop.time() - start - interval, 0.0))
+
+
+async def serve_metrics(host: str = "127.0.0.1", port: int = 9100) -> asyncio.Server:
+    """Serve `GET /metrics` in the Prometheus text format."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            if request.split()[1:2] == [b"/metrics"]:
+                status, body = "200 OK", METRICS.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in _RECORD_ATTRS
+        )
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LogWriter(threading.Thread):
+    """Writes the lines queued in `lines` to `stream` until `stop`.
+
+    Once woken by a line it waits `interval` seconds and writes everything
+    queued by then at once. Waking for every line would take the GIL from
+    the event loop each time something is logged.
+    """
+
+    def __init__(self, stream: TextIO, interval: float = 0.05) -> None:
+        super().__init__(name="log-writer", daemon=True)
+        self.stream = stream
+        self.interval = interval
+        self.lines: queue.SimpleQueue[str | None] = queue.SimpleQueue()
+
+    def run(self) -> None:
+        while True:
+            batch = [self.lines.get()]
+            time.sleep(self.interval)
+            while not self.lines.empty():
+                batch.append(self.lines.get())
+            self.stream.write("".join(f"{line}\n" for line in batch if line is not None))
+            self.stream.flush()
+            if None in batch:
+                return
+
+    def stop(self) -> None:
+        """Write what has been logged so far, then end the thread."""
+        self.lines.put(None)
+        self.join()
+
+
+class QueueLines(logging.Handler):
+    """Renders each record to a JSON line where it is logged, so the writer
+    thread never touches objects that belong to the event loop, and queues
+    the line for it. Unlike `QueueHandler`, no copy of the record is made."""
+
+    def __init__(self, writer: LogWriter) -> None:
+        super().__init__()
+        self.writer = writer
+        self.setFormatter(JsonFormatter())
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.writer.lines.put(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def setup_logging(level: int = logging.INFO, stream: TextIO | None = None) -> LogWriter:
+    """Send JSON-lines log records through a queue to a writer thread,
+    which writes them to `stream`, stderr by default."""
+    writer = LogWriter(stream or sys.stderr)
+    writer.start()
+    root = logging.getLogger()
+    root.handlers = [QueueLines(writer)]
+    root.setLevel(level)
+    # What the JSON lines leave out isn't worth gathering for every record:
+    # the caller's file and line, and the thread, process and task names.
+    logging._srcfile = None  # type: ignore[attr-defined]
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False  # type: ignore[attr-defined]
+    # websockets logs every connection opening and closing at INFO.
+    logging.getLogger("websockets").setLevel(max(level, logging.WARNING))
+    return writer
+
@@ -0,0 +1,275 @@
+"""Compact game records: the seed that dealt the board, then a byte per action.
+
+`GameState.create(seed)` always deals the same board, so a record replays a
+whole match from its seed, the colours the players picked and the actions
+played. Player 1 moves first and turns alternate, so actions don't say whose
+they are:
+
+    0..55     move: color * 8 + direction, an index into `game.DIRECTIONS`.
+              A peg has at most one move per direction: the neighbouring
+              cell, or the cell beyond it when jumping (as in `batch.py`).
+    0x40 | c  guess that the opponent's colour is c
+    0x7F      ran out of time and forfeited
+    0x80 | n  player 2 placed the thaler on cell n; only ever the first
+              action, and only in games played with `placement`
+
+A record is `<Q B B>` (seed, player 1's colour, player 2's colour, 0xFF for
+none) followed by its actions. A file is a 5-byte header (`BJGR`, version)
+and records back to back, each prefixed by its length as an unsigned LEB128
+varint. Both ends work in large blocks: `write_records` buffers, and
+`read_records` is a generator that reads a block at a time, so files of
+millions of records stream in constant memory.
+
+    python records.py games.bin [--replay]
+"""
+
+import argparse
+import struct
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Literal
+
+import game
+
+MAGIC = b"BJGR"
+VERSION = 1
+HEADER = MAGIC + bytes((VERSION,))
+FIXED = struct.Struct("<QBB")
+GUESS, FORFEIT, PLACE = 0x40, 0x7F, 0x80
+NO_COLOR = 0xFF
+BLOCK = 1 << 20
+
+N_DIRECTIONS = len(game.DIRECTIONS)
+
+# STEP[src][direction] / JUMP[src][direction]: the cell one and two away, or None.
+STEP = [[game.offset_cell(src, dx, dy) for dx, dy in game.DIRECTIONS] for src in range(game.BOARD_CELLS)]
+JUMP = [
+    [game.offset_cell(src, dx * 2, dy * 2) for dx, dy in game.DIRECTIONS]
+    for src in range(game.BOARD_CELLS)
+]
+# DIRECTION[src][dst]: which way a move from `src` to `dst` goes, or None.
+DIRECTION: list[list[int | None]] = [[None] * game.BOARD_CELLS for _ in range(game.BOARD_CELLS)]
+for _src in range(game.BOARD_CELLS):
+    for _d in range(N_DIRECTIONS):
+        for _dst in (STEP[_src][_d], JUMP[_src][_d]):
+            if _dst is not None:
+                DIRECTION[_src][_dst] = _d
+
+# (which player, action, color, dst) as passed to `GameState`; `forfeit` has
+# neither color nor dst, and `place_thaler` no color.
+Action = tuple[Literal[1, 2], str, game.Color | None, game.Coords | None]
+
+
+def move_code(color: game.Color, src: game.Coords, dst: game.Coords) -> int:
+    direction = DIRECTION[src.int_repr][dst.int_repr]
+    if direction is None:
+        raise ValueError(f"no move from {src.int_repr} to {dst.int_repr}")
+    return color.value * N_DIRECTIONS + direction
+
+
+def guess_code(color: game.Color) -> int:
+    return GUESS | color.value
+
+
+def place_code(dst: game.Coords) -> int:
+    return PLACE | dst.int_repr
+
+
+@dataclass
+class GameRecord:
+    seed: int
+    p1_color: game.Color | None
+    p2_color: game.Color | None
+    actions: bytes = b""
+
+    def encode(self) -> bytes:
+        p1 = NO_COLOR if self.p1_color is None else self.p1_color.value
+        p2 = NO_COLOR if self.p2_color is None else self.p2_color.value
+        return FIXED.pack(self.seed, p1, p2) + self.actions
+
+    @classmethod
+    def decode(cls, body: bytes | memoryview) -> "GameRecord":
+        seed, p1, p2 = FIXED.unpack_from(body)
+        return cls(
+            seed,
+            None if p1 == NO_COLOR else game.Color(p1),
+            None if p2 == NO_COLOR else game.Color(p2),
+            bytes(body[FIXED.size :]),
+        )
+
+    def initial_state(self) -> game.GameState:
+        """The dealt board with both colours picked: player 1 to move, or
+        player 2 to place the thaler."""
+        placement = bool(self.actions) and self.actions[0] & PLACE != 0
+        state = game.GameState.create(self.seed, placement)
+        state.current_phase = game.WhichPhase.SELECTING
+        if self.p1_color is not None:
+            state.make_player_choice(1, self.p1_color)
+        if self.p2_color is not None:
+            state.make_player_choice(2, self.p2_color)
+        return state
+
+    def play(self) -> Iterator[tuple[game.GameState, Action]]:
+        """Each action with the state it is played from, applied once the
+        caller moves on. Raises ValueError for an action the rules refuse."""
+        state = self.initial_state()
+        for code in self.actions:
+            which_player: Literal[1, 2] = (
+                1 if state.current_phase == game.WhichPhase.P1_TURN else 2
+            )
+            if code & PLACE:
+                dst = game.COORDS[code & ~PLACE]
+                yield state, (which_player, "place_thaler", None, dst)
+                result = state.place_thaler(which_player, dst)
+            elif code == FORFEIT:
+                action: Action = (which_player, "forfeit", None, None)
+                yield state, action
+                result = state.forfeit(which_player)
+            elif code & GUESS:
+                color = game.Color(code & ~GUESS)
+                yield state, (which_player, "make_player_guess", color, None)
+                result = state.make_player_guess(which_player, color)
+            else:
+                color = game.Color(code // N_DIRECTIONS)
+                src = state.pegs[color].int_repr
+                direction = code % N_DIRECTIONS
+                step, jump = STEP[src][direction], JUMP[src][direction]
+                occupied = state.occupancy()
+                cell = step if step is not None and not occupied >> step & 1 else jump
+                if cell is None:
+                    raise ValueError(f"move {code} runs off the board")
+                dst = game.COORDS[cell]
+                yield state, (which_player, "make_player_move", color, dst)
+                result = state.make_player_move(which_player, color, dst)
+            if result is not None:
+                raise ValueError(f"record of seed {self.seed}: {result.message}")
+
+    def replay(self) -> game.GameState:
+        """The state the match ended in."""
+        state = self.initial_state()
+        for state, _ in self.play():
+            pass
+        return state
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+@dataclass
+class RecordWriter:
+    """Appends records to a file, writing a block at a time."""
+
+    file: IO[bytes]
+    block: int = BLOCK
+    pending: bytearray = field(default_factory=bytearray)
+    records: int = 0
+
+    @classmethod
+    def open(cls, path: str | Path, **kwargs) -> "RecordWriter":
+        file = Path(path).open("ab")
+        if file.tell() == 0:
+            file.write(HEADER)
+        return cls(file, **kwargs)
+
+    def write(self, record: GameRecord) -> None:
+        body = record.encode()
+        # Almost every record is under 128 bytes: a one-byte length.
+        self.pending += bytes((len(body),)) if len(body) < 0x80 else _varint(len(body))
+        self.pending += body
+        self.records += 1
+        if len(self.pending) >= self.block:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.pending:
+            self.file.write(self.pending)
+            self.file.flush()
+            self.pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+def write_records(path: str | Path, records: Iterable[GameRecord]) -> int:
+    """Write `records` to a new file at `path`; returns how many."""
+    Path(path).unlink(missing_ok=True)
+    writer = RecordWriter.open(path)
+    for record in records:
+        writer.write(record)
+    writer.close()
+    return writer.records
+
+
+def read_bodies(path: str | Path, block: int = BLOCK, offset: int = 0) -> Iterator[bytes]:
+    """The encoded body of each record in the file, in order, starting with
+    the record at byte `offset` if given. A record cut short at the end of
+    the file, as by a crash mid-write, is skipped."""
+    with Path(path).open("rb") as f:
+        if f.read(len(HEADER)) != HEADER:
+            raise ValueError(f"{path} is not a version {VERSION} game record file")
+        if offset > len(HEADER):
+            f.seek(offset)
+        buffer = b""
+        while chunk := f.read(block):
+            buffer += chunk
+            end, pos = len(buffer), 0
+            while pos < end:
+                size = buffer[pos]
+                start = pos + 1
+                if size & 0x80:
+                    size, shift = size & 0x7F, 7
+                    while start < end and buffer[start] & 0x80:
+                        size |= (buffer[start] & 0x7F) << shift
+                        start, shift = start + 1, shift + 7
+                    if start >= end:
+                        break
+                    size |= buffer[start] << shift
+                    start += 1
+                if start + size > end:
+                    break
+                yield buffer[start : start + size]
+                pos = start + size
+            buffer = buffer[pos:]
+
+
+def record_size(body: bytes) -> int:
+    """Bytes taken in the file by the record with this body."""
+    return len(body) + (1 if len(body) < 0x80 else len(_varint(len(body))))
+
+
+def read_records(path: str | Path, block: int = BLOCK, offset: int = 0) -> Iterator[GameRecord]:
+    for body in read_bodies(path, block, offset):
+        yield GameRecord.decode(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--replay", action="store_true", help="replay every record too")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    games = actions = 0
+    results: dict[str, int] = {}
+    for record in read_records(args.path):
+        games += 1
+        actions += len(record.actions)
+        if args.replay:
+            result = record.replay().game_ended_state
+            results[result] = results.get(result, 0) + 1
+    elapsed = time.perf_counter() - start
+    print(f"{games} games, {actions} actions in {elapsed:.2f} s")
+    if results:
+        print(", ".join(f"{result}: {n}" for result, n in sorted(results.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,37 @@
+import argparse
 import asyncio
 import json
+import logging
+import secrets
+import sys
+import time
+import zlib
+from collections import deque
 from collections.abc import Awaitable
+from concurrent.futures import BrokenExecutor
 from dataclasses import dataclass, field
-from typing import Any, Callable, Literal, Self, TypeGuard, cast, get_args
+from typing import Any, Callable, Literal, Protocol, Self, TypeGuard, cast, get_args
 
-from dataclasses_json import dataclass_json
+import console
 import game
+import metrics
 import websockets
-from websockets import WebSocketServerProtocol
-from collections import defaultdict
-from game import GameState, Color
+import wire
+from hints import Hints, PositionKey, TokenBucket, position_key
+from records import FORFEIT, GameRecord, RecordWriter, guess_code, move_code, place_code
+from store import FileStore, Store
+from timers import Timer, TimerWheel
+
+log = logging.getLogger("room")
 
 Action = Literal[
-    "make_player_choice", "make_player_move", "make_player_guess", "request_moves"
+    "make_player_choice",
+    "make_player_move",
+    "make_player_guess",
+    "place_thaler",
+    "request_moves",
+    "request_snapshot",
+    "request_hint",
 ]
 
 
@@ -20,9 +39,8 @@ def is_action(s: Any) -> TypeGuard[Action]:
     return s in get_args(Action)
 
 
-@dataclass_json
 @dataclass(frozen=True, kw_only=True)
-class GameStateForClient:
+class GameStateForClient(game.LazyJson):
     __magic__: Literal["game_state"] = "game_state"
     you_are: Literal[1, 2]
     pegs: dict[game.Color, game.Coords] = field(
@@ -37,22 +55,314 @@ class GameStateForClient:
     )
     thaler_pos: game.Coords
     current_phase: game.WhichPhase
+    seq: int = 0
 
     @classmethod
-    def of_game_state(cls, game_state: game.GameState, you_are: Literal[1, 2]) -> Self:
+    def of_game_state(
+        cls, game_state: game.GameState, you_are: Literal[1, 2], seq: int = 0
+    ) -> Self:
         return cls(
             you_are=you_are,
             pegs=game_state.pegs,
             thaler_pos=game_state.thaler_pos,
             current_phase=game_state.current_phase,
+            seq=seq,
         )
 
+    @staticmethod
+    def encode_for_players(
+        game_state: game.GameState, seq: int = 0
+    ) -> tuple[str, str]:
+        """`of_game_state(...).to_json()` for player 1 and player 2.
+
+        Everything after `you_are` is the same for both players, so it is
+        encoded once and spliced onto each player's prefix.
+        """
+        shared = encode_shared_state(game_state, seq)
+        return CLIENT_STATE_PREFIX[1] + shared, CLIENT_STATE_PREFIX[2] + shared
+
+    @staticmethod
+    def encode_for_spectators(game_state: game.GameState, seq: int = 0) -> str:
+        """The same snapshot with `you_are` set to null."""
+        return CLIENT_STATE_PREFIX[None] + encode_shared_state(game_state, seq)
+
+
+def encode_shared_state(game_state: game.GameState, seq: int) -> str:
+    """Everything in a client snapshot after `you_are`."""
+    pegs = ", ".join(
+        f"{COLOR_KEYS[color]}: {peg.int_repr}"
+        for color, peg in game_state.pegs.items()
+    )
+    return (
+        f', "pegs": {{{pegs}}}, '
+        f'"thaler_pos": {{"int_repr": {game_state.thaler_pos.int_repr}}}, '
+        f'"current_phase": {game.PHASE_JSON[game_state.current_phase]}, '
+        f'"seq": {seq}}}'
+    )
+
+
+COLOR_KEYS = {color: json.dumps(color.to_string()) for color in game.Color}
+
+CLIENT_STATE_PREFIX = {
+    you_are: f'{{"__magic__": "game_state", "you_are": {json.dumps(you_are)}'
+    for you_are in (1, 2, None)
+}
+
+# What clients are shown of a game state: pegs, thaler and phase.
+ClientView = tuple[dict[game.Color, game.Coords], game.Coords, game.WhichPhase]
+
+
+def client_view(game_state: game.GameState) -> ClientView:
+    return dict(game_state.pegs), game_state.thaler_pos, game_state.current_phase
+
+
+def state_patch(old: ClientView, new: ClientView) -> dict[str, Any]:
+    """The fields of `new` that differ from `old`, in the snapshot's wire format."""
+    old_pegs, old_thaler, old_phase = old
+    new_pegs, new_thaler, new_phase = new
+    patch: dict[str, Any] = {}
+    if pegs := {
+        color.to_string(): peg.int_repr
+        for color, peg in new_pegs.items()
+        if old_pegs.get(color) is not peg
+    }:
+        patch["pegs"] = pegs
+    if new_thaler is not old_thaler:
+        patch["thaler_pos"] = new_thaler.int_repr
+    if new_phase != old_phase:
+        patch["current_phase"] = new_phase.value
+    return patch
+
+
+@dataclass(eq=False)
+class Spectator:
+    """One watcher's bounded queue of encoded frames, drained by its own task.
+
+    Frames are bytes shared by every spectator of a room: UTF-8 JSON sent as
+    text, or `wire` frames for spectators that picked the binary format. When
+    a slow connection lets `limit` frames pile up, the queue is dropped and
+    the next thing sent is `resync()`, the room's latest snapshot.
+    """
+
+    ws: websockets.ServerConnection
+    resync: Callable[[], bytes]
+    limit: int = 64
+    binary: bool = False
+    frames: deque[bytes] = field(default_factory=deque)
+    # Starts stale so the first frame sent is a snapshot.
+    stale: bool = True
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task | None = None
+    # Set by `finish`: exit once everything queued is written.
+    finishing: bool = False
+
+    def start(self) -> None:
+        self.wakeup.set()
+        self.task = asyncio.create_task(self.run())
+
+    def push(self, frame: bytes) -> None:
+        if self.stale:
+            return
+        if len(self.frames) >= self.limit:
+            self.frames.clear()
+            self.stale = True
+            metrics.METRICS.spectator_resyncs += 1
+        else:
+            self.frames.append(frame)
+        self.wakeup.set()
+
+    def request_snapshot(self) -> None:
+        self.frames.clear()
+        self.stale = True
+        self.wakeup.set()
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                if self.stale:
+                    self.stale = False
+                    await self.ws.send(self.resync(), text=not self.binary)
+                while self.frames and not self.stale:
+                    await self.ws.send(self.frames.popleft(), text=not self.binary)
+                if self.finishing:
+                    return
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def finish(self) -> None:
+        self.finishing = True
+        self.wakeup.set()
+
+    def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+
+@dataclass(eq=False)
+class Outbox:
+    """A player connection's outbound messages, written by its own task.
+
+    `Room` queues messages here and carries on, so a slow or stalled client
+    only ever holds up its own writer, never the game. State frames are
+    coalesced: one arriving while the last is still unsent replaces both with
+    `resync()`, the latest snapshot, encoded when the writer gets to it.
+    Other messages are sent in order; once `limit` of them are waiting the
+    client has fallen too far behind and is disconnected, free to reconnect
+    and start again from a snapshot.
+    """
+
+    ws: websockets.ServerConnection
+    which_player: Literal[1, 2]
+    resync: Callable[[], str | bytes]
+    limit: int = 64
+    binary: bool = False
+    messages: deque[str | bytes] = field(default_factory=deque)
+    # The next state frame, if one is waiting and nothing has been dropped.
+    state: str | bytes | None = None
+    # Set when state frames were dropped: send `resync()` instead.
+    stale: bool = False
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task | None = None
+    closing: asyncio.Task | None = None
+    # Set by `finish`: exit once everything queued is written.
+    finishing: bool = False
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    def send(self, message: str | bytes) -> None:
+        if self.closing:
+            return
+        if len(self.messages) >= self.limit:
+            self.messages.clear()
+            self.state = None
+            self.stale = False
+            metrics.METRICS.slow_disconnects += 1
+            log.info("client too slow", extra={"player": self.which_player})
+            self.stop()
+            self.closing = asyncio.create_task(self.ws.close(1013, "too slow"))
+            return
+        self.messages.append(message)
+        self.wakeup.set()
+
+    def push(self, frame: str | bytes) -> None:
+        if self.stale or self.closing:
+            return
+        if self.state is not None:
+            self.state = None
+            self.stale = True
+            metrics.METRICS.coalesced_frames += 1
+        else:
+            self.state = frame
+        self.wakeup.set()
+
+    def request_snapshot(self) -> None:
+        if self.closing:
+            return
+        self.state = None
+        self.stale = True
+        self.wakeup.set()
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while True:
+                    if self.messages:
+                        await self.ws.send(self.messages.popleft())
+                    elif self.stale:
+                        self.stale = False
+                        await self.ws.send(self.resync())
+                    elif (frame := self.state) is not None:
+                        self.state = None
+                        await self.ws.send(frame)
+                    else:
+                        break
+                if self.finishing:
+                    return
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def finish(self) -> None:
+        self.finishing = True
+        self.wakeup.set()
+
+    def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
 
 @dataclass
 class Room:
     game_state: game.GameState
     p1: websockets.ServerConnection | None = None
     p2: websockets.ServerConnection | None = None
+    room_id: str = ""
+    store: Store | None = None
+    # Sequence number of the last state frame sent, and what it showed.
+    seq: int = 0
+    last_broadcast: ClientView | None = None
+    # The last `HISTORY` state frames as (seq, player 1's, player 2's), for
+    # players resuming after a dropped connection.
+    history: deque[tuple[int, str, str]] = field(
+        default_factory=lambda: deque(maxlen=HISTORY)
+    )
+    # Each seat's resume token; see `Session`.
+    sessions: dict[Literal[1, 2], "Session"] = field(default_factory=dict)
+    spectators: dict[websockets.ServerConnection, Spectator] = field(default_factory=dict)
+    # Where everything sent to a player connection is queued.
+    outboxes: dict[websockets.ServerConnection, Outbox] = field(default_factory=dict)
+    # Messages from both players, applied in arrival order by `run`, the
+    # only code that acts on them.
+    mailbox: deque[tuple[Literal[1, 2], websockets.Data]] = field(default_factory=deque)
+    mail: asyncio.Event = field(default_factory=asyncio.Event)
+    actor: asyncio.Task | None = None
+    closed: bool = False
+    # Set up by `RoomManager.track`: the clock of the player to move, and the
+    # deadline after which a room nobody acts in is closed.
+    turn_clock: Timer | None = None
+    idle_clock: Timer | None = None
+    turn_timeout: float = 60.0
+    idle_timeout: float = 600.0
+    # Phase the turn clock was last started or stopped for.
+    clock_phase: game.WhichPhase | None = None
+    # Where `request_hint` searches run; None disables hints.
+    hints: Hints | None = None
+    # Hints on their way to players: suggestions for the current position,
+    # cancelled as soon as it changes, and ratings of moves already made.
+    suggestions: set[asyncio.Task] = field(default_factory=set)
+    ratings: set[asyncio.Task] = field(default_factory=set)
+    hint_buckets: dict[Literal[1, 2], TokenBucket] = field(default_factory=dict)
+    # The position each player last moved from, and the (color, dst) played.
+    last_moves: dict[Literal[1, 2], tuple[PositionKey, int, int]] = field(
+        default_factory=dict
+    )
+    # The seed the board was dealt from and every action played since, written
+    # to `archive` as a `GameRecord` once the game ends. Rooms restored from
+    # the store have no seed and aren't archived.
+    seed: int | None = None
+    actions: bytearray = field(default_factory=bytearray)
+    archive: RecordWriter | None = None
+    # Spectator snapshot for `seq`, shared by every spectator resyncing at once.
+    _spectator_snapshot: tuple[int, bytes] | None = None
+
+    def held(self, which_player: Literal[1, 2]) -> bool:
+        """Whether a disconnected player's seat is kept for them to resume."""
+        session = self.sessions.get(which_player)
+        return session is not None and session.grace.active
+
+    def free_seat(self) -> Literal[1, 2] | None:
+        if not self.p1 and not self.held(1):
+            return 1
+        if not self.p2 and not self.held(2):
+            return 2
+        return None
+
+    def is_empty(self) -> bool:
+        return self.p1 is None and self.p2 is None and not self.held(1) and not self.held(2)
 
     def connect(
         self, which_player: Literal[1, 2], websocket: websockets.ServerConnection
@@ -72,117 +382,929 @@ class Room:
             and self.game_state.current_phase == game.WhichPhase.WAITING_FOR_START
         ):
             self.game_state.current_phase = game.WhichPhase.SELECTING
+            if self.store:
+                self.store.phase(self.room_id, self.game_state.current_phase)
+
+    def touch(self) -> None:
+        """Push the idle deadline back; lazily, so cheap on every message."""
+        if self.idle_clock:
+            self.idle_clock.reset(self.idle_timeout)
 
-    async def update_clients(self) -> None:
-        def state(you_are: Literal[1, 2]) -> str:
-            return GameStateForClient.of_game_state(
-                self.game_state, you_are=you_are
-            ).to_json()
-
-        _ = await asyncio.gather(
-            *[
-                conn.send(state(cast(Literal[1, 2], you_are)))
-                for (you_are, conn) in [(1, self.p1), (2, self.p2)]
-                if conn
-            ]
+    def run_turn_clock(self) -> None:
+        """Restart the turn clock whenever the turn passes, and stop it once
+        the game is no longer in a turn."""
+        phase = self.game_state.current_phase
+        if not self.turn_clock or phase == self.clock_phase:
+            return
+        self.clock_phase = phase
+        if phase in (
+            game.WhichPhase.PLACING_THALER,
+            game.WhichPhase.P1_TURN,
+            game.WhichPhase.P2_TURN,
+        ):
+            self.turn_clock.reset(self.turn_timeout)
+        else:
+            self.turn_clock.cancel()
+
+    def turn_expired(self) -> None:
+        """The player to move ran out of time and forfeits. Player 2 running
+        out of time to place the thaler leaves it where it was dealt."""
+        which_player = 1 if self.game_state.current_phase == game.WhichPhase.P1_TURN else 2
+        if self.game_state.current_phase == game.WhichPhase.PLACING_THALER:
+            dealt = self.game_state.thaler_pos
+            self.game_state.place_thaler(2, dealt)
+            if self.store:
+                self.store.placed(self.room_id, 2, dealt)
+            if self.archive:
+                self.actions.append(place_code(dealt))
+        elif self.game_state.forfeit(which_player) is not None:
+            return
+        else:
+            if self.store:
+                self.store.forfeit(self.room_id, which_player)
+            if self.archive:
+                self.actions.append(FORFEIT)
+                self.archive_game()
+        log.info("turn timed out", extra={"room": self.room_id, "player": which_player})
+        self.cancel_suggestions()
+        self.run_turn_clock()
+        if self.outboxes or self.spectators:
+            self.update_clients()
+
+    def open_outbox(
+        self,
+        which_player: Literal[1, 2],
+        websocket: websockets.ServerConnection,
+        format: wire.Format = "json",
+        limit: int = 64,
+    ) -> Outbox:
+        """Queue for a player connection, with its writer task started."""
+        binary = format == "binary"
+        outbox = Outbox(
+            websocket, which_player, lambda: self.snapshot(which_player, binary), limit, binary
         )
-        return
+        self.outboxes[websocket] = outbox
+        outbox.start()
+        return outbox
+
+    def close_outbox(self, websocket: websockets.ServerConnection) -> None:
+        if outbox := self.outboxes.pop(websocket, None):
+            outbox.stop()
+
+    def send(self, which_player: Literal[1, 2], message: str | bytes) -> None:
+        """Queue a message for a player, if they are connected."""
+        if outbox := self.outboxes.get(self.p1 if which_player == 1 else self.p2):  # type: ignore[arg-type]
+            outbox.send(message)
+
+    def snapshot(self, which_player: Literal[1, 2], binary: bool = False) -> str | bytes:
+        """Full state for one player, tagged with the current sequence number."""
+        if binary:
+            return wire.encode_state(self.game_state, self.seq)
+        state = GameStateForClient.encode_for_players(self.game_state, self.seq)
+        return state[which_player - 1]
+
+    def spectator_snapshot(self) -> bytes:
+        if self._spectator_snapshot is None or self._spectator_snapshot[0] != self.seq:
+            frame = GameStateForClient.encode_for_spectators(self.game_state, self.seq)
+            self._spectator_snapshot = self.seq, frame.encode()
+        return self._spectator_snapshot[1]
+
+    def binary_snapshot(self) -> bytes:
+        return wire.encode_state(self.game_state, self.seq)
+
+    def watch(
+        self,
+        websocket: websockets.ServerConnection,
+        limit: int = 64,
+        format: wire.Format = "json",
+    ) -> Spectator:
+        if format == "binary":
+            spectator = Spectator(websocket, self.binary_snapshot, limit, binary=True)
+        else:
+            spectator = Spectator(websocket, self.spectator_snapshot, limit)
+        self.spectators[websocket] = spectator
+        return spectator
 
-    async def process_message(
+    def unwatch(self, websocket: websockets.ServerConnection) -> None:
+        if spectator := self.spectators.pop(websocket, None):
+            spectator.stop()
+
+    def encode_update(self) -> tuple[str, str, str] | None:
+        """Frames for player 1, player 2 and spectators covering what changed
+        since the last broadcast.
+
+        The first broadcast is a full snapshot; after that each frame is a
+        `game_state_patch` holding the next sequence number and only the
+        changed pegs, thaler or phase, shared by everyone. None when nothing
+        changed. Binary connections get a `wire` state frame instead, built
+        in `send_frames`.
+        """
+        view = client_view(self.game_state)
+        if self.last_broadcast is None:
+            self.seq += 1
+            p1, p2 = GameStateForClient.encode_for_players(self.game_state, self.seq)
+            state = p1, p2, GameStateForClient.encode_for_spectators(self.game_state, self.seq)
+        else:
+            if not (patch := state_patch(self.last_broadcast, view)):
+                return None
+            self.seq += 1
+            frame = json.dumps(["game_state_patch", {"seq": self.seq, **patch}])
+            state = frame, frame, frame
+        self.last_broadcast = view
+        self.history.append((self.seq, state[0], state[1]))
+        return state
+
+    def send_frames(self, state: tuple[str, str, str]) -> None:
+        # The whole board fits in one binary frame, shared by every binary
+        # connection; built only when one is listening.
+        binary = None
+        for outbox in self.outboxes.values():
+            if not outbox.binary:
+                outbox.push(state[outbox.which_player - 1])
+            else:
+                if binary is None:
+                    binary = wire.encode_state(self.game_state, self.seq)
+                outbox.push(binary)
+        if self.spectators:
+            # Encoded once; every spectator queues the same bytes object.
+            frame = state[2].encode()
+            for spectator in self.spectators.values():
+                if not spectator.binary:
+                    spectator.push(frame)
+                else:
+                    if binary is None:
+                        binary = wire.encode_state(self.game_state, self.seq)
+                    spectator.push(binary)
+
+    def update_clients(self) -> None:
+        """Queue what changed since the last broadcast, if anything did."""
+        if not metrics.METRICS.broadcast_due:
+            if state := self.encode_update():
+                self.send_frames(state)
+                metrics.METRICS.broadcasts += 1
+            return
+        metrics.METRICS.broadcast_due = False
+        started = time.perf_counter()
+        state = self.encode_update()
+        encoded = time.perf_counter()
+        if state:
+            self.send_frames(state)
+            metrics.METRICS.observe_broadcast(started, encoded, time.perf_counter())
+
+    def catch_up(self, which_player: Literal[1, 2], seq: int | None) -> int:
+        """Send a resuming player the state frames after `seq`, the last one
+        they saw, or a snapshot if those aren't all in `history` or wouldn't
+        fit in the outbox under its limit. Binary frames hold the whole state,
+        so binary connections always get a snapshot. Returns the number of
+        frames replayed."""
+        outbox = self.outboxes[self.p1 if which_player == 1 else self.p2]  # type: ignore[index]
+        missed = self.seq - seq if seq is not None else -1
+        space = outbox.limit - len(outbox.messages)
+        if outbox.binary or not 0 <= missed <= min(len(self.history), space):
+            outbox.request_snapshot()
+            return 0
+        frames = list(self.history)[len(self.history) - missed :]
+        for _, *players in frames:
+            outbox.send(players[which_player - 1])
+        return missed
+
+    def post(self, which_player: Literal[1, 2], message: websockets.Data) -> None:
+        """Queue a player's message for the room's actor, starting it if need be."""
+        if self.closed:
+            return
+        self.mailbox.append((which_player, message))
+        self.mail.set()
+        if self.actor is None:
+            self.start_actor()
+
+    def start_actor(self) -> None:
+        self.actor = asyncio.create_task(self.run())
+        self.actor.add_done_callback(self.actor_done)
+
+    def actor_done(self, actor: asyncio.Task) -> None:
+        """Restart the actor if it died, rather than leave the room deaf to
+        every message after the one that killed it."""
+        self.actor = None
+        if actor.cancelled() or self.closed:
+            return
+        log.error("room actor died", exc_info=actor.exception(), extra={"room": self.room_id})
+        self.start_actor()
+        if self.mailbox:
+            self.mail.set()
+
+    async def run(self) -> None:
+        """The room's actor: applies whatever has arrived, in order, then
+        broadcasts once for the lot."""
+        while True:
+            await self.mail.wait()
+            self.mail.clear()
+            self.drain()
+
+    def drain(self) -> int:
+        """Apply every queued message and send one combined update; returns
+        how many were applied.
+
+        Nothing here awaits, so no other coroutine sees the game state part
+        way through a batch.
+        """
+        batch = len(self.mailbox)
+        for _ in range(batch):
+            which_player, message = self.mailbox.popleft()
+            try:
+                result = self.process_message(which_player, message)
+            except (ValueError, TypeError, KeyError, AttributeError):
+                # Undecodable JSON or wire frame, or the wrong shape.
+                result = game.InvalidAction("malformed message")
+            except Exception:
+                # Nested too deep to decode, or the store failing: this
+                # message is lost, but the rest of the batch still applies.
+                log.exception("message failed", extra={"room": self.room_id})
+                result = game.InvalidAction("message failed")
+            if result:
+                # Counted rather than logged at info: a client sending
+                # nothing but bad messages would otherwise flood the log.
+                metrics.METRICS.invalid_actions += 1
+                log.debug(
+                    "invalid action",
+                    extra={"room": self.room_id, "reason": result.message},
+                )
+                self.send(which_player, json.dumps(["invalid_action", result.message]))
+        if batch:
+            self.update_clients()
+        return batch
+
+    def stop(self) -> None:
+        """Stop the actor; anything still queued or posted later is dropped."""
+        self.closed = True
+        self.mailbox.clear()
+        if self.actor:
+            self.actor.cancel()
+        for task in [*self.suggestions, *self.ratings]:
+            task.cancel()
+
+    def process_message(
         self, which_player: Literal[1, 2], message: websockets.Data
     ) -> game.InvalidAction | None:
+        """Apply one client message, JSON text or a binary `wire` frame.
+
+        Replies go to the player's outbox; the state update is left to the
+        caller, so a batch of messages shares one broadcast.
+        """
         data: dict[str, Any]
-        action, data = json.loads(message)
+        if not metrics.METRICS.sample_message():
+            if isinstance(message, bytes):
+                return self.perform(which_player, *wire.decode_action(message))
+            action, data = json.loads(message)
+            return self.apply_action(which_player, action, data)
+        started = time.perf_counter()
+        if isinstance(message, bytes):
+            action, color, dst = wire.decode_action(message)
+            decoded = time.perf_counter()
+            result = self.perform(which_player, action, color, dst)
+        else:
+            action, data = json.loads(message)
+            decoded = time.perf_counter()
+            result = self.apply_action(which_player, action, data)
+        metrics.METRICS.observe_message(
+            action if is_action(action) else "unknown",
+            started,
+            decoded,
+            time.perf_counter(),
+        )
+        return result
 
+    def apply_action(
+        self, which_player: Literal[1, 2], action: Any, data: dict[str, Any]
+    ) -> game.InvalidAction | None:
+        """Validate a JSON action's arguments, then `perform` it."""
         if not is_action(action):
             return game.InvalidAction("bruh what is this")
+        color = dst = None
+        if action not in ("request_snapshot", "request_hint", "place_thaler"):
+            if not (color := data.get("color")) or not (
+                color := game.Color.of_string(color)
+            ):
+                return game.InvalidAction("no valid color")
+        if action in ("make_player_move", "place_thaler"):
+            try:
+                dst = game.Coords(cast(int, data.get("dst")))
+            except ValueError:
+                return game.InvalidAction("no valid dst")
+        return self.perform(which_player, action, color, dst, rate=bool(data.get("rate")))
 
+    def perform(
+        self,
+        which_player: Literal[1, 2],
+        action: str,
+        color: game.Color | None,
+        dst: game.Coords | None,
+        rate: bool = False,
+    ) -> game.InvalidAction | None:
         ws = self.p1 if which_player == 1 else self.p2
-        if not ws:
+        if not ws or not (outbox := self.outboxes.get(ws)):
             return
+        self.touch()
         match action:
             case "make_player_choice":
-                if not (color := data.get("color")) or not (
-                    color := game.Color.of_string(color)
-                ):
-                    return game.InvalidAction("no valid color")
+                color = cast(game.Color, color)
                 result = self.game_state.make_player_choice(which_player, color)
-                await ws.send(json.dumps(["color_confirmed", {"player": which_player}]))
+                if result is None and self.store:
+                    self.store.action(self.room_id, which_player, action, color)
+                outbox.send(json.dumps(["color_confirmed", {"player": which_player}]))
 
             case "make_player_move":
-                if not (color := data.get("color")) or not (
-                    color := game.Color.of_string(color)
-                ):
-                    return game.InvalidAction("no valid color")
-                if not (dst := data.get("dst")):
-                    return game.InvalidAction("no dst")
-                result = self.game_state.make_player_move(
-                    which_player, color, game.Coords(cast(int, dst))
-                )
+                color, dst = cast(game.Color, color), cast(game.Coords, dst)
+                before = self.hint_key(which_player) if self.hints else None
+                src = self.game_state.pegs[color]
+                result = self.game_state.make_player_move(which_player, color, dst)
+                if result is None and self.store:
+                    self.store.action(self.room_id, which_player, action, color, dst)
+                if result is None and self.archive:
+                    self.actions.append(move_code(color, src, dst))
+                    self.archive_game()
+                if result is None and before:
+                    self.last_moves[which_player] = before, color.value, dst.int_repr
 
             case "make_player_guess":
-                if not (color := data.get("color")) or not (
-                    color := game.Color.of_string(color)
-                ):
-                    return game.InvalidAction("no valid color")
+                color = cast(game.Color, color)
                 result = self.game_state.make_player_guess(which_player, color)
+                if result is None and self.store:
+                    self.store.action(self.room_id, which_player, action, color)
+                if result is None and self.archive:
+                    self.actions.append(guess_code(color))
+                    self.archive_game()
+
+            case "place_thaler":
+                dst = cast(game.Coords, dst)
+                result = self.game_state.place_thaler(which_player, dst)
+                if result is None and self.store:
+                    self.store.placed(self.room_id, which_player, dst)
+                if result is None and self.archive:
+                    self.actions.append(place_code(dst))
 
             case "request_moves":
-                if not (color := data.get("color")) or not (
-                    color := game.Color.of_string(color)
-                ):
-                    return game.InvalidAction("no valid color")
-                moves = [c.int_repr for c in self.game_state.valid_moves(color)]
-                await ws.send(json.dumps(["valid_moves", {"moves": moves}]))
+                moves = self.game_state.valid_moves(cast(game.Color, color))
+                if outbox.binary:
+                    outbox.send(wire.encode_moves(moves))
+                else:
+                    cells = [c.int_repr for c in moves]
+                    outbox.send(json.dumps(["valid_moves", {"moves": cells}]))
+                result = None
+
+            case "request_hint":
+                result = self.request_hint(which_player, rate)
+
+            case _:
+                outbox.request_snapshot()
                 result = None
-        await self.update_clients()
+        if result is None and action in ("make_player_move", "make_player_guess"):
+            self.cancel_suggestions()
+        self.run_turn_clock()
         return result
 
+    def cancel_suggestions(self) -> None:
+        """Drop the hints still being searched for a position that has just
+        changed; ratings are of moves already made, so they carry on."""
+        for task in self.suggestions:
+            task.cancel()
+
+    def archive_game(self) -> None:
+        """Write the match to the archive if it has just ended."""
+        if self.game_state.current_phase != game.WhichPhase.GAME_ENDED or self.seed is None:
+            return
+        state = self.game_state
+        self.archive.write(  # type: ignore[union-attr]
+            GameRecord(self.seed, state.p1_color, state.p2_color, bytes(self.actions))
+        )
+        self.seed = None
+
+    def hint_key(self, which_player: Literal[1, 2]) -> PositionKey | None:
+        """What a hint for this player searches now, if they have a color."""
+        color = self.game_state.p1_color if which_player == 1 else self.game_state.p2_color
+        return None if color is None else position_key(self.game_state, color)
+
+    def request_hint(
+        self, which_player: Literal[1, 2], rate: bool
+    ) -> game.InvalidAction | None:
+        """Start a search for the best move in the current position, or, with
+        `rate`, for how good the player's last move was; the reply is sent
+        when it finishes."""
+        if not self.hints:
+            return game.InvalidAction("hints are disabled")
+        played = None
+        if rate:
+            if not (played := self.last_moves.get(which_player)):
+                return game.InvalidAction("no move to rate")
+            key = played[0]
+        else:
+            turn = game.WhichPhase.P1_TURN if which_player == 1 else game.WhichPhase.P2_TURN
+            if self.game_state.current_phase != turn or not (key := self.hint_key(which_player)):
+                return game.InvalidAction("hints are only given on your turn")
+        if which_player not in self.hint_buckets:
+            self.hint_buckets[which_player] = self.hints.bucket()
+        if not self.hint_buckets[which_player].take():
+            metrics.METRICS.hints_limited += 1
+            return game.InvalidAction("too many hints, slow down")
+        metrics.METRICS.hints += 1
+        tasks = self.ratings if rate else self.suggestions
+        task = asyncio.create_task(self.send_hint(which_player, key, played))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def send_hint(
+        self,
+        which_player: Literal[1, 2],
+        key: PositionKey,
+        played: tuple[PositionKey, int, int] | None,
+    ) -> None:
+        try:
+            analysis = await self.hints.analysis(key)  # type: ignore[union-attr]
+        except BrokenExecutor:
+            log.warning("hint pool broken", extra={"room": self.room_id})
+            self.send(which_player, json.dumps(["hint_failed", "hints are unavailable"]))
+            return
+        except Exception:
+            log.exception("hint failed", extra={"room": self.room_id})
+            self.send(which_player, json.dumps(["hint_failed", "hint failed, try again"]))
+            return
+        moves = {(color, dst): score for color, dst, score in analysis}
+        best = None
+        if analysis:
+            color, dst, score = analysis[0]
+            best = {"color": game.Color(color).to_string(), "dst": dst, "score": score}
+        if played is None:
+            # Still this position, or the task would have been cancelled; and
+            # the batch that asked has been broadcast, so `seq` is its number.
+            self.send(which_player, json.dumps(["hint", {"seq": self.seq, "best": best}]))
+            return
+        _, color, dst = played
+        rating = {
+            "color": game.Color(color).to_string(),
+            "dst": dst,
+            "score": moves.get((color, dst)),
+            "best": best,
+        }
+        self.send(which_player, json.dumps(["move_rating", rating]))
+
+
+@dataclass(eq=False)
+class Session:
+    """A seat's resume token. The token is issued in `hello_okay` and is the
+    only way back into the seat: `reconnect` with it takes the seat over from
+    a connection that has dropped or is about to. When the player disconnects
+    mid-game, `grace` keeps the seat for them until it fires."""
+
+    token: str
+    room: Room
+    which_player: Literal[1, 2]
+    grace: Timer
+
+
+Seat = tuple[Room, Literal[1, 2]]
+
+MAILBOX_LIMIT = 256
+# State frames each room keeps for `Room.catch_up`.
+HISTORY = 64
+# Longest room ID taken from a client; the ones handed out are 8 characters.
+ROOM_ID_MAX = 64
+
+
+class MatchSlot(Protocol):
+    """Where workers sharing a port advertise a public room that needs a player."""
+
+    def offer(self, room_id: str) -> None: ...
+
+    def take(self) -> str | None: ...
+
+    def withdraw(self, room_id: str) -> None: ...
+
+
+@dataclass(frozen=True)
+class Redirect:
+    """The room is owned by another worker process."""
+
+    room_id: str
+    worker: int
+
+
+def room_owner(room_id: str, workers: int) -> int:
+    return zlib.crc32(room_id.encode()) % workers
+
+
+@dataclass
+class RoomManager:
+    """Registry of every live room on this process.
+
+    `rooms` maps room IDs to rooms, `open_rooms` keeps public rooms that are
+    still waiting for a second player in arrival order (a dict used as an
+    ordered set), `seats` routes each connection to its room and seat, and
+    `watching` maps spectator connections to the room they watch and
+    `sessions` maps resume tokens to their seat's `Session`. All are plain
+    dicts, so every lookup is O(1).
+
+    When several worker processes share a port, each room belongs to the
+    worker its ID hashes to (see `room_owner`) and `match_slot` pairs players
+    who arrived at different workers.
+
+    Every deadline (turn clocks, idle rooms, connections that never say
+    hello) lives on the one `timers` wheel, driven by `timers.run()`.
+    """
+
+    rooms: dict[str, Room] = field(default_factory=dict)
+    open_rooms: dict[str, None] = field(default_factory=dict)
+    seats: dict[websockets.ServerConnection, Seat] = field(default_factory=dict)
+    watching: dict[websockets.ServerConnection, Room] = field(default_factory=dict)
+    sessions: dict[str, Session] = field(default_factory=dict)
+    worker: int = 0
+    workers: int = 1
+    worker_ports: list[int] = field(default_factory=list)
+    match_slot: MatchSlot | None = None
+    store: Store | None = None
+    hints: Hints | None = None
+    # Where finished matches are recorded; see `records`.
+    archive: RecordWriter | None = None
+    messages: int = 0
+    timers: TimerWheel = field(default_factory=TimerWheel)
+    turn_timeout: float = 60.0
+    idle_timeout: float = 600.0
+    hello_timeout: float = 10.0
+    # How long a seat is kept for a player who dropped mid-game.
+    grace_timeout: float = 30.0
+
+    def owns(self, room_id: str) -> bool:
+        return self.workers == 1 or room_owner(room_id, self.workers) == self.worker
+
+    def create_room(self, public: bool = True, placement: bool = False) -> Room:
+        room_id = secrets.token_urlsafe(6)
+        while room_id in self.rooms or not self.owns(room_id):
+            room_id = secrets.token_urlsafe(6)
+        seed = secrets.randbits(64)
+        room = Room(
+            game.GameState.create(seed, placement),
+            room_id=room_id,
+            store=self.store,
+            hints=self.hints,
+            seed=seed,
+            archive=self.archive,
+        )
+        self.rooms[room_id] = room
+        self.track(room)
+        if public:
+            self.open_rooms[room_id] = None
+        if self.store:
+            self.store.created(room_id, room.game_state)
+        return room
+
+    def restore(self, states: dict[str, game.GameState]) -> None:
+        """Re-create rooms recovered from the store; players rejoin by room ID."""
+        for room_id, game_state in states.items():
+            room = self.rooms[room_id] = Room(
+                game_state, room_id=room_id, store=self.store, hints=self.hints
+            )
+            # A restored match resumes with a fresh clock for the player to move.
+            self.track(room)
+            if game_state.current_phase == game.WhichPhase.WAITING_FOR_START:
+                self.open_rooms[room_id] = None
+
+    def track(self, room: Room) -> None:
+        """Give a room its turn clock and idle deadline on `timers`."""
+        room.turn_timeout, room.idle_timeout = self.turn_timeout, self.idle_timeout
+        room.turn_clock = self.timers.timer(room.turn_expired)
+        room.idle_clock = self.timers.timer(lambda: self.expire(room))
+        room.touch()
+        room.run_turn_clock()
+
+    def expire(self, room: Room) -> None:
+        """Close a room nobody has acted in for `idle_timeout` seconds."""
+        log.info("room expired", extra={"room": room.room_id})
+        conns = [conn for conn in (room.p1, room.p2) if conn] + list(room.spectators)
+        self.close_room(room)
+        for conn in conns:
+            self.timers.spawn(conn.close(1001, "room expired"))
+
+    def find_open_room(self) -> Room | Redirect:
+        while self.open_rooms:
+            room_id = next(iter(self.open_rooms))
+            room = self.rooms.get(room_id)
+            if room and room.free_seat():
+                return room
+            del self.open_rooms[room_id]
+        if self.match_slot and (room_id := self.match_slot.take()):
+            if not self.owns(room_id):
+                return Redirect(room_id, room_owner(room_id, self.workers))
+        room = self.create_room()
+        if self.match_slot:
+            self.match_slot.offer(room.room_id)
+        return room
+
+    def join(
+        self,
+        websocket: websockets.ServerConnection,
+        room_id: str | None = None,
+        create: bool = False,
+        format: wire.Format = "json",
+        placement: bool = False,
+    ) -> Seat | Redirect | str:
+        """Seat a player in `room_id`, in an open room, or with `create` in a
+        new private one, whose player 2 places the thaler if `placement`."""
+        if create:
+            room = self.create_room(public=False, placement=placement)
+        elif room_id is None:
+            if isinstance(room := self.find_open_room(), Redirect):
+                return room
+        elif not self.owns(room_id):
+            return Redirect(room_id, room_owner(room_id, self.workers))
+        elif not (room := self.rooms.get(room_id)):
+            return f"No room with ID {room_id}"
+        if not (which_player := room.free_seat()):
+            return "Room is full"
+        if error := room.connect(which_player, websocket):
+            return error
+        if not room.free_seat():
+            self.open_rooms.pop(room.room_id, None)
+            if self.match_slot:
+                self.match_slot.withdraw(room.room_id)
+        room.open_outbox(which_player, websocket, format)
+        self.seats[websocket] = (room, which_player)
+        room.touch()
+        self.issue_session(room, which_player)
+        return room, which_player
+
+    def issue_session(self, room: Room, which_player: Literal[1, 2]) -> Session:
+        if old := room.sessions.get(which_player):
+            self.end_session(old)
+        token = secrets.token_urlsafe(18)
+        grace = self.timers.timer(lambda: self.release(session))
+        session = Session(token, room, which_player, grace)
+        room.sessions[which_player] = self.sessions[session.token] = session
+        return session
+
+    def end_session(self, session: Session) -> None:
+        session.grace.cancel()
+        self.sessions.pop(session.token, None)
+        if session.room.sessions.get(session.which_player) is session:
+            del session.room.sessions[session.which_player]
+
+    def release(self, session: Session) -> None:
+        """The grace period ran out: give up the seat."""
+        room = session.room
+        log.info("seat released", extra={"room": room.room_id, "player": session.which_player})
+        metrics.METRICS.sessions_expired += 1
+        self.end_session(session)
+        if room.is_empty():
+            self.close_room(room)
+
+    def reconnect(
+        self,
+        websocket: websockets.ServerConnection,
+        token: str,
+        format: wire.Format = "json",
+    ) -> Session | None:
+        """Put the holder of `token` back in their seat, taking it over from
+        any connection still in it."""
+        if not (session := self.sessions.get(token)):
+            return None
+        room, which_player = session.room, session.which_player
+        session.grace.cancel()
+        if old := room.p1 if which_player == 1 else room.p2:
+            # The old connection dropped without the server noticing yet.
+            self.seats.pop(old, None)
+            room.close_outbox(old)
+            self.timers.spawn(old.close(1000, "resumed elsewhere"))
+        room.open_outbox(which_player, websocket, format)
+        if which_player == 1:
+            room.p1 = websocket
+        else:
+            room.p2 = websocket
+        self.seats[websocket] = (room, which_player)
+        room.touch()
+        metrics.METRICS.resumes += 1
+        return session
+
+    def watch(
+        self,
+        websocket: websockets.ServerConnection,
+        room_id: str,
+        limit: int = 64,
+        format: wire.Format = "json",
+    ) -> Spectator | Redirect | str:
+        if not self.owns(room_id):
+            return Redirect(room_id, room_owner(room_id, self.workers))
+        if not (room := self.rooms.get(room_id)):
+            return f"No room with ID {room_id}"
+        self.watching[websocket] = room
+        return room.watch(websocket, limit, format)
+
+    def route(self, websocket: websockets.ServerConnection) -> Seat | None:
+        return self.seats.get(websocket)
+
+    def leave(self, websocket: websockets.ServerConnection) -> None:
+        if room := self.watching.pop(websocket, None):
+            room.unwatch(websocket)
+            return
+        if not (seat := self.seats.pop(websocket, None)):
+            return
+        room, which_player = seat
+        room.close_outbox(websocket)
+        if which_player == 1 and room.p1 == websocket:
+            room.p1 = None
+        elif which_player == 2 and room.p2 == websocket:
+            room.p2 = None
+        ended = room.game_state.current_phase == game.WhichPhase.GAME_ENDED
+        if session := room.sessions.get(which_player):
+            if ended or self.grace_timeout <= 0:
+                self.end_session(session)
+            else:
+                session.grace.reset(self.grace_timeout)
+        if room.is_empty() or ended:
+            self.close_room(room)
+
+    def close_room(self, room: Room) -> None:
+        if self.rooms.pop(room.room_id, None) and self.store:
+            self.store.closed(room.room_id)
+        self.open_rooms.pop(room.room_id, None)
+        if self.match_slot:
+            self.match_slot.withdraw(room.room_id)
+        for conn in (room.p1, room.p2):
+            if conn:
+                self.seats.pop(conn, None)
+        room.p1 = room.p2 = None
+        for session in list(room.sessions.values()):
+            self.end_session(session)
+        room.stop()
+        # Players are still sent what is queued, such as how the game ended.
+        for outbox in room.outboxes.values():
+            outbox.finish()
+        room.outboxes.clear()
+        for clock in (room.turn_clock, room.idle_clock):
+            if clock:
+                clock.cancel()
+        # Spectators keep their connection and are still sent the final
+        # frame; they just stop being routed to this room.
+        for conn, spectator in room.spectators.items():
+            self.watching.pop(conn, None)
+            spectator.finish()
+        room.spectators.clear()
+
+
+async def send_redirect(
+    ws: websockets.ServerConnection, manager: RoomManager, redirect: Redirect
+) -> None:
+    port = manager.worker_ports[redirect.worker]
+    log.info("redirect", extra={"room": redirect.room_id, "worker": redirect.worker})
+    await ws.send(json.dumps(["redirect", {"room": redirect.room_id, "port": port}]))
+
 
 # WebSocket server handler
-def handler(room: Room) -> Callable[[websockets.ServerConnection], Awaitable[None]]:
+def handler(
+    manager: RoomManager,
+) -> Callable[[websockets.ServerConnection], Awaitable[None]]:
     async def handle_connection(ws: websockets.ServerConnection) -> None:
-        print("Player connected", ws.remote_address)
+        log.info("player connected", extra={"remote": ws.remote_address})
+        room = None
         which_player = None  # Initialize which_player to None
+        hello_deadline = manager.timers.schedule(
+            manager.hello_timeout,
+            lambda: manager.timers.spawn(ws.close(1008, "no hello")),
+        )
 
         try:
             while True:
                 hello = await ws.recv()
                 header: str
-                header, content = json.loads(hello)
+                try:
+                    header, content = json.loads(hello)
+                    if not isinstance(content, dict):
+                        raise TypeError("hello content is not an object")
+                except (ValueError, TypeError):
+                    # Undecodable JSON, or not a [header, {...}] pair.
+                    await ws.send(json.dumps(["try_again", "malformed hello"]))
+                    continue
+                # Room IDs are looked up and hashed to a worker as strings.
+                if any(
+                    (room_id := content.get(key)) is not None
+                    and not (isinstance(room_id, str) and len(room_id) <= ROOM_ID_MAX)
+                    for key in ("room", "watch")
+                ):
+                    await ws.send(json.dumps(["try_again", "malformed room ID"]))
+                    continue
+
+                if header == "hello" and (watch := content.get("watch")):
+                    format = wire.negotiate(content)
+                    watched = manager.watch(ws, watch, format=format)
+                    if isinstance(watched, str):
+                        await ws.send(json.dumps(["try_again", watched]))
+                        return
+                    if isinstance(watched, Redirect):
+                        await send_redirect(ws, manager, watched)
+                        return
+                    hello_deadline.cancel()
+                    log.info("spectator joined", extra={"room": watch})
+                    await ws.send(
+                        json.dumps(["watching", {"room": watch, "format": format}])
+                    )
+                    watched.start()
+                    async for message in ws:
+                        try:
+                            if isinstance(message, bytes):
+                                action = wire.decode_action(message)[0]
+                            else:
+                                action = json.loads(message)[0]
+                        except (ValueError, TypeError, KeyError, IndexError):
+                            # Undecodable JSON or wire frame, or the wrong shape.
+                            await ws.send(
+                                json.dumps(["invalid_action", "malformed message"])
+                            )
+                            continue
+                        if action == "request_snapshot":
+                            watched.request_snapshot()
+                        else:
+                            await ws.send(
+                                json.dumps(["invalid_action", "spectators cannot act"])
+                            )
+                    return
 
                 if header == "hello":
-                    # Automatically assign the player to the first available slot
-                    which_player = 1 if not room.p1 else 2
-                    error = room.connect(which_player, ws)
-                    if error:
-                        await ws.send(json.dumps(["try_again", error]))
-                        print(error)
+                    # Join the requested room, or get matched into an open one
+                    format = wire.negotiate(content)
+                    joined = manager.join(
+                        ws,
+                        content.get("room"),
+                        create=bool(content.get("create")),
+                        format=format,
+                        placement=bool(content.get("placement")),
+                    )
+                    if isinstance(joined, str):
+                        await ws.send(json.dumps(["try_again", joined]))
+                        log.info("join refused", extra={"reason": joined})
+                        return
+                    if isinstance(joined, Redirect):
+                        await send_redirect(ws, manager, joined)
                         return
+                    room, which_player = joined
 
-                    print(f"Assigned Player {which_player}")
-                    await ws.send(json.dumps(["hello_okay", {"you_are": which_player}]))
+                    log.info(
+                        "player assigned",
+                        extra={"room": room.room_id, "player": which_player},
+                    )
+                    # From here on everything for this player goes through
+                    # its outbox, so it arrives in order behind hello_okay.
+                    room.send(
+                        which_player,
+                        json.dumps(
+                            [
+                                "hello_okay",
+                                {
+                                    "you_are": which_player,
+                                    "room": room.room_id,
+                                    "format": format,
+                                    "token": room.sessions[which_player].token,
+                                },
+                            ]
+                        ),
+                    )
 
+                    # A seat taken mid-game needs the state it missed
+                    if room.last_broadcast is not None:
+                        room.outboxes[ws].request_snapshot()
                     # Transition to SELECTING phase if both players are connected
-                    if room.p1 and room.p2:
-                        print("Both players connected. Transitioning to 'SELECTING' phase.")
-                        room.game_state.current_phase = game.WhichPhase.SELECTING
-                        await room.update_clients()
+                    elif room.p1 and room.p2:
+                        log.info("room full, selecting", extra={"room": room.room_id})
+                        room.update_clients()
                     break
 
                 elif header == "reconnect":
-                    player_id = content.get("playerId")
-                    if player_id == "player1" and room.p1:
-                        room.p1 = ws
-                        which_player = 1  # Reassign Player 1
-                        print(f"Player 1 reconnected with ID {player_id}")
-                        await ws.send(json.dumps(["reconnect_success", {"you_are": 1}]))
-                        break
-                    elif player_id == "player2" and room.p2:
-                        room.p2 = ws
-                        which_player = 2  # Reassign Player 2
-                        print(f"Player 2 reconnected with ID {player_id}")
-                        await ws.send(json.dumps(["reconnect_success", {"you_are": 2}]))
+                    if (room_id := content.get("room")) and not manager.owns(room_id):
+                        redirect = Redirect(room_id, room_owner(room_id, manager.workers))
+                        await send_redirect(ws, manager, redirect)
+                        return
+                    format = wire.negotiate(content)
+                    token = content.get("token")
+                    if isinstance(token, str) and (
+                        session := manager.reconnect(ws, token, format)
+                    ):
+                        room, which_player = session.room, session.which_player
+                        log.info(
+                            "player reconnected",
+                            extra={"room": room.room_id, "player": which_player},
+                        )
+                        room.send(
+                            which_player,
+                            json.dumps(
+                                [
+                                    "reconnect_success",
+                                    {
+                                        "you_are": which_player,
+                                        "room": room.room_id,
+                                        "format": format,
+                                    },
+                                ]
+                            ),
+                        )
+                        seq = content.get("seq")
+                        # bool is an int too, but never a sequence number.
+                        valid = isinstance(seq, int) and not isinstance(seq, bool)
+                        room.catch_up(which_player, seq if valid else None)
                         break
                     else:
                         await ws.send(json.dumps(["try_again", "Invalid reconnect attempt"]))
@@ -192,137 +1314,113 @@ def handler(room: Room) -> Callable[[websockets.ServerConnection], Awaitable[Non
                     await ws.send(json.dumps(["try_again", f"expected hello but got: {header}"]))
                     continue
 
+            hello_deadline.cancel()
             # Listen for messages from the clients
             while True:
-                if which_player is None:
-                    print("Player not assigned, skipping message processing.")
+                if room is None or which_player is None:
+                    log.warning("player not assigned, skipping message processing")
                     break
 
                 message = await ws.recv()
-                response = await room.process_message(which_player, message)
-                if response:
-                    print(response.message)
-                    await ws.send(json.dumps(["invalid_action", response.message]))
+                manager.messages += 1
+                room.post(which_player, message)
+                if len(room.mailbox) >= MAILBOX_LIMIT:
+                    # Let the actor catch up before reading more from a
+                    # client that is sending faster than its room can apply.
+                    await asyncio.sleep(0)
 
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
-            print("Player disconnected", ws.remote_address)
-            if room.p1 == ws:
-                room.p1 = None
-            elif room.p2 == ws:
-                room.p2 = None
+            hello_deadline.cancel()
+            log.info("player disconnected", extra={"remote": ws.remote_address})
+            manager.leave(ws)
 
     return handle_connection
 
 
+def register_gauges(manager: RoomManager) -> None:
+    metrics.METRICS.gauges["rooms"] = lambda: len(manager.rooms)
+    metrics.METRICS.gauges["connections"] = lambda: len(manager.seats)
+    metrics.METRICS.gauges["spectators"] = lambda: len(manager.watching)
+    metrics.METRICS.gauges["sessions"] = lambda: len(manager.sessions)
+    metrics.METRICS.gauges["timers"] = lambda: manager.timers.pending
+    metrics.METRICS.gauges["move_cache_hits"] = lambda: game.MOVE_CACHE.hits
+    metrics.METRICS.gauges["move_cache_misses"] = lambda: game.MOVE_CACHE.misses
+    if manager.hints:
+        metrics.METRICS.gauges["hints_queued"] = lambda: len(manager.hints.queued)  # type: ignore[union-attr]
+
+
 # Main function to start the WebSocket server
-async def main():
-    room = Room(game.GameState.create())  # Use the create method to initialize the GameState
-    server = await websockets.serve(handler(room), "0.0.0.0", 8765)  # Bind to all network interfaces
-    print("WebSocket server running on port 8765")
+async def main(
+    data_dir: str | None = None,
+    metrics_port: int = 9100,
+    turn_timeout: float = 60.0,
+    hint_workers: int = 1,
+    dashboard: bool = False,
+):
+    metrics.setup_logging()
+    manager = RoomManager(turn_timeout=turn_timeout)
+    if hint_workers:
+        manager.hints = Hints.with_pool(hint_workers)
+    if data_dir:
+        manager.store = store = FileStore.open(data_dir)
+        manager.archive = RecordWriter.open(store.directory / "games.bin")
+        manager.restore(store.recover())
+        log.info("recovered rooms", extra={"rooms": len(manager.rooms), "data_dir": data_dir})
+        asyncio.create_task(persist(manager, store))
+    register_gauges(manager)
+    asyncio.create_task(manager.timers.run())
+    asyncio.create_task(metrics.monitor_loop_lag())
+    if dashboard:
+        rooms = lambda: {room_id: room.game_state for room_id, room in manager.rooms.items()}
+        asyncio.create_task(console.show(rooms, sys.stdout))
+    await metrics.serve_metrics(port=metrics_port)
+    server = await websockets.serve(handler(manager), "0.0.0.0", 8765)  # Bind to all network interfaces
+    log.info("listening", extra={"port": 8765, "metrics_port": metrics_port})
     await server.wait_closed()
 
-asyncio.run(main())
 
-# Track game rooms and player connections
-rooms = {}  # {room_id: GameState}
-player_rooms = {}  # {player_id: room_id}
-player_connections = {}  # {player_id: WebSocketServerProtocol}
+async def persist(
+    manager: RoomManager,
+    store: FileStore,
+    flush_interval: float = 0.05,
+    snapshot_every: int = 100_000,
+) -> None:
+    """fsync the WAL every `flush_interval`s, snapshotting once it has grown
+    enough, and write out archived games."""
+    while True:
+        await asyncio.sleep(flush_interval)
+        if manager.archive:
+            manager.archive.flush()
+        if store.records_since_snapshot >= snapshot_every:
+            store.snapshot({room_id: room.game_state for room_id, room in manager.rooms.items()})
+        else:
+            store.flush()
 
-class RoomManager:
-    def __init__(self):
-        self.rooms = rooms
-        self.player_rooms = player_rooms
-        self.player_connections = player_connections
-
-    async def handle_message(self, websocket: WebSocketServerProtocol, message: str):
-        data = json.loads(message)
-        action = data[0]
-        payload = data[1]
-
-        if action == "reconnect":
-            await self.handle_reconnect(websocket, payload)
-        elif action == "make_player_choice":
-            await self.handle_player_choice(websocket, payload)
-        elif action == "make_player_move":
-            await self.handle_player_move(websocket, payload)
-        elif action == "request_moves":
-            await self.handle_request_moves(websocket, payload)
-
-    async def handle_reconnect(self, websocket: WebSocketServerProtocol, payload: dict):
-        player_id = payload["playerId"]
-
-        # Check if the player was in a game
-        if player_id in self.player_rooms:
-            room_id = self.player_rooms[player_id]
-            game_state = self.rooms.get(room_id)
-
-            if game_state:
-                # Reconnect the player and send the game state
-                self.player_connections[player_id] = websocket
-                await websocket.send(json.dumps([
-                    "reconnect_success",
-                    {
-                        "pegs": {color.to_string(): coord.int_repr for color, coord in game_state.pegs.items()},
-                        "thaler": game_state.thaler_pos.int_repr,
-                        "subtitle": f"Welcome back, {player_id}!",
-                        "selectedColor": game_state.p1_color.to_string() if game_state.p1_color else None,
-                    }
-                ]))
-                return
-
-        # If no game state is found, send an error
-        await websocket.send(json.dumps(["error", "No active game found for this player."]))
-
-    async def handle_player_choice(self, websocket: WebSocketServerProtocol, payload: dict):
-        player_id = payload["playerId"]
-        color = Color.of_string(payload["color"])
-        room_id = self.player_rooms.get(player_id)
-
-        if room_id and room_id in self.rooms:
-            game_state = self.rooms[room_id]
-            if game_state.current_phase == "Selecting":
-                if player_id not in game_state.pegs:
-                    game_state.make_player_choice(1 if player_id == "player1" else 2, color)
-                    await websocket.send(json.dumps(["color_confirmed", {"player": player_id, "color": color.to_string()}]))
-
-    async def handle_player_move(self, websocket: WebSocketServerProtocol, payload: dict):
-        player_id = payload["playerId"]
-        color = Color.of_string(payload["color"])
-        dst = payload["dst"]
-        room_id = self.player_rooms.get(player_id)
-
-        if room_id and room_id in self.rooms:
-            game_state = self.rooms[room_id]
-            result = game_state.make_player_move(1 if player_id == "player1" else 2, color, dst)
-            if isinstance(result, str):  # InvalidAction
-                await websocket.send(json.dumps(["error", result]))
-            else:
-                # Broadcast the updated game state to all players in the room
-                for pid, ws in self.player_connections.items():
-                    if self.player_rooms.get(pid) == room_id:
-                        await ws.send(json.dumps([
-                            "game_state",
-                            {
-                                "pegs": {color.to_string(): coord.int_repr for color, coord in game_state.pegs.items()},
-                                "thaler": game_state.thaler_pos.int_repr,
-                                "current_phase": game_state.current_phase.value,
-                            }
-                        ]))
-
-    async def handle_request_moves(self, websocket: WebSocketServerProtocol, payload: dict):
-        player_id = payload["playerId"]
-        color = Color.of_string(payload["color"])
-        room_id = self.player_rooms.get(player_id)
-
-        if room_id and room_id in self.rooms:
-            game_state = self.rooms[room_id]
-            valid_moves = game_state.valid_moves(color)
-            await websocket.send(json.dumps(["valid_moves", {"moves": [move.int_repr for move in valid_moves]}]))
-
-# Example of starting the WebSocket server
-async def main(websocket: WebSocketServerProtocol, path: str):
-    manager = RoomManager()
-    async for message in websocket:
-        await manager.handle_message(websocket, message)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--data-dir", help="directory for the write-ahead log and archived games"
+    )
+    parser.add_argument("--metrics-port", type=int, default=9100)
+    parser.add_argument(
+        "--turn-timeout", type=float, default=60.0, help="seconds before a turn is forfeited"
+    )
+    parser.add_argument(
+        "--hint-workers", type=int, default=1, help="processes searching hints; 0 disables them"
+    )
+    parser.add_argument(
+        "--console", action="store_true", help="draw every room's board on stdout"
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            args.data_dir,
+            args.metrics_port,
+            args.turn_timeout,
+            args.hint_workers,
+            args.console,
+        )
+    )
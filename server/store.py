@@ -0,0 +1,203 @@
+"""Write-ahead log and snapshots for live rooms.
+
+`FileStore` appends one compact JSON array per line to `wal-<n>.jsonl`:
+
+    ["c", room_id, {game state}]      room created
+    ["p", room_id, phase]             phase set outside GameState (players joined)
+    ["s", room_id, player, color]     make_player_choice
+    ["m", room_id, player, color, dst]  make_player_move
+    ["g", room_id, player, color]     make_player_guess
+    ["t", room_id, player, dst]       place_thaler
+    ["f", room_id, player]            player forfeited on time
+    ["x", room_id]                    room closed
+
+Records are buffered and written with a single fsync per batch. A snapshot
+writes every live room to `snapshot-<n>.jsonl` and starts WAL segment `n`, so
+recovery loads the newest complete snapshot and replays only the segments
+from it onwards.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Literal, Protocol
+
+import game
+
+
+class Store(Protocol):
+    """What `RoomManager` and `Room` need from a persistence backend."""
+
+    def created(self, room_id: str, game_state: game.GameState) -> None: ...
+
+    def phase(self, room_id: str, phase: game.WhichPhase) -> None: ...
+
+    def action(
+        self,
+        room_id: str,
+        which_player: Literal[1, 2],
+        action: str,
+        color: game.Color,
+        dst: game.Coords | None = None,
+    ) -> None: ...
+
+    def placed(self, room_id: str, which_player: Literal[1, 2], dst: game.Coords) -> None: ...
+
+    def forfeit(self, room_id: str, which_player: Literal[1, 2]) -> None: ...
+
+    def closed(self, room_id: str) -> None: ...
+
+
+ACTION_CODES = {
+    "make_player_choice": "s",
+    "make_player_move": "m",
+    "make_player_guess": "g",
+}
+
+
+def replay(rooms: dict[str, game.GameState], record: list) -> None:
+    """Apply one WAL record to `rooms`."""
+    match record:
+        case ["c", room_id, state]:
+            rooms[room_id] = game.GameState.from_dict_fast(state)
+        case ["x", room_id]:
+            rooms.pop(room_id, None)
+        case ["p", room_id, phase] if room_id in rooms:
+            rooms[room_id].current_phase = game.WhichPhase(phase)
+        case ["s", room_id, player, color] if room_id in rooms:
+            rooms[room_id].make_player_choice(player, game.Color(color))
+        case ["m", room_id, player, color, dst] if room_id in rooms:
+            rooms[room_id].make_player_move(player, game.Color(color), game.Coords(dst))
+        case ["g", room_id, player, color] if room_id in rooms:
+            rooms[room_id].make_player_guess(player, game.Color(color))
+        case ["t", room_id, player, dst] if room_id in rooms:
+            rooms[room_id].place_thaler(player, game.Coords(dst))
+        case ["f", room_id, player] if room_id in rooms:
+            rooms[room_id].forfeit(player)
+
+
+def read_records(path: Path):
+    """Yield the records of one WAL segment, stopping at a torn final line."""
+    with path.open("rb") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                return
+
+
+def numbered(directory: Path, prefix: str) -> list[tuple[int, Path]]:
+    files = []
+    for path in directory.glob(f"{prefix}-*.jsonl"):
+        try:
+            files.append((int(path.stem.split("-")[1]), path))
+        except ValueError:
+            continue
+    return sorted(files)
+
+
+@dataclass
+class FileStore:
+    directory: Path
+    fsync_batch: int = 512
+    pending: list[str] = field(default_factory=list)
+    records_since_snapshot: int = 0
+    segment: int = 0
+    wal: IO[bytes] | None = None
+
+    @classmethod
+    def open(cls, directory: str | Path, **kwargs) -> "FileStore":
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        store = cls(directory, **kwargs)
+        segments = numbered(directory, "wal") + numbered(directory, "snapshot")
+        store.segment = max((n for n, _ in segments), default=0) + 1
+        store.wal = (directory / f"wal-{store.segment}.jsonl").open("ab")
+        return store
+
+    def append(self, line: str) -> None:
+        self.pending.append(line)
+        self.records_since_snapshot += 1
+        if len(self.pending) >= self.fsync_batch:
+            self.flush()
+
+    def created(self, room_id: str, game_state: game.GameState) -> None:
+        self.append(f'["c", {json.dumps(room_id)}, {game_state.to_json_fast()}]')
+
+    def phase(self, room_id: str, phase: game.WhichPhase) -> None:
+        self.append(f'["p", {json.dumps(room_id)}, {game.PHASE_JSON[phase]}]')
+
+    def action(
+        self,
+        room_id: str,
+        which_player: Literal[1, 2],
+        action: str,
+        color: game.Color,
+        dst: game.Coords | None = None,
+    ) -> None:
+        code = ACTION_CODES[action]
+        tail = "" if dst is None else f", {dst.int_repr}"
+        self.append(
+            f'["{code}", {json.dumps(room_id)}, {which_player}, {color.value}{tail}]'
+        )
+
+    def placed(self, room_id: str, which_player: Literal[1, 2], dst: game.Coords) -> None:
+        self.append(f'["t", {json.dumps(room_id)}, {which_player}, {dst.int_repr}]')
+
+    def forfeit(self, room_id: str, which_player: Literal[1, 2]) -> None:
+        self.append(f'["f", {json.dumps(room_id)}, {which_player}]')
+
+    def closed(self, room_id: str) -> None:
+        self.append(f'["x", {json.dumps(room_id)}]')
+
+    def flush(self) -> None:
+        """Write buffered records and fsync them in one go."""
+        if not self.pending or not self.wal:
+            return
+        self.wal.write(("\n".join(self.pending) + "\n").encode())
+        self.wal.flush()
+        os.fsync(self.wal.fileno())
+        self.pending.clear()
+
+    def snapshot(self, rooms: dict[str, game.GameState]) -> None:
+        """Persist every live room and drop the WAL segments it supersedes."""
+        self.flush()
+        if self.wal:
+            self.wal.close()
+        self.segment += 1
+        path = self.directory / f"snapshot-{self.segment}.jsonl"
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            for room_id, state in rooms.items():
+                f.write(f'["c", {json.dumps(room_id)}, {state.to_json_fast()}]\n'.encode())
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.rename(path)
+        self.wal = (self.directory / f"wal-{self.segment}.jsonl").open("ab")
+        self.records_since_snapshot = 0
+        for prefix in ("wal", "snapshot"):
+            for n, old in numbered(self.directory, prefix):
+                if n < self.segment:
+                    old.unlink()
+
+    def recover(self) -> dict[str, game.GameState]:
+        """Rebuild every room from the newest snapshot and the WAL after it."""
+        rooms: dict[str, game.GameState] = {}
+        snapshots = numbered(self.directory, "snapshot")
+        start = 0
+        if snapshots:
+            start, path = snapshots[-1]
+            for record in read_records(path):
+                replay(rooms, record)
+        for n, path in numbered(self.directory, "wal"):
+            if n >= start:
+                for record in read_records(path):
+                    replay(rooms, record)
+        return rooms
+
+    def close(self) -> None:
+        self.flush()
+        if self.wal:
+            self.wal.close()
+            self.wal = None
@@ -0,0 +1,410 @@
+"""Retrograde endgame tablebase for the thaler game.
+
+Covers every position where all seven pegs are within `distance` king moves
+of the thaler. Pegs never move away from the thaler, so play from such a
+position stays inside the set and it can be solved exactly. Positions are
+solved as perfect-information games, with both players' colours known, as
+the bot searches them. Guesses are not modelled. The side to move:
+
+- wins by moving its own peg onto the thaler;
+- loses by moving any other peg there, or when every move leads to a
+  position the opponent wins;
+- draws when it has no move at all, or when neither side can force a result.
+
+Positions are grouped by the shape of the thaler's zone, the cells within
+`distance` of it clipped by the board edges. Each zone's cells are numbered
+0..n-1 in board order, and a position is seen from the side to move as
+(its peg, the opponent's peg, the set of the five other pegs). Its index is
+a perfect hash over those:
+
+    (me * (n - 1) + opp') * C(n - 2, 5) + colex rank of the others'
+
+where a primed cell is renumbered to skip the cells listed before it. Values
+are packed four to a byte in one buffer per zone shape.
+
+Generation first classifies every position by its immediate moves, then
+walks backwards from each decided position to the positions that move into
+it. A predecessor of a lost position is won. A predecessor of a won position
+loses one escape, and is lost once it has none left. Whatever is never
+decided is a draw.
+
+The file is a header, one entry per zone shape and the packed values, and is
+read through `mmap` without copying:
+
+    python tablebase.py [--distance 2] [--out tablebase.bin]
+"""
+
+import argparse
+import mmap
+import struct
+import time
+from dataclasses import dataclass, field
+from math import comb
+from pathlib import Path
+
+import numpy as np
+
+import game
+
+MAGIC = b"THTB"
+VERSION = 1
+PEGS = len(game.Color)
+OTHERS = PEGS - 2
+# magic, version, distance, pegs, number of zone shapes
+HEADER = struct.Struct("<4sBBBB")
+# left, right, up, down extents, cells, byte offset, positions
+ENTRY = struct.Struct("<BBBBB3xQQ")
+
+DRAW, WIN, LOSS = 0, 1, 2
+OUTCOMES = {DRAW: "draw", WIN: "win", LOSS: "loss"}
+
+CHUNK = 1 << 20
+# The interior zone at distance 3 would hold billions of positions.
+MAX_DISTANCE = 2
+MAX_CELLS = (2 * MAX_DISTANCE + 1) ** 2 - 1
+# COMB[c][i] = C(c, i), for colex ranks.
+COMB = [[comb(c, i) for i in range(OTHERS + 1)] for c in range(MAX_CELLS + 1)]
+COMB_TABLE = np.array(COMB, dtype=np.int64)
+
+
+def extents(thaler: int, distance: int) -> tuple[int, int, int, int]:
+    """How far the thaler's zone reaches left, right, up and down."""
+    x, y = thaler % game.BOARD_SIZE, thaler // game.BOARD_SIZE
+    edge = game.BOARD_SIZE - 1
+    return min(x, distance), min(edge - x, distance), min(y, distance), min(edge - y, distance)
+
+
+def zone_cells(thaler: int, distance: int) -> list[int]:
+    """The cells within `distance` of the thaler, in board order."""
+    return [
+        cell
+        for cell in range(game.BOARD_CELLS)
+        if cell != thaler and game.DISTANCE[thaler][cell] <= distance
+    ]
+
+
+def _positions(n: int) -> int:
+    return n * (n - 1) * comb(n - 2, OTHERS) if n >= PEGS else 0
+
+
+@dataclass
+class Zone:
+    """Move tables for one zone shape, in local cell numbers.
+
+    Local cell `n` stands for the thaler and -1 for anything outside the zone.
+    """
+
+    extents: tuple[int, int, int, int]
+    n: int
+    step: np.ndarray  # (n, 8) cell one away in each direction
+    step_ok: np.ndarray  # (n, 8) and no farther from the thaler
+    jump: np.ndarray  # (n, 8) cell two away
+    jump_ok: np.ndarray  # (n, 8) on the board and no farther from the thaler
+    # (n, R) every cell a peg can move to cell x from, and the cell it has to
+    # jump over to get there, or -1 for a step.
+    back_src: np.ndarray
+    back_mid: np.ndarray
+
+    @classmethod
+    def build(cls, thaler: int, distance: int) -> "Zone":
+        cells = zone_cells(thaler, distance)
+        n = len(cells)
+        local = {cell: i for i, cell in enumerate(cells)}
+        local[thaler] = n
+        dist = game.DISTANCE[thaler]
+        shape = (n, len(game.DIRECTIONS))
+        step, jump = np.full(shape, -1, np.int64), np.full(shape, -1, np.int64)
+        step_ok, jump_ok = np.zeros(shape, bool), np.zeros(shape, bool)
+        back: list[list[tuple[int, int]]] = [[] for _ in range(n)]
+        for src, cell in enumerate(cells):
+            for d, (dx, dy) in enumerate(game.DIRECTIONS):
+                one = game.offset_cell(cell, dx, dy)
+                two = game.offset_cell(cell, dx * 2, dy * 2)
+                if one in local:
+                    step[src, d] = local[one]
+                    step_ok[src, d] = dist[one] <= dist[cell]
+                    if step_ok[src, d] and one != thaler:
+                        back[local[one]].append((src, -1))
+                if two in local:
+                    jump[src, d] = local[two]
+                    jump_ok[src, d] = dist[two] <= dist[cell]
+                    # The thaler is never occupied, so nothing jumps it.
+                    if jump_ok[src, d] and two != thaler and one in local and one != thaler:
+                        back[local[two]].append((src, local[one]))
+        width = max(map(len, back))
+        back_src = np.full((n, width), -1, np.int64)
+        back_mid = np.full((n, width), -1, np.int64)
+        for x, moves in enumerate(back):
+            for r, (src, mid) in enumerate(moves):
+                back_src[x, r], back_mid[x, r] = src, mid
+        return cls(extents(thaler, distance), n, step, step_ok, jump, jump_ok, back_src, back_mid)
+
+    @property
+    def size(self) -> int:
+        return _positions(self.n)
+
+    def encode(self, pegs: np.ndarray) -> np.ndarray:
+        """(m,) indices of (m, 7) positions: mover, opponent, then others in any order."""
+        me, opp = pegs[:, :1], pegs[:, 1:2]
+        others = pegs[:, 2:] - (pegs[:, 2:] > me) - (pegs[:, 2:] > opp)
+        others.sort(axis=1)
+        rank = sum(COMB_TABLE[others[:, i], i + 1] for i in range(OTHERS))
+        pair = me[:, 0] * (self.n - 1) + opp[:, 0] - (opp[:, 0] > me[:, 0])
+        return pair * comb(self.n - 2, OTHERS) + rank
+
+    def decode(self, index: np.ndarray) -> np.ndarray:
+        """(m, 7) positions of (m,) indices, the inverse of `encode`."""
+        pair, rank = np.divmod(index, comb(self.n - 2, OTHERS))
+        me, opp = np.divmod(pair, self.n - 1)
+        opp += opp >= me
+        pegs = np.empty((len(index), PEGS), np.int64)
+        pegs[:, 0], pegs[:, 1] = me, opp
+        lo, hi = np.minimum(me, opp), np.maximum(me, opp)
+        for i in range(OTHERS, 0, -1):
+            cell = np.searchsorted(COMB_TABLE[: self.n - 1, i], rank, side="right") - 1
+            rank -= COMB_TABLE[cell, i]
+            cell += cell >= lo
+            cell += cell >= hi
+            pegs[:, 1 + i] = cell
+        return pegs
+
+    def classify(self, pegs: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Whether the mover can land its own peg, whether it can land another,
+        and how many moves it has that don't touch the thaler."""
+        occupied = np.bitwise_or.reduce(np.left_shift(1, pegs), axis=1)
+        wins = np.zeros(len(pegs), bool)
+        blunders = np.zeros(len(pegs), bool)
+        moves = np.zeros(len(pegs), np.uint8)
+        for slot in range(PEGS):
+            src = pegs[:, slot]
+            for d in range(len(game.DIRECTIONS)):
+                one, two = self.step[src, d], self.jump[src, d]
+                full = (one >= 0) & (one < self.n) & (occupied >> one.clip(0) & 1 == 1)
+                stepped = ~full & self.step_ok[src, d]
+                jumped = (
+                    full
+                    & self.jump_ok[src, d]
+                    & ((two == self.n) | (occupied >> two.clip(0) & 1 == 0))
+                )
+                landed = (stepped & (one == self.n)) | (jumped & (two == self.n))
+                moves += (stepped & (one < self.n)) | (jumped & (two < self.n))
+                if slot == 0:
+                    wins |= landed
+                else:
+                    blunders |= landed
+        return wins, blunders, moves
+
+    def predecessors(self, index: np.ndarray) -> np.ndarray:
+        """Every position with a move into one of `index`, once per move."""
+        pegs = self.decode(index)
+        occupied = np.bitwise_or.reduce(np.left_shift(1, pegs), axis=1)
+        found = []
+        for slot in range(PEGS):
+            dst = pegs[:, slot]
+            for r in range(self.back_src.shape[1]):
+                src, mid = self.back_src[dst, r], self.back_mid[dst, r]
+                ok = (
+                    (src >= 0)
+                    & (occupied >> src.clip(0) & 1 == 0)
+                    & ((mid < 0) | (occupied >> mid.clip(0) & 1 == 1))
+                )
+                if not ok.any():
+                    continue
+                before = pegs[ok]
+                before[:, slot] = src[ok]
+                # The opponent of whoever moved into `index` was to move.
+                before[:, [0, 1]] = before[:, [1, 0]]
+                found.append(self.encode(before))
+        return np.concatenate(found) if found else np.empty(0, np.int64)
+
+    def solve(self) -> np.ndarray:
+        """(size,) DRAW, WIN or LOSS for the side to move in each position."""
+        value = np.zeros(self.size, np.uint8)
+        escapes = np.zeros(self.size, np.uint8)
+        for start in range(0, self.size, CHUNK):
+            index = np.arange(start, min(self.size, start + CHUNK))
+            wins, blunders, moves = self.classify(self.decode(index))
+            escapes[index] = moves
+            value[index[wins]] = WIN
+            value[index[~wins & blunders & (moves == 0)]] = LOSS
+        frontier = np.flatnonzero(value)
+        while frontier.size:
+            decided = []
+            lost = frontier[value[frontier] == LOSS]
+            for start in range(0, lost.size, CHUNK):
+                before = self.predecessors(lost[start : start + CHUNK])
+                before = before[value[before] == DRAW]
+                value[before] = WIN
+                decided.append(np.unique(before))
+            won = frontier[value[frontier] == WIN]
+            for start in range(0, won.size, CHUNK):
+                before = self.predecessors(won[start : start + CHUNK])
+                before, count = np.unique(before[value[before] == DRAW], return_counts=True)
+                escapes[before] -= count.astype(np.uint8)
+                before = before[escapes[before] == 0]
+                value[before] = LOSS
+                decided.append(before)
+            frontier = np.concatenate(decided)
+        return value
+
+
+def pack(value: np.ndarray) -> bytes:
+    """Four 2-bit values per byte, the first in the low bits."""
+    padded = np.zeros(-(-value.size // 4) * 4, np.uint8)
+    padded[: value.size] = value
+    quads = padded.reshape(-1, 4)
+    return (quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6).tobytes()
+
+
+def unpack(packed: np.ndarray, count: int) -> np.ndarray:
+    return ((packed[:, None] >> np.array([0, 2, 4, 6], np.uint8)) & 3).reshape(-1)[:count]
+
+
+def shapes(distance: int) -> dict[tuple[int, int, int, int], int]:
+    """One representative thaler cell per zone shape."""
+    found: dict[tuple[int, int, int, int], int] = {}
+    for thaler in range(game.BOARD_CELLS):
+        found.setdefault(extents(thaler, distance), thaler)
+    return found
+
+
+def generate(distance: int, path: Path, log=print) -> None:
+    """Solve every zone shape and write the tablebase to `path`."""
+    solved = []
+    for shape, thaler in shapes(distance).items():
+        zone = Zone.build(thaler, distance)
+        start = time.perf_counter()
+        value = zone.solve()
+        counts = np.bincount(value, minlength=3)
+        log(
+            f"zone {shape}: {zone.n} cells, {zone.size} positions in "
+            f"{time.perf_counter() - start:.1f} s "
+            f"({counts[WIN]} won, {counts[LOSS]} lost, {counts[DRAW]} drawn)"
+        )
+        solved.append((zone, pack(value)))
+    offset = HEADER.size + ENTRY.size * len(solved)
+    with path.open("wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, distance, PEGS, len(solved)))
+        for zone, packed in solved:
+            f.write(ENTRY.pack(*zone.extents, zone.n, offset, zone.size))
+            offset += len(packed)
+        for _, packed in solved:
+            f.write(packed)
+
+
+@dataclass
+class Tablebase:
+    """A tablebase file mapped into memory; probes read the mapping directly."""
+
+    distance: int
+    buffer: mmap.mmap
+    # Per thaler cell: byte offset of its zone's values, C(n - 2, 5), n, and
+    # each board cell's local number (-1 outside the zone or on the thaler).
+    zones: list[tuple[int, int, int, list[int]]] = field(default_factory=list)
+    entries: dict[tuple[int, int, int, int], tuple[int, int, int]] = field(default_factory=dict)
+
+    @classmethod
+    def open(cls, path: Path | str) -> "Tablebase":
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, distance, pegs, n_zones = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION or pegs != PEGS:
+            raise ValueError(f"{path} is not a version {VERSION} tablebase")
+        table = cls(distance, buffer)
+        for i in range(n_zones):
+            *shape, n, offset, size = ENTRY.unpack_from(buffer, HEADER.size + i * ENTRY.size)
+            table.entries[tuple(shape)] = (n, offset, size)  # type: ignore[index]
+        for thaler in range(game.BOARD_CELLS):
+            n, offset, _ = table.entries[extents(thaler, distance)]
+            local = [-1] * game.BOARD_CELLS
+            for i, cell in enumerate(zone_cells(thaler, distance)):
+                local[cell] = i
+            table.zones.append((offset, comb(n - 2, OTHERS), n, local))
+        return table
+
+    def close(self) -> None:
+        self.buffer.close()
+
+    def values(self, shape: tuple[int, int, int, int]) -> np.ndarray:
+        """Every value of one zone shape, unpacked from a zero-copy view."""
+        n, offset, size = self.entries[shape]
+        packed = np.frombuffer(self.buffer, np.uint8, -(-size // 4), offset)
+        return unpack(packed, size)
+
+    def probe_pegs(self, thaler: int, pegs: list[int], mover: int, other: int) -> int | None:
+        """DRAW, WIN or LOSS for the side to move, whose colour is `mover`,
+        with pegs given as cells indexed by `Color.value`. None when the
+        position isn't in the table."""
+        offset, others_size, n, local = self.zones[thaler]
+        cells = [local[peg] for peg in pegs]
+        if mover == other or min(cells) < 0:
+            return None
+        me, opp = cells[mover], cells[other]
+        others = sorted(
+            cell - (cell > me) - (cell > opp)
+            for color, cell in enumerate(cells)
+            if color != mover and color != other
+        )
+        rank = sum(COMB[cell][i] for i, cell in enumerate(others, 1))
+        index = (me * (n - 1) + opp - (opp > me)) * others_size + rank
+        return self.buffer[offset + (index >> 2)] >> ((index & 3) << 1) & 3
+
+    def probe(self, state: game.GameState) -> int | None:
+        """Value of a running game for the player whose turn it is."""
+        colors = self.colors(state)
+        if colors is None:
+            return None
+        pegs = [peg.int_repr for peg in state.pegs.values()]
+        return self.probe_pegs(state.thaler_pos.int_repr, pegs, *colors)
+
+    def rate_moves(self, state: game.GameState) -> dict[tuple[game.Color, game.Coords], int]:
+        """The value of each legal move for the player making it, for the
+        moves whose results are in the table."""
+        colors = self.colors(state)
+        if colors is None:
+            return {}
+        mover, other = colors
+        thaler = state.thaler_pos.int_repr
+        pegs = [peg.int_repr for peg in state.pegs.values()]
+        rated = {}
+        for color in game.Color:
+            src = pegs[color.value]
+            for dst in state.generate_moves(color):
+                if dst.int_repr == thaler:
+                    rated[color, dst] = WIN if color.value == mover else LOSS
+                    continue
+                pegs[color.value] = dst.int_repr
+                reply = self.probe_pegs(thaler, pegs, other, mover)
+                pegs[color.value] = src
+                if reply is not None:
+                    rated[color, dst] = {DRAW: DRAW, WIN: LOSS, LOSS: WIN}[reply]
+        return rated
+
+    @staticmethod
+    def colors(state: game.GameState) -> tuple[int, int] | None:
+        """(mover's colour, opponent's colour), if it is someone's turn."""
+        if state.p1_color is None or state.p2_color is None:
+            return None
+        match state.current_phase:
+            case game.WhichPhase.P1_TURN:
+                return state.p1_color.value, state.p2_color.value
+            case game.WhichPhase.P2_TURN:
+                return state.p2_color.value, state.p1_color.value
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--distance", type=int, default=2, choices=range(1, MAX_DISTANCE + 1))
+    parser.add_argument("--out", type=Path, default=Path("tablebase.bin"))
+    args = parser.parse_args()
+    start = time.perf_counter()
+    generate(args.distance, args.out)
+    print(
+        f"wrote {args.out}: {args.out.stat().st_size} bytes "
+        f"in {time.perf_counter() - start:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
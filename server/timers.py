@@ -0,0 +1,144 @@
+"""Hierarchical timer wheel: every deadline on one event loop, driven by one task.
+
+`TimerWheel` keeps timers in `levels` wheels of 64 slots. Level 0 slots are
+one `tick` wide, and each level up covers 64 times the span of the one below.
+A timer sits in the slot its due tick maps to at the lowest level that can
+hold it; as the wheel turns, the next slot of each higher level is cascaded
+down, so scheduling, cancelling and firing are all O(1) per timer however
+many are pending. A single `run()` task advances the wheel once per tick.
+
+Timers that are pushed back on every message (idle deadlines, turn clocks
+after a valid move) are only moved lazily: `reset` to a later tick just
+records the new due tick, and when the old slot comes round the timer is
+re-filed instead of fired.
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+log = logging.getLogger("timers")
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+
+
+@dataclass(eq=False)
+class Timer:
+    wheel: "TimerWheel"
+    callback: Callable[[], object]
+    due: int
+    # The slot this timer is filed in, or None once fired or cancelled.
+    slot: set["Timer"] | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.slot is not None
+
+    def cancel(self) -> None:
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.wheel.pending -= 1
+
+    def reset(self, delay: float) -> None:
+        """Fire `delay` seconds from now instead, re-arming a fired timer."""
+        due = self.wheel.due_tick(delay)
+        if self.slot is not None and due >= self.due:
+            self.due = due
+            return
+        self.cancel()
+        self.due = due
+        self.wheel.file(self)
+
+
+@dataclass
+class TimerWheel:
+    tick: float = 0.1
+    levels: int = 4
+    # Ticks since the wheel started; `run` keeps it in step with the loop clock.
+    now: int = 0
+    pending: int = 0
+    wheels: list[list[set[Timer]]] = field(default_factory=list)
+    # Tasks started by timer callbacks, kept until they finish.
+    tasks: set[asyncio.Task] = field(default_factory=set)
+
+    def __post_init__(self) -> None:
+        self.wheels = [[set() for _ in range(SLOTS)] for _ in range(self.levels)]
+
+    def due_tick(self, delay: float) -> int:
+        return self.now + max(1, round(delay / self.tick))
+
+    def timer(self, callback: Callable[[], object]) -> Timer:
+        """A timer for `callback`, not yet armed; `reset` arms it."""
+        return Timer(self, callback, self.now)
+
+    def schedule(self, delay: float, callback: Callable[[], object]) -> Timer:
+        """Call `callback()` once, `delay` seconds from now (rounded to ticks)."""
+        timer = self.timer(callback)
+        timer.reset(delay)
+        return timer
+
+    def file(self, timer: Timer) -> None:
+        delta = timer.due - self.now
+        level = 0
+        while level < self.levels - 1 and delta >= SLOTS << (SLOT_BITS * level):
+            level += 1
+        slot = self.wheels[level][(timer.due >> (SLOT_BITS * level)) & SLOT_MASK]
+        slot.add(timer)
+        timer.slot = slot
+        self.pending += 1
+
+    def advance(self, ticks: int = 1) -> int:
+        """Turn the wheel `ticks` times, firing what comes due; returns how many fired."""
+        fired = 0
+        for _ in range(ticks):
+            self.now += 1
+            # Cascade each higher level whose lower digits just wrapped round.
+            for level in range(1, self.levels):
+                if self.now & ((1 << (SLOT_BITS * level)) - 1):
+                    break
+                self.refile(self.wheels[level][(self.now >> (SLOT_BITS * level)) & SLOT_MASK])
+            slot = self.wheels[0][self.now & SLOT_MASK]
+            if not slot:
+                continue
+            due, slot_timers = [], list(slot)
+            slot.clear()
+            for timer in slot_timers:
+                timer.slot = None
+                self.pending -= 1
+                if timer.due > self.now:
+                    self.file(timer)
+                else:
+                    due.append(timer)
+            for timer in due:
+                try:
+                    timer.callback()
+                except Exception:
+                    log.exception("timer callback failed")
+            fired += len(due)
+        return fired
+
+    def refile(self, slot: set[Timer]) -> None:
+        timers = list(slot)
+        slot.clear()
+        self.pending -= len(timers)
+        for timer in timers:
+            self.file(timer)
+
+    def spawn(self, coroutine: Awaitable[object]) -> None:
+        """Run async work a callback needs (sending, closing) without blocking the wheel."""
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self) -> None:
+        """Advance once per tick, catching up if the loop was late."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        while True:
+            await asyncio.sleep(self.tick)
+            if (behind := int((loop.time() - start) / self.tick) - self.now) > 0:
+                self.advance(behind)
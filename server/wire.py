@@ -0,0 +1,139 @@
+"""Compact binary wire format, picked per connection in `hello`.
+
+A client that sends `"format": "binary"` in its `hello` (or `reconnect`) gets
+game traffic as binary websocket frames, and may send its actions the same
+way. Rare control messages (`hello_okay`, `try_again`, `redirect`,
+`color_confirmed`, `invalid_action`, `hint`, ...) stay JSON text frames, so a
+client tells the two apart by frame type; `request_hint` is likewise only
+sent as JSON. Everyone else keeps the JSON protocol.
+
+Every frame starts with an opcode byte; cells and colours are single bytes
+(`Coords.int_repr`, `Color.value`) and integers are little-endian.
+
+Server to client:
+
+    STATE  <B I B 7B B>  opcode, seq, thaler, pegs in Color order, phase
+    MOVES  <B Q>         opcode, bitboard with bit n set when cell n is a move
+
+A STATE frame carries the whole board in 14 bytes, so the same frame serves
+as the snapshot and as every update, for players and spectators alike.
+
+Client to server:
+
+    CHOICE    <B B>    opcode, color
+    MOVE      <B B B>  opcode, color, dst
+    GUESS     <B B>    opcode, color
+    REQUEST   <B B>    opcode, color      (request_moves)
+    SNAPSHOT  <B>      opcode             (request_snapshot)
+    PLACE     <B B>    opcode, dst        (place_thaler)
+"""
+
+import struct
+from typing import Literal
+
+import game
+
+Format = Literal["json", "binary"]
+
+STATE, MOVES = 0x01, 0x02
+CHOICE, MOVE, GUESS, REQUEST, SNAPSHOT, PLACE = 0x10, 0x11, 0x12, 0x13, 0x14, 0x15
+
+STATE_FRAME = struct.Struct("<BI8BB")
+MOVES_FRAME = struct.Struct("<BQ")
+
+COLORS = list(game.Color)
+PHASES = list(game.WhichPhase)
+PHASE_CODES = {phase: code for code, phase in enumerate(PHASES)}
+
+ACTIONS: dict[int, str] = {
+    CHOICE: "make_player_choice",
+    MOVE: "make_player_move",
+    GUESS: "make_player_guess",
+    REQUEST: "request_moves",
+    SNAPSHOT: "request_snapshot",
+    PLACE: "place_thaler",
+}
+
+
+ACTION_CODES = {name: code for code, name in ACTIONS.items()}
+
+
+class WireError(ValueError):
+    pass
+
+
+def negotiate(content: dict) -> Format:
+    """The format a `hello` or `reconnect` asks for; JSON unless it says binary."""
+    return "binary" if content.get("format") == "binary" else "json"
+
+
+def encode_state(game_state: game.GameState, seq: int) -> bytes:
+    # position_key() is the thaler then the pegs, the order STATE lays out.
+    return STATE_FRAME.pack(
+        STATE,
+        seq,
+        *[cell.int_repr for cell in game_state.position_key()],
+        PHASE_CODES[game_state.current_phase],
+    )
+
+
+def decode_state(
+    frame: bytes,
+) -> tuple[int, dict[game.Color, game.Coords], game.Coords, game.WhichPhase]:
+    """Inverse of `encode_state`: seq, pegs, thaler and phase."""
+    _, seq, thaler, *cells, phase = STATE_FRAME.unpack(frame)
+    pegs = {color: game.COORDS[cell] for color, cell in zip(COLORS, cells)}
+    return seq, pegs, game.COORDS[thaler], PHASES[phase]
+
+
+def encode_moves(moves: list[game.Coords]) -> bytes:
+    board = 0
+    for move in moves:
+        board |= 1 << move.int_repr
+    return MOVES_FRAME.pack(MOVES, board)
+
+
+def decode_moves(frame: bytes) -> list[int]:
+    """The cells of a MOVES frame, in ascending order."""
+    _, board = MOVES_FRAME.unpack(frame)
+    cells = []
+    while board:
+        lowest = board & -board
+        cells.append(lowest.bit_length() - 1)
+        board ^= lowest
+    return cells
+
+
+def encode_action(
+    action: str, color: game.Color | None = None, dst: int | None = None
+) -> bytes:
+    """A client action frame; what `game.js` sends in binary mode."""
+    match action:
+        case "request_snapshot":
+            return bytes((SNAPSHOT,))
+        case "make_player_move":
+            return bytes((MOVE, color.value, dst))  # type: ignore[union-attr]
+        case "place_thaler":
+            return bytes((PLACE, dst))  # type: ignore[arg-type]
+        case _:
+            return bytes((ACTION_CODES[action], color.value))  # type: ignore[union-attr]
+
+
+def decode_action(frame: bytes) -> tuple[str, game.Color | None, game.Coords | None]:
+    """The action, colour and destination of a client frame.
+
+    Raises `WireError` for an unknown opcode, a short frame or a byte that is
+    not a colour or cell.
+    """
+    if not frame or (action := ACTIONS.get(frame[0])) is None:
+        raise WireError("unknown opcode")
+    if action == "request_snapshot":
+        return action, None, None
+    try:
+        if action == "place_thaler":
+            return action, None, game.COORDS[frame[1]]
+        color = game.Color(frame[1])
+        dst = game.COORDS[frame[2]] if action == "make_player_move" else None
+    except (IndexError, ValueError):
+        raise WireError(f"malformed {action} frame") from None
+    return action, color, dst
@@ -0,0 +1,223 @@
+"""Run the room server as several worker processes sharing one port.
+
+Every worker listens on the shared port with SO_REUSEPORT, so the kernel
+spreads new connections across them, and on a private port of its own
+(`port + 1 + index`). Each room is owned by the worker its ID hashes to, so
+room state never crosses processes: a hello or reconnect naming a room owned
+by another worker is answered with a `redirect` to that worker's private
+port. Matchmaking between workers goes through a one-room `SharedMatchSlot`.
+
+    python workers.py --workers 4
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from pathlib import Path
+
+import websockets
+
+import metrics
+import room
+from hints import Hints
+from records import RecordWriter
+from store import FileStore
+
+log = logging.getLogger("workers")
+
+
+class SharedMatchSlot:
+    """A public room waiting for a player, visible to every worker."""
+
+    def __init__(self) -> None:
+        self.lock = multiprocessing.Lock()
+        self.value = multiprocessing.RawArray("c", 32)
+
+    def offer(self, room_id: str) -> None:
+        with self.lock:
+            self.value.value = room_id.encode()
+
+    def take(self) -> str | None:
+        with self.lock:
+            room_id = self.value.value.decode()
+            self.value.value = b""
+        return room_id or None
+
+    def withdraw(self, room_id: str) -> None:
+        with self.lock:
+            if self.value.value == room_id.encode():
+                self.value.value = b""
+
+
+def log_stats(manager: room.RoomManager, messages_before: int, elapsed: float) -> None:
+    rate = (manager.messages - messages_before) / elapsed if elapsed else 0.0
+    log.info(
+        "worker stats",
+        extra={
+            "worker": manager.worker,
+            "rooms": len(manager.rooms),
+            "connections": len(manager.seats),
+            "messages": manager.messages,
+            "msgs_per_s": round(rate),
+        },
+    )
+
+
+async def report_stats(manager: room.RoomManager, interval: float) -> None:
+    while True:
+        messages, start = manager.messages, time.monotonic()
+        await asyncio.sleep(interval)
+        log_stats(manager, messages, time.monotonic() - start)
+
+
+async def serve_worker(
+    index: int,
+    workers: int,
+    host: str,
+    port: int,
+    match_slot: SharedMatchSlot | None,
+    stats_interval: float,
+    drain_timeout: float,
+    data_dir: str | None = None,
+    metrics_port: int | None = None,
+    turn_timeout: float = 60.0,
+    hint_workers: int = 1,
+) -> None:
+    metrics.setup_logging()
+    manager = room.RoomManager(
+        worker=index,
+        workers=workers,
+        worker_ports=[port + 1 + i for i in range(workers)],
+        match_slot=match_slot,
+        turn_timeout=turn_timeout,
+        # Each worker searches its own rooms' hints in its own pool.
+        hints=Hints.with_pool(hint_workers) if hint_workers else None,
+    )
+    store = None
+    if data_dir:
+        # Room ownership follows the ID hash, so keep the worker count stable
+        # across restarts for each worker to recover its own rooms.
+        manager.store = store = FileStore.open(Path(data_dir) / f"worker-{index}")
+        manager.archive = RecordWriter.open(store.directory / "games.bin")
+        manager.restore(store.recover())
+        asyncio.create_task(room.persist(manager, store))
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    room.register_gauges(manager)
+    timers = asyncio.create_task(manager.timers.run())
+    asyncio.create_task(metrics.monitor_loop_lag())
+    if metrics_port is not None:
+        await metrics.serve_metrics(port=metrics_port + index)
+
+    handle = room.handler(manager)
+    servers = [
+        await websockets.serve(handle, host, port, reuse_port=True),
+        await websockets.serve(handle, host, manager.worker_ports[index]),
+    ]
+    log.info(
+        "listening",
+        extra={"worker": index, "port": port, "private_port": manager.worker_ports[index]},
+    )
+    stats = asyncio.create_task(report_stats(manager, stats_interval))
+    started = time.monotonic()
+
+    await stop.wait()
+
+    # Drain: stop accepting, let running matches finish, then close the rest.
+    log.info("draining", extra={"worker": index, "rooms": len(manager.rooms)})
+    for server in servers:
+        server.close(close_connections=False)
+    if match_slot:
+        for room_id in manager.open_rooms:
+            match_slot.withdraw(room_id)
+    # Nobody can reconnect any more, so stop keeping seats for them.
+    manager.grace_timeout = 0
+    for session in [s for s in manager.sessions.values() if s.grace.active]:
+        manager.release(session)
+    deadline = loop.time() + drain_timeout
+    while manager.rooms and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+    stats.cancel()
+    timers.cancel()
+    if store:
+        store.close()
+    if manager.archive:
+        manager.archive.close()
+    if manager.hints:
+        manager.hints.shutdown()
+    log_stats(manager, 0, time.monotonic() - started)
+
+
+def run_worker(*args) -> None:
+    asyncio.run(serve_worker(*args))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--data-dir", help="directory for per-worker write-ahead logs")
+    parser.add_argument(
+        "--metrics-port", type=int, default=9100, help="worker i serves /metrics on this + i"
+    )
+    parser.add_argument(
+        "--turn-timeout", type=float, default=60.0, help="seconds before a turn is forfeited"
+    )
+    parser.add_argument(
+        "--hint-workers",
+        type=int,
+        default=1,
+        help="hint search processes per worker; 0 disables hints",
+    )
+    args = parser.parse_args()
+
+    match_slot = SharedMatchSlot() if args.workers > 1 else None
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(
+                index,
+                args.workers,
+                args.host,
+                args.port,
+                match_slot,
+                args.stats_interval,
+                args.drain_timeout,
+                args.data_dir,
+                args.metrics_port,
+                args.turn_timeout,
+                args.hint_workers,
+            ),
+            name=f"worker-{index}",
+        )
+        for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum: int, frame: object) -> None:
+        for process in processes:
+            if process.pid is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()